@@ -39,7 +39,7 @@ saccadic_motion_threshold = 0.15
 # Experiment Structure
 #########################################
 multi_session_project = False
-trials_per_block = 2048
+trials_per_block = 288 # one full pass through the legal trial space (see trial_space.py)
 blocks_per_experiment = 1
 table_defaults = {}
 conditions = ['square', 'diamond']
@@ -65,3 +65,64 @@ datafile_ext = ".txt"
 #########################################
 # PROJECT-SPECIFIC VARS
 #########################################
+# Number of far locations per ring of the array (each ring has as many near locations,
+# between adjacent far ones), & the eccentricity of each ring in degrees (see ring_layout.py).
+# Every location needs a response key, so the numpad keymap supports the default 4 only.
+array_locations = 4
+array_eccentricities = [2.8]
+
+# When True, work not needed for the first screens is moved off the startup path: array
+# frames are composited on a background thread during demographics & instructions, and the
+# feedback glyphs are rendered at the start of the first block
+deferred_startup = True
+
+# Max number of composited array frames held in memory. When None, every frame the
+# trial space needs is composited at setup; otherwise frames are built on first use
+# and the least recently used is dropped once the limit is reached.
+array_cache_size = None
+
+# Settings for a simulated participant (see simulated_participant.py), e.g.
+# {'rt_mu': 450, 'error_rate': 0.05, 'error_bias': {'distractor': 0.7, 'empty_cell': 0.3}}.
+# When set, responses are generated & pressed as SDL key events for the response collectors
+# (in real time, after each response's RT), & all other waits are skipped, so sessions can
+# be run headless (SDL_VIDEODRIVER=dummy) for testing.
+simulated_participant = None
+
+# Number of queued trial rows the background writer commits at once (see trial_writer.py).
+# Rows are also committed at block starts, at the half-way break & when the session ends.
+trial_write_batch = 32
+
+# Set to True once the database has been migrated to the typed, integer-coded trials
+# layout (python trials_schema.py ExpAssets/NP_IOR.db), so trial rows are encoded to match.
+# Note that 'klibs export' then writes the integer codes, not labels, to its .txt files; the
+# trials_labelled view & columnar_export.py give the labelled trials.
+typed_trials = False
+
+# Max number of rendered text surfaces (instructions, block messages) kept for reuse
+text_cache_size = 64
+
+# Record wall & CPU time and allocations for each lifecycle phase (setup, trial_prep, the
+# parts of trial()...) into a ring buffer of the last profile_buffer phases, & save a
+# percentile report at the end of the session (see phase_profiler.py)
+profile_phases = False
+profile_buffer = 8192
+
+# Append each trial's parameters, display onsets, key presses & responses to a compact binary
+# log (ExpAssets/Data/session_logs), from which the session can be audited & its trials
+# re-scored without the display (python session_log.py replay|audit|show <log> ...)
+session_log = True
+
+# When True, the 500ms array & 300ms ISI intervals are held for whole display refreshes &
+# the prime & probe are flipped on the refresh they're due, rather than after a sleep (see
+# frame_scheduler.py). Requested & achieved SOAs are logged to frame_timing either way.
+vsync_intervals = True
+
+# Path to a schedule bank of pre-generated, validated schedules by participant id (built with
+# python schedule_bank.py build ...). When set, each session runs the schedules banked for
+# its participant in place of ones built from random_seed.
+schedule_bank = None
+
+# Number of this testing station (1, 2, ...), distinct for every station testing at once.
+# Each station's database numbers its participants from 1 (see station_merge.py), so the
+# schedule bank is keyed on this & the participant id together.
+station_id = 1
@@ -75,3 +75,18 @@ CREATE TABLE trials (
     t_probe_loc text not null,
     d_probe_loc text not null
 );
+
+CREATE TABLE frame_timing (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    display text not null,
+    onset_latency real not null,
+    flip_duration real not null,
+    flips integer not null,
+    dropped_frames integer not null,
+    max_flip_interval real not null,
+    requested_soa real,
+    achieved_soa real
+);
@@ -0,0 +1,62 @@
+/*
+
+Typed, compact layout for the 'trials' table (see trials_schema.py).
+
+RTs & distances are stored as numbers, with NULL in place of 'NA'; booleans as 0/1; and
+far/near, trial type, choice & location labels as integer codes backed by the lookup
+tables below. The 'trials_labelled' view joins the codes back to their labels.
+
+This file is applied by migrating an existing database (which also works on a freshly
+rebuilt, empty one):
+
+  python trials_schema.py ExpAssets/NP_IOR.db
+
+after which 'typed_trials' should be set to True in NP_IOR_params.py.
+
+*/
+
+CREATE TABLE far_near_codes (
+    id integer primary key not null,
+    label text not null unique
+);
+
+CREATE TABLE trial_type_codes (
+    id integer primary key not null,
+    label text not null unique
+);
+
+CREATE TABLE choice_codes (
+    id integer primary key not null,
+    label text not null unique
+);
+
+CREATE TABLE location_codes (
+    id integer primary key not null,
+    label text not null unique
+);
+
+CREATE TABLE trials_typed (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    practicing integer not null,
+    far_near integer not null references far_near_codes(id),
+    trial_type integer not null references trial_type_codes(id),
+    prime_rt real,
+    probe_rt real,
+    prime_correct integer not null,
+    probe_correct integer not null,
+    t_prime_to_t_probe real not null,
+    t_prime_to_d_probe real not null,
+    d_prime_to_t_probe real not null,
+    d_prime_to_d_probe real not null,
+    prime_choice integer not null references choice_codes(id),
+    probe_choice integer not null references choice_codes(id),
+    prime_response integer references location_codes(id),
+    probe_response integer references location_codes(id),
+    t_prime_loc integer not null references location_codes(id),
+    d_prime_loc integer not null references location_codes(id),
+    t_probe_loc integer not null references location_codes(id),
+    d_probe_loc integer not null references location_codes(id)
+);
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Per-participant & group cell means, accuracy and RT trimming for each trial_type x
+# far_near x condition cell, computed straight from the trials table (each trial's condition
+# told from its prime locations, see trials_schema.condition_case()). Rows are streamed in
+# chunks into NumPy arrays & reduced with bincount, so memory use depends on the number
+# of cells rather than the number of trials. Works on both the text & typed trials layouts.
+#
+#   python analysis.py ExpAssets/NP_IOR.db [--measure prime|probe] [--trim-sd 2.5]
+
+import argparse
+import sqlite3
+import warnings
+
+import numpy as np
+
+from trials_schema import FAR_NEAR, TRIAL_TYPES, is_typed, condition_case
+from ring_layout import CONDITIONS
+
+# Named contrasts between trial types: (effect, trial type, baseline trial type)
+EFFECTS = (
+    ('IOR (T.to.T)',        'T.to.T-far',    'control-far'),
+    ('NP (D.to.T)',         'D.to.T-far',    'control-far'),
+    ('T.to.D',              'T.to.D-far',    'control-far'),
+    ('D.to.D',              'D.to.D-far',    'control-far'),
+    ('repeat',              'repeat',        'control-far'),
+    ('switch',              'switch',        'control-far'),
+    ('T at CoG',            'T.at.CoG-near', 'control-near'),
+    ('D at CoG',            'D.at.CoG-near', 'control-near'),
+)
+
+# Column order of every chunk: participant, condition, trial type, far/near, practice, rt, correct
+_PID, _COND, _TYPE, _FN, _PRAC, _RT, _CORRECT = range(7)
+
+
+class CellStats(object):
+    # Cell arrays are indexed [participant, condition, trial_type, far_near]; participants
+    # holds the participant id of each row along the first axis.
+
+    def __init__(self, conditions, participants, n_trials, n_correct, rt_n, rt_mean, rt_sd, trimmed):
+        self.conditions = conditions
+        self.participants = participants
+        self.n_trials = n_trials
+        self.accuracy = _divide(n_correct, n_trials)
+        self.rt_n = rt_n
+        self.rt_mean = rt_mean
+        self.rt_sd = rt_sd
+        self.trimmed = trimmed
+
+    def group_means(self):
+        # Mean (& standard error) across participants of each participant's cell mean
+        # (cells no participant contributed to come out as NaN)
+        with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+            warnings.simplefilter('ignore', RuntimeWarning)
+            n = np.sum(~np.isnan(self.rt_mean), axis=0)
+            mean = np.nanmean(self.rt_mean, axis=0)
+            se = np.nanstd(self.rt_mean, axis=0, ddof=1) / np.sqrt(n)
+            accuracy = np.nanmean(self.accuracy, axis=0)
+        return mean, se, accuracy, n
+
+    def effects(self):
+        # Per-participant trial type - baseline differences (collapsed over conditions
+        # weighted by trial counts), with their group mean & standard error
+        rt_sum = np.nansum(self.rt_mean * self.rt_n, axis=(1, 3))
+        rt_n = self.rt_n.sum(axis=(1, 3))
+        cell_means = _divide(rt_sum, rt_n)
+
+        results = []
+        for name, trial_type, baseline in EFFECTS:
+            diff = cell_means[:, TRIAL_TYPES.index(trial_type)] - cell_means[:, TRIAL_TYPES.index(baseline)]
+            valid = diff[~np.isnan(diff)]
+            se = valid.std(ddof=1) / np.sqrt(len(valid)) if len(valid) > 1 else np.nan
+            results.append((name, diff, valid.mean() if len(valid) else np.nan, se))
+
+        return results
+
+    def report(self):
+        mean, se, accuracy, n = self.group_means()
+        lines = ["{0:<10} {1:<15} {2:<5} {3:>5} {4:>9} {5:>7} {6:>6}".format(
+            'condition', 'trial_type', 'f/n', 'N', 'rt', 'se', 'acc'
+        )]
+        for c, t, f in zip(*np.nonzero(n)):
+            lines.append("{0:<10} {1:<15} {2:<5} {3:>5} {4:>9.1f} {5:>7.1f} {6:>6.3f}".format(
+                self.conditions[c], TRIAL_TYPES[t], FAR_NEAR[f], n[c, t, f], mean[c, t, f],
+                se[c, t, f], accuracy[c, t, f]
+            ))
+
+        lines.append("")
+        for name, _, effect, effect_se in self.effects():
+            lines.append("{0:<15} {1:>8.1f} ms (se {2:.1f})".format(name, effect, effect_se))
+
+        return "\n".join(lines)
+
+
+def analyse(db_path, measure='probe', trim_sd=2.5, rt_bounds=(100, 2000), include_practice=False,
+            conditions=CONDITIONS, chunk_size=50000):
+    # RT cells use correct responses within rt_bounds (ms), then drop those more than trim_sd
+    # standard deviations from their participant's cell mean (None to skip this step).
+    conn = sqlite3.connect(db_path)
+    query, conditions = _query(conn, measure, conditions)
+    max_pid = conn.execute("SELECT coalesce(max(participant_id), 0) FROM trials").fetchone()[0]
+    conn.close()
+
+    shape = (max_pid + 1, len(conditions), len(TRIAL_TYPES), len(FAR_NEAR))
+    size = int(np.prod(shape))
+
+    def count(index, weights=None):
+        return np.bincount(index, weights=weights, minlength=size).astype(float)
+
+    # First pass: trial & accuracy counts, and RT moments of the in-bounds correct responses
+    n_trials, n_correct, rt_n, rt_sum, rt_sumsq = [np.zeros(size) for _ in range(5)]
+
+    for cells, rt, usable in _chunks(db_path, query, shape, rt_bounds, include_practice, chunk_size):
+        n_trials += count(cells[0])
+        n_correct += count(cells[0], cells[1])
+        rt_n += count(cells[2])
+        rt_sum += count(cells[2], rt[usable])
+        rt_sumsq += count(cells[2], rt[usable] ** 2)
+
+    rt_mean = _divide(rt_sum, rt_n)
+    with np.errstate(invalid='ignore'):
+        rt_sd = np.sqrt(np.maximum(_divide(rt_sumsq, rt_n) - rt_mean ** 2, 0) * _divide(rt_n, rt_n - 1))
+
+    # Second pass: drop RTs beyond trim_sd of their cell's mean
+    trimmed = np.zeros(size)
+    if trim_sd is not None:
+        kept_n, kept_sum = np.zeros(size), np.zeros(size)
+        for cells, rt, usable in _chunks(db_path, query, shape, rt_bounds, include_practice, chunk_size):
+            index, values = cells[2], rt[usable]
+            with np.errstate(invalid='ignore'):
+                keep = ~(np.abs(values - rt_mean[index]) > trim_sd * rt_sd[index])
+            kept_n += count(index[keep])
+            kept_sum += count(index[keep], values[keep])
+
+        trimmed = rt_n - kept_n
+        rt_n, rt_mean = kept_n, _divide(kept_sum, kept_n)
+
+    present = n_trials.reshape(shape).sum(axis=(1, 2, 3)) > 0
+
+    def cells(a):
+        return a.reshape(shape)[present]
+
+    return CellStats(
+        conditions, np.nonzero(present)[0], cells(n_trials), cells(n_correct), cells(rt_n),
+        cells(rt_mean), cells(rt_sd), cells(trimmed)
+    )
+
+
+def _query(conn, measure, conditions):
+    # Builds a query returning every trial as numbers, whichever layout the database uses
+    typed = is_typed(conn)
+    condition = condition_case('t.t_prime_loc', typed, conditions)
+
+    if typed:
+        cols = ["t.trial_type - 1", "t.far_near - 1", "t.practicing",
+                "t.{0}_rt".format(measure), "t.{0}_correct".format(measure)]
+    else:
+        cols = [
+            "CASE t.trial_type {0} ELSE -1 END".format(
+                " ".join("WHEN '{0}' THEN {1}".format(tt, i) for i, tt in enumerate(TRIAL_TYPES))
+            ),
+            "CASE t.far_near WHEN 'near' THEN 1 ELSE 0 END",
+            "t.practicing = 'True'",
+            "CAST(NULLIF(t.{0}_rt, 'NA') AS REAL)".format(measure),
+            "t.{0}_correct = 'True'".format(measure)
+        ]
+
+    query = "SELECT t.participant_id, {0}, {1} FROM trials t".format(
+        condition, ", ".join(cols)
+    )
+    return query, conditions
+
+
+def _chunks(db_path, query, shape, rt_bounds, include_practice, chunk_size):
+    # Yields, per chunk: flat cell indices of (all trials, correct flags, usable RTs), the
+    # RTs, and the mask of usable RTs (correct & within bounds)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(query)
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+
+        data = np.array(rows, dtype=float)
+        keep = (data[:, _COND] >= 0) & (data[:, _TYPE] >= 0)
+        if not include_practice:
+            keep &= data[:, _PRAC] == 0
+        data = data[keep]
+
+        index = np.ravel_multi_index(
+            (data[:, _PID].astype(int), data[:, _COND].astype(int), data[:, _TYPE].astype(int),
+             data[:, _FN].astype(int)), shape
+        )
+        correct = data[:, _CORRECT] == 1
+        rt = data[:, _RT]
+        with np.errstate(invalid='ignore'):
+            usable = correct & (rt >= rt_bounds[0]) & (rt <= rt_bounds[1])
+
+        yield (index, correct.astype(float), index[usable]), rt, usable
+
+    conn.close()
+
+
+def _divide(a, b):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(b > 0, a / np.where(b > 0, b, 1), np.nan)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="NP/IOR cell means & effects from the trials table")
+    parser.add_argument('database')
+    parser.add_argument('--measure', choices=('prime', 'probe'), default='probe')
+    parser.add_argument('--trim-sd', type=float, default=2.5)
+    parser.add_argument('--include-practice', action='store_true')
+    args = parser.parse_args()
+
+    stats = analyse(args.database, args.measure, args.trim_sd, include_practice=args.include_practice)
+    print(stats.report())
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Whole-file writes that a crash can't leave half done: the new contents go to a temporary
+# file beside the target, which then replaces it in one step, so readers (& the next
+# session) find either the previous file or the new one, never a truncated one.
+
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    # Yields a file to write path's new contents to, creating path's directory if need be
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    replace(tmp, path)
+
+
+def replace(src, dst):
+    # Moves src over dst in one step. Python 2 has no os.replace, but its os.rename does the
+    # same on POSIX; only on Windows, where it won't overwrite, is dst removed first.
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    elif os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+        os.rename(src, dst)
+    else:
+        os.rename(src, dst)
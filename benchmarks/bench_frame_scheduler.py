@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Compares the SOAs achieved for NP_IOR's 500ms array->prime & 300ms ISI->probe intervals
+# when they're slept (as with smart_sleep) vs held by VsyncScheduler, against a simulated
+# vsync'd display: each flip blocks until the next refresh boundary of the real clock.
+# Every display is preceded by a draw of random cost (starting the response collector,
+# blitting the frame), & background load occasionally stalls a draw for longer.
+#
+# Runs in real time (about 2.5s per trial, both modes together).
+#
+# Usage: python benchmarks/bench_frame_scheduler.py [trials] [refresh Hz]
+
+import os
+import sys
+import time
+import random
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from frame_scheduler import VsyncScheduler, measure_refresh
+
+
+class VsyncDisplay(object):
+
+    def __init__(self, hz):
+        self.period = 1.0 / hz
+        self.origin = default_timer()
+
+    def flip(self):
+        # Blocks until the next refresh, as a swap with vsync on does
+        now = default_timer()
+        refresh = self.origin + (int((now - self.origin) / self.period) + 1) * self.period
+        while default_timer() < refresh:
+            time.sleep(max(refresh - default_timer() - 0.001, 0))
+        return default_timer()
+
+
+def draw(rng):
+    # 1-6ms, stalled by 10-25ms on 5% of draws
+    ms = rng.uniform(1, 6) + (rng.uniform(10, 25) if rng.random() < 0.05 else 0)
+    end = default_timer() + ms / 1000.0
+    while default_timer() < end:
+        pass
+
+
+def run(mode, trials, display, frame_ms, rng):
+    scheduler = VsyncScheduler(frame_ms, default_timer, locked=(mode == 'vsync'))
+    soas = {'prime': [], 'probe': []}
+    for _ in range(trials):
+        scheduler.reset()
+        draw(rng)
+        onset = display.flip()
+        for before, after, ms in (('array', 'prime', 500), ('isi', 'probe', 300)):
+            scheduler.hold(after, onset, ms)
+            if mode == 'vsync':
+                scheduler.wait(after, early=frame_ms)
+            else:
+                time.sleep(ms / 1000.0)
+            draw(rng)
+            scheduler.wait(after)
+            onset = display.flip()
+            soas[after].append(scheduler.timing(after, onset)['achieved_soa'] - ms)
+            if after == 'prime':
+                # Response time, then the ISI's empty array
+                time.sleep(rng.uniform(0.2, 0.4))
+                draw(rng)
+                onset = display.flip()
+    return soas
+
+
+def summarize(errors, frame_ms):
+    errors = sorted(errors)
+    off = sum(1 for e in errors if abs(e) > frame_ms / 2)
+    return "median {0:+6.2f}  max {1:+6.2f} ms  off by a refresh or more: {2:3d}/{3}".format(
+        errors[len(errors) // 2], errors[-1], off, len(errors))
+
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    hz = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+    display = VsyncDisplay(hz)
+
+    frame_ms = measure_refresh(display.flip, default_timer, samples=int(hz))
+    print("measured refresh: {0:.3f} ms (nominal {1:.3f})".format(frame_ms, 1000.0 / hz))
+
+    for mode in ('sleep', 'vsync'):
+        soas = run(mode, trials, display, frame_ms, random.Random(1))
+        for name in ('prime', 'probe'):
+            print("{0:5} {1:5} SOA error: {2}".format(mode, name, summarize(soas[name], frame_ms)))
+
+
+if __name__ == '__main__':
+    main()
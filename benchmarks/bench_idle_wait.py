@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# Measures CPU use while sitting on an idle screen (no key pressed), comparing the old
+# busy-polling key loop against blocking on the SDL event queue as key_wait.py does.
+# Runs under SDL's dummy video driver, so needs no display.
+#
+# Usage: python benchmarks/bench_idle_wait.py [seconds]
+
+import os
+import sys
+import time
+from ctypes import byref
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import sdl2
+
+
+def busy_poll(seconds):
+    # Equivalent of `while True: if key_pressed(...): break`
+    event = sdl2.SDL_Event()
+    end = time.time() + seconds
+    while time.time() < end:
+        sdl2.SDL_PumpEvents()
+        while sdl2.SDL_PollEvent(byref(event)):
+            pass
+
+
+def blocking_wait(seconds):
+    event = sdl2.SDL_Event()
+    end = time.time() + seconds
+    while time.time() < end:
+        sdl2.SDL_WaitEventTimeout(byref(event), 50)
+
+
+def cpu_share(wait, seconds):
+    wall_start, cpu_start = time.time(), sum(os.times()[:2])
+    wait(seconds)
+    wall, cpu = time.time() - wall_start, sum(os.times()[:2]) - cpu_start
+    return 100.0 * cpu / wall
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+
+    sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO | sdl2.SDL_INIT_EVENTS)
+    window = sdl2.SDL_CreateWindow(b"bench", 0, 0, 64, 64, sdl2.SDL_WINDOW_HIDDEN)
+
+    try:
+        print("busy poll:     {0:5.1f}% CPU".format(cpu_share(busy_poll, seconds)))
+        print("blocking wait: {0:5.1f}% CPU".format(cpu_share(blocking_wait, seconds)))
+    finally:
+        sdl2.SDL_DestroyWindow(window)
+        sdl2.SDL_Quit()
+
+
+if __name__ == '__main__':
+    main()
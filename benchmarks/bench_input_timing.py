@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Feeds a stream of key presses, at known times, into a mock render loop that draws a frame
+# every refresh & polls for input between frames (as a ResponseCollector does), then reports
+# each method's timing error against the true press times:
+#
+#   poll:    time at which the render loop saw the press (the old RT resolution)
+#   capture: timestamp recorded by KeyCapture as SDL queued the press
+#
+# As with real key presses, which SDL only queues when events are pumped on the main thread,
+# the presses are held back (standing in for the OS's input queue) & handed to SDL by the
+# loop's pump. The loop is run twice: pumping only once per frame, after each flip, & also
+# pumping between flips with VsyncScheduler.idle(), as the trial displays do.
+#
+# Runs under SDL's dummy video driver.
+#
+# Usage: python benchmarks/bench_input_timing.py [presses] [refresh_hz]
+
+import os
+import sys
+import time
+import random
+import threading
+from collections import deque
+from ctypes import byref
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sdl2
+
+from key_capture import KeyCapture, precise_time
+from frame_scheduler import VsyncScheduler
+
+KEY = sdl2.SDLK_KP_8
+
+
+def press_stream(n, truth, pending, rng):
+    # Makes n presses at random intervals, noting the time of each; they wait in pending,
+    # as in the OS's queue, until the next pump
+    for _ in range(n):
+        time.sleep(rng.uniform(0.05, 0.15))
+        truth.append(precise_time())
+        pending.append(KEY)
+
+
+def pump_from(pending):
+    def pump():
+        while pending:
+            event = sdl2.SDL_Event()
+            event.type = sdl2.SDL_KEYDOWN
+            event.key.keysym.sym = pending.popleft()
+            sdl2.SDL_PushEvent(byref(event))
+        sdl2.SDL_PumpEvents()
+    return pump
+
+
+def render_loop(n, frame_s, seen, pump, scheduler):
+    event = sdl2.SDL_Event()
+    last_flip = precise_time()
+    while len(seen) < n:
+        # Stand-in for drawing & a vsync-locked flip, pumping up to it when given a scheduler
+        if scheduler is not None:
+            scheduler.idle(last_flip)
+        time.sleep(max(0, last_flip + frame_s - precise_time()))
+        last_flip = precise_time()
+
+        pump()
+        while sdl2.SDL_PollEvent(byref(event)):
+            if event.type == sdl2.SDL_KEYDOWN:
+                seen.append(precise_time())
+
+
+def summary(errors):
+    errors = sorted(e * 1000 for e in errors)
+    return "mean {0:6.3f} ms  median {1:6.3f} ms  max {2:6.3f} ms".format(
+        sum(errors) / len(errors), errors[len(errors) // 2], errors[-1]
+    )
+
+
+def run(n, refresh, idle):
+    capture = KeyCapture([KEY], capacity=n)
+    pending = deque()
+    pump = pump_from(pending)
+    scheduler = VsyncScheduler(1000.0 / refresh, precise_time, pump=pump) if idle else None
+
+    truth, seen = [], []
+    presser = threading.Thread(target=press_stream, args=(n, truth, pending, random.Random(1)))
+    presser.start()
+    render_loop(n, 1.0 / refresh, seen, pump, scheduler)
+    presser.join()
+
+    captured = [t for _, t in capture.presses]
+    capture.close()
+    return truth, seen, captured
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    refresh = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+
+    sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO | sdl2.SDL_INIT_EVENTS)
+    window = sdl2.SDL_CreateWindow(b"bench", 0, 0, 64, 64, sdl2.SDL_WINDOW_HIDDEN)
+
+    print("{0} presses at {1:.0f} Hz".format(n, refresh))
+    for label, idle in (("pumped once per frame", False), ("pumped between flips", True)):
+        truth, seen, captured = run(n, refresh, idle)
+        print(label)
+        print("  poll:    " + summary([s - t for s, t in zip(seen, truth)]))
+        print("  capture: " + summary([c - t for c, t in zip(captured, truth)]))
+
+    sdl2.SDL_DestroyWindow(window)
+    sdl2.SDL_Quit()
+
+
+if __name__ == '__main__':
+    main()
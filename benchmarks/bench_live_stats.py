@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Runs simulated sessions' worth of trial rows through LiveStats, & compares the cost of
+# getting a per-condition summary from it against querying the (text layout) trials table
+# of a database already holding many participants' sessions, as was needed before. Also
+# checks that the running means & accuracies match the database's.
+#
+# Usage: python benchmarks/bench_live_stats.py [participants]
+
+import os
+import sys
+import random
+import shutil
+import sqlite3
+import tempfile
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from trial_space import legal_trials, build_block
+from ring_layout import ring_numbering
+from trial_geometry import trial_type
+from simulated_participant import SimulatedParticipant
+from trials_schema import LOCATIONS
+from live_stats import LiveStats
+
+COLS = ('participant_id', 'block_num', 'trial_num', 'practicing', 'far_near', 'trial_type',
+        'prime_rt', 'probe_rt', 'prime_correct', 'probe_correct', 'prime_choice', 'probe_choice')
+
+QUERY = """
+SELECT trial_type, far_near, COUNT(*),
+       AVG(CASE WHEN probe_correct = 'True' AND probe_rt != 'NA' THEN CAST(probe_rt AS REAL) END),
+       AVG(probe_correct = 'True'), AVG(probe_choice = 'distractor')
+FROM trials WHERE participant_id = ? AND block_num = ? AND practicing = 'False'
+GROUP BY trial_type, far_near
+"""
+
+
+def session_rows(pid, rng):
+    cog_locs = dict((frozenset(pair), loc) for loc, pair in ring_numbering(4, 1)[1].items())
+    labels = dict(zip(range(1, 9), LOCATIONS[1::2] + LOCATIONS[0::2]))
+    agent = SimulatedParticipant(error_rate=0.1, miss_rate=0.02, seed=pid)
+
+    for num, t in enumerate(build_block(legal_trials(), 288, rng)):
+        row = {'participant_id': pid, 'block_num': 1, 'trial_num': num + 1, 'practicing': 'False',
+               'far_near': t[0], 'trial_type': trial_type(*t, cog_locs=cog_locs)}
+        for display, target, distractor in (('prime', t[1], t[2]), ('probe', t[3], t[4])):
+            response, rt = agent.respond(display, labels[target], labels[distractor], list(labels.values()))
+            row[display + '_rt'] = rt
+            row[display + '_correct'] = str(response == labels[target])
+            row[display + '_choice'] = (
+                'target' if response == labels[target] else
+                'distractor' if response == labels[distractor] else 'empty_cell'
+            )
+        yield row
+
+
+def main():
+    participants = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rng = random.Random(1)
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'bench.db')
+
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE trials (id INTEGER PRIMARY KEY, {0})".format(
+            ", ".join(c + " TEXT" for c in COLS)))
+        insert = "INSERT INTO trials ({0}) VALUES ({1})".format(", ".join(COLS), ", ".join("?" * len(COLS)))
+        for pid in range(1, participants):
+            conn.executemany(insert, ([row[c] for c in COLS] for row in session_rows(pid, rng)))
+
+        # The live session: the last participant, whose rows also go through LiveStats
+        rows = list(session_rows(participants, rng))
+        conn.executemany(insert, ([row[c] for c in COLS] for row in rows))
+        conn.commit()
+
+        stats = LiveStats()
+        update_t = min(timeit.repeat(lambda: [LiveStats().update(r) for r in rows], number=1, repeat=5))
+        for row in rows:
+            stats.update(row)
+
+        summary_t = min(timeit.repeat(lambda: stats.summary(block=1), number=1, repeat=20))
+        query_t = min(timeit.repeat(lambda: conn.execute(QUERY, (participants, 1)).fetchall(), number=1, repeat=5))
+
+        summary = stats.summary(block=1)
+        matches = True
+        for trial_type_, far_near, n, rt, acc, d_rate in conn.execute(QUERY, (participants, 1)):
+            s = summary[(trial_type_, far_near)]
+            matches &= (s['trials'] == n and abs(s['probe']['rt_mean'] - rt) < 1e-6 and
+                        abs(s['probe']['accuracy'] - acc) < 1e-9 and
+                        abs(s['probe']['choice_rates']['distractor'] - d_rate) < 1e-9)
+        conn.close()
+
+        print("{0} trials in database, {1} in the live session".format(participants * len(rows), len(rows)))
+        print("LiveStats update: {0:.2f} us per trial".format(update_t / len(rows) * 1e6))
+        print("summary:  LiveStats {0:.3f} ms  database query {1:.2f} ms  ({2:.0f}x)".format(
+            summary_t * 1000, query_t * 1000, query_t / summary_t))
+        print("matches database: {0}".format(matches))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
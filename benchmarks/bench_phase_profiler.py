@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# Measures the cost of a profiled phase (a begin/end pair) with PhaseProfiler on & with
+# the NullProfiler used when profiling is off, then profiles a mock trial cycle in which
+# the ISI occasionally overruns (a stall standing in for e.g. a garbage collection or a
+# slow disk write), to show the report picking it out.
+#
+# Usage: python benchmarks/bench_phase_profiler.py [trials]
+
+import os
+import sys
+import time
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from phase_profiler import PhaseProfiler, NullProfiler
+
+
+def overhead(profiler, n=200000):
+    def pair():
+        profiler.end(profiler.begin('phase'))
+    return min(timeit.repeat(pair, number=n, repeat=5)) / n * 1e9
+
+
+def mock_trials(profiler, n, rng):
+    profiler.trial_prep = profiler.wrap('trial_prep', lambda: [0] * 100)
+    for _ in range(n):
+        profiler.trial_prep()
+        for name, ms in (('empty_array', 5), ('prime_collect', 3), ('isi', 3), ('probe_collect', 3), ('feedback', 2)):
+            phase = profiler.begin(name)
+            stall = 15 if name == 'isi' and rng.random() < 0.03 else 0
+            time.sleep((ms + stall) / 1000.0)
+            profiler.end(phase)
+
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+
+    baseline = min(timeit.repeat(lambda: None, number=200000, repeat=5)) / 200000 * 1e9
+    print("empty call:          {0:6.0f} ns".format(baseline))
+    print("NullProfiler phase:  {0:6.0f} ns".format(overhead(NullProfiler())))
+    print("PhaseProfiler phase: {0:6.0f} ns".format(overhead(PhaseProfiler(4096))))
+    print("")
+
+    profiler = PhaseProfiler(4096)
+    mock_trials(profiler, trials, random.Random(1))
+    print(profiler.report())
+
+
+if __name__ == '__main__':
+    main()
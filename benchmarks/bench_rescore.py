@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# Re-scoring a database of stored trials with rescore.py against re-scoring each row in
+# Python (trial_type() & choice(), one UPDATE per row), on both the text & typed trials
+# layouts. Some trials' stored trial types & choices are corrupted first, standing in for
+# rows scored under an older rule; both approaches must fix exactly those. Also checks that
+# a run interrupted part way through resumes where it stopped & ends with the same table.
+#
+# Usage: python benchmarks/bench_rescore.py [trials]
+
+import os
+import sys
+import random
+import shutil
+import sqlite3
+import tempfile
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trial_space import legal_trials, display_domains, build_block
+from trial_geometry import GeometryTable, trial_type
+from trial_record import build_row, choice
+from trials_schema import TRIAL_TYPES, migrate
+from ring_layout import RingLayout, ring_rotation
+import rescore
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ExpAssets', 'Config', 'NP_IOR_schema.sql')
+RADIUS = 112.0
+
+
+def build_db(path, n, rng):
+    # n trials across participants in both conditions, as NP_IOR.trial() would record them
+    conn = sqlite3.connect(path)
+    conn.executescript(open(SCHEMA).read())
+    pid = 0
+    while pid * 576 < n:
+        pid += 1
+        condition = ('square', 'diamond')[pid % 2]
+        layout = RingLayout((960, 540), 4, [RADIUS], rotation=ring_rotation(condition, 4))
+        space = legal_trials(display_domains(layout.far_ids, layout.near_ids))
+        geometry = GeometryTable(layout.distances(), layout.cog_locs())
+        conn.execute(
+            "INSERT INTO participants (id, userhash, gender, age, handedness, created) VALUES (?, ?, 'f', 20, 'r', '')",
+            (pid, str(pid))
+        )
+        rows = []
+        for t, trial in enumerate(build_block(space, 576, rng)):
+            labels = tuple(layout.labels[loc] for loc in trial[1:])
+            pick = rng.random()
+            prime = labels[0] if pick < 0.8 else labels[1] if pick < 0.9 else 'NA'
+            row = build_row(1, t + 1, False, trial[0], geometry[trial], labels,
+                            (prime, 400.0), (rng.choice(labels[2:] + ('NA',)), 450.0))
+            row['participant_id'] = pid
+            rows.append(row)
+        cols = sorted(rows[0])
+        conn.executemany(
+            "INSERT INTO trials ({0}) VALUES ({1})".format(", ".join(cols), ", ".join("?" * len(cols))),
+            [tuple(r[c] for c in cols) for r in rows]
+        )
+    conn.commit()
+    conn.close()
+
+
+def corrupt(path, rng, typed):
+    # Mis-scores about 5% of trials; returns their ids
+    conn = sqlite3.connect(path)
+    ids = [i for (i,) in conn.execute("SELECT id FROM trials") if rng.random() < 0.05]
+    wrong = 'erroneous' if not typed else TRIAL_TYPES.index('erroneous') + 1
+    empty = 'empty_cell' if not typed else 3
+    conn.executemany("UPDATE trials SET trial_type = ?, prime_choice = ? WHERE id = ?",
+                     [(wrong, empty, i) for i in ids])
+    conn.commit()
+    conn.close()
+    return set(ids)
+
+
+def per_row(path):
+    # Re-scores a text-layout database a row at a time
+    conn = sqlite3.connect(path)
+    layouts = dict((c, RingLayout((0, 0), 4, [RADIUS], rotation=ring_rotation(c, 4))) for c in rescore.CONDITIONS)
+    numbers = dict((c, dict((label, loc) for loc, label in l.labels.items())) for c, l in layouts.items())
+    cursor = conn.execute("SELECT * FROM trials")
+    names = [d[0] for d in cursor.description]
+    fixed = 0
+    for row in cursor.fetchall():
+        row = dict(zip(names, row))
+        labels = [row[c] for c in ('t_prime_loc', 'd_prime_loc', 't_probe_loc', 'd_probe_loc')]
+        condition = 'square' if numbers['square'][labels[0]] in layouts['square'].far_ids else 'diamond'
+        locs = [numbers[condition][label] for label in labels]
+        tt = trial_type(row['far_near'], *locs, cog_locs=layouts[condition].cog_locs())
+        prime_choice = choice(row['prime_response'], labels[0], labels[1])
+        probe_choice = choice(row['probe_response'], labels[2], labels[3])
+        if (tt, prime_choice, probe_choice) != (row['trial_type'], row['prime_choice'], row['probe_choice']):
+            conn.execute("UPDATE trials SET trial_type = ?, prime_choice = ?, probe_choice = ? WHERE id = ?",
+                         (tt, prime_choice, probe_choice, row['id']))
+            fixed += 1
+    conn.commit()
+    conn.close()
+    return fixed
+
+
+def dump(path):
+    # The trials table, with distances rounded (migrating to the typed layout keeps them only
+    # to the 15 digits the text layout stored)
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT * FROM trials ORDER BY id").fetchall()
+    conn.close()
+    return [tuple(round(v, 9) if isinstance(v, float) else v for v in row) for row in rows]
+
+
+class Interrupt(Exception):
+    pass
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    directory = tempfile.mkdtemp()
+    try:
+        clean = os.path.join(directory, 'clean.db')
+        build_db(clean, n, random.Random(1))
+        typed_clean = os.path.join(directory, 'typed_clean.db')
+        shutil.copy(clean, typed_clean)
+        migrate(typed_clean)
+        print("{0} trials".format(len(dump(clean))))
+
+        for layout in ('text', 'typed'):
+            source = clean if layout == 'text' else typed_clean
+            expected = dump(source)
+
+            path = os.path.join(directory, 'vectorized.db')
+            shutil.copy(source, path)
+            corrupted = corrupt(path, random.Random(2), layout == 'typed')
+            start = default_timer()
+            stats = rescore.rescore(path, RADIUS)
+            vectorized = default_timer() - start
+            print("{0:5}: rescore.py {1:6.2f} s, {2} updated of {3} corrupted, {4} skipped, restored: {5}".format(
+                layout, vectorized, stats['updated'], len(corrupted), stats['skipped'], dump(path) == expected))
+
+            if layout == 'text':
+                path = os.path.join(directory, 'per_row.db')
+                shutil.copy(source, path)
+                corrupt(path, random.Random(2), False)
+                start = default_timer()
+                fixed = per_row(path)
+                print("{0:5}: per row    {1:6.2f} s, {2} updated, restored: {3}".format(
+                    layout, default_timer() - start, fixed, dump(path) == expected))
+
+            # Interrupted after 10 chunks, then run again
+            path = os.path.join(directory, 'resumed.db')
+            shutil.copy(source, path)
+            corrupt(path, random.Random(2), layout == 'typed')
+
+            def interrupt(stats, last_id):
+                if stats['scanned'] >= 10 * 5000:
+                    raise Interrupt()
+            try:
+                rescore.rescore(path, RADIUS, report=interrupt)
+            except Interrupt:
+                pass
+            first = rescore.rescore(path, RADIUS, dry_run=True)
+            second = rescore.rescore(path, RADIUS)
+            print("{0:5}: interrupted, {1} trials left to scan on resuming, restored: {2}".format(
+                layout, second['scanned'], dump(path) == expected and first['scanned'] == second['scanned']))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# Checks the ring layout engine against the original hard-coded 8-location arrays, & the
+# vectorized trial classification against trial_type(), then reports how setup scales with
+# array size: enumerating the legal trial space as lists (the old legal_trials()) against
+# the index-decoded TrialSpace, plus building a 288-trial block & its geometry from each.
+#
+# Usage: python benchmarks/bench_ring_layout.py
+
+import os
+import sys
+import math
+import random
+import timeit
+from itertools import permutations
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from ring_layout import RingLayout, ring_rotation
+from trial_space import legal_trials, display_domains, build_block
+from trial_geometry import GeometryTable, TrialGeometry, classify, trial_type
+from trials_schema import FAR_NEAR, TRIAL_TYPES
+
+CENTRE = (960, 540)
+RADIUS = 100
+
+# The original setup(): far locations by angle, near ones at the midpoints of adjacent pairs
+ORIGINAL = {
+    'square':  ([(315, 'NorthEast'), (45, 'SouthEast'), (135, 'SouthWest'), (225, 'NorthWest')],
+                ['North', 'East', 'South', 'West']),
+    'diamond': ([(270, 'North'), (0, 'East'), (90, 'South'), (180, 'West')],
+                ['NorthWest', 'NorthEast', 'SouthEast', 'SouthWest']),
+}
+# ... each near location at the midpoint of the pair of far locations given
+NEAR_PAIRS = {5: (4, 1), 6: (1, 2), 7: (3, 2), 8: (3, 4)}
+
+
+def original_locs(condition):
+    far_spec, near_labels = ORIGINAL[condition]
+    locs = {}
+    for i, (angle, label) in enumerate(far_spec):
+        rad = math.radians(angle)
+        locs[i + 1] = [(CENTRE[0] + RADIUS * math.cos(rad), CENTRE[1] + RADIUS * math.sin(rad)), label]
+    for near, label in zip(sorted(NEAR_PAIRS), near_labels):
+        a, b = NEAR_PAIRS[near]
+        locs[near] = [((locs[a][0][0] + locs[b][0][0]) / 2.0, (locs[a][0][1] + locs[b][0][1]) / 2.0), label]
+    return locs
+
+
+def enumerate_lists(domains):
+    # The old legal_trials(): every trial as a list
+    return [[f, pt, pd, qt, qd] for f, prime, probe in domains
+            for pt, pd in permutations(prime, 2) for qt, qd in permutations(probe, 2)]
+
+
+def check_default():
+    for condition in ('square', 'diamond'):
+        layout = RingLayout(CENTRE, 4, [RADIUS], rotation=ring_rotation(condition, 4))
+        expected = original_locs(condition)
+        got = layout.locs(range(1, 9))
+        same = all(
+            got[i][1] == expected[i][1] and
+            max(abs(g - e) for g, e in zip(got[i][0], expected[i][0])) <= 0.5
+            for i in expected
+        )
+        print("{0:8} layout matches original: {1}  cog pairs match: {2}".format(
+            condition, same, layout.cog_locs() == dict((frozenset(p), c) for c, p in NEAR_PAIRS.items())
+        ))
+
+    space = legal_trials()
+    print("default trial space: {0} trials, same order as list enumeration: {1}".format(
+        len(space), list(space) == enumerate_lists(display_domains((1, 2, 3, 4), (5, 6, 7, 8)))
+    ))
+
+
+def check_classify(n, rings):
+    layout = RingLayout(CENTRE, n, [RADIUS * (r + 1) for r in range(rings)])
+    space = legal_trials(display_domains(layout.far_ids, layout.near_ids))
+    cog_locs = layout.cog_locs()
+
+    sample = random.Random(n).sample(range(len(space)), min(len(space), 20000))
+    trials = [space[i] for i in sample]
+    codes = np.array([[FAR_NEAR.index(t[0])] + t[1:] for t in trials])
+
+    table = GeometryTable(layout.distances(), cog_locs)
+    vectorized = [TRIAL_TYPES[c] for c in classify(codes, table.cog)]
+    scalar = [trial_type(*t, cog_locs=cog_locs) for t in trials]
+
+    locs = layout.locs(range(1, len(layout) + 1))
+    t = trials[0]
+    geometry = table[t]
+    distances_ok = abs(geometry.t_prime_to_d_probe - math.hypot(locs[t[1]][0][0] - locs[t[4]][0][0], locs[t[1]][0][1] - locs[t[4]][0][1])) < 1e-9
+
+    print("n={0:2} rings={1}: vectorized == scalar over {2} trials: {3}  distances ok: {4}".format(
+        n, rings, len(trials), vectorized == scalar, distances_ok
+    ))
+
+
+def main():
+    check_default()
+    for n, rings in ((4, 1), (12, 1), (24, 2)):
+        check_classify(n, rings)
+
+    print("")
+    print("{0:>4} {1:>5} {2:>10}  {3:>16}  {4:>16}  {5:>16}".format(
+        'n', 'rings', 'trials', 'list enum (ms)', 'TrialSpace (ms)', 'block+geom (ms)'))
+
+    for n, rings in ((4, 1), (6, 1), (8, 1), (12, 1), (16, 1), (24, 1), (12, 2), (16, 3)):
+        layout = RingLayout(CENTRE, n, [RADIUS * (r + 1) for r in range(rings)])
+        domains = display_domains(layout.far_ids, layout.near_ids)
+        space = legal_trials(domains)
+
+        # List enumeration is skipped once it would need several GB
+        if len(space) <= 5 * 10 ** 6:
+            list_t = "{0:16.1f}".format(min(timeit.repeat(lambda: enumerate_lists(domains), number=1, repeat=3)) * 1000)
+        else:
+            list_t = "{0:>16}".format('(skipped)')
+
+        space_t = min(timeit.repeat(lambda: legal_trials(domains), number=1, repeat=3)) * 1000
+
+        def block_and_geometry():
+            block = build_block(space, 288, random.Random(1))
+            table = GeometryTable(layout.distances(), layout.cog_locs())
+            table.prebuild(block)
+            return table
+
+        block_t = min(timeit.repeat(block_and_geometry, number=1, repeat=3)) * 1000
+
+        print("{0:>4} {1:>5} {2:>10}  {3}  {4:16.3f}  {5:16.1f}".format(n, rings, len(space), list_t, space_t, block_t))
+
+
+if __name__ == '__main__':
+    main()
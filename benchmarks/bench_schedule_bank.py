@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# Times building & validating a schedule bank for a study's participants in one process &
+# across a process pool, then compares a session getting its schedules from the bank with
+# building them itself (as NP_IOR.setup() does without a warm schedule cache), & checks
+# the banked schedules are exactly those a session with the same seed would build.
+#
+# Usage: python benchmarks/bench_schedule_bank.py [participants] [test blocks]
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+from multiprocessing import cpu_count
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trial_space import build_block, PRACTICE_TRIALS
+from schedule_bank import build_bank, validate_bank, study_space, ScheduleBank
+
+
+def main():
+    participants = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    lengths = [PRACTICE_TRIALS] + [288] * blocks
+    ids = list(range(1, participants + 1))
+    directory = tempfile.mkdtemp()
+
+    try:
+        path = os.path.join(directory, 'study.bank')
+        for processes in sorted(set([1, cpu_count()])):
+            start = default_timer()
+            failed = build_bank(path, ids, 2024, lengths, processes=processes)
+            print("build {0} participants, {1} process(es): {2:7.2f} s, {3} failing".format(
+                participants, processes, default_timer() - start, len(failed)))
+
+        start = default_timer()
+        failed = validate_bank(path)
+        print("re-validate bank:                    {0:7.2f} s, {1} failing".format(default_timer() - start, len(failed)))
+        print("bank size: {0:.1f} KB".format(os.path.getsize(path) / 1024.0))
+
+        bank = ScheduleBank(path)
+        space, _ = study_space(4, 1)
+        n = min(participants, 100)
+
+        start = default_timer()
+        for pid in ids[:n]:
+            bank.schedules((1, pid))
+        load = (default_timer() - start) / n
+
+        start = default_timer()
+        mismatched = 0
+        for pid in ids[:n]:
+            seed = bank.entry((1, pid))[0]
+            rng = random.Random(seed)
+            built = [build_block(space, length, rng) for length in lengths]
+            mismatched += built != bank.schedules((1, pid))
+        build = (default_timer() - start) / n - load
+
+        print("per session: load from bank {0:.2f} ms, build {1:.2f} ms; schedules not matching: {2}".format(
+            load * 1000, build * 1000, mismatched))
+        bank.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# Writes a simulated session log (every trial's parameters, onsets, interval ends, key
+# presses & responses, as NP_IOR logs them), reporting the cost of logging a trial & the
+# log's size, then replays it & checks the re-scored rows match those the session scored
+# with trial_record.build_row(). Replays a second time with the RESPONSE records left
+# out, so responses & RTs are recovered from the key presses & onsets alone, and once
+# more with a partly written final record, as left by a crash.
+#
+# Usage: python benchmarks/bench_session_log.py [trials]
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ring_layout import RingLayout, ring_rotation
+from trial_space import legal_trials, display_domains, build_block
+from trial_geometry import GeometryTable
+from trial_record import build_row
+from session_log import SessionLog, Replay, audit_report
+
+# Pixels for 1 degree of visual angle at a typical lab viewing distance & 1080p display
+PX_PER_DEG = 40
+KEYS = [1073741920, 1073741921, 1073741918, 1073741915, 1073741914, 1073741913, 1073741916, 1073741919]
+LABELS = ['North', 'NorthEast', 'East', 'SouthEast', 'South', 'SouthWest', 'West', 'NorthWest']
+
+
+def simulate(path, trials, rng, responses=True):
+    layout = RingLayout((960, 540), 4, [2.8 * PX_PER_DEG], rotation=ring_rotation('square', 4))
+    locs = layout.locs(range(1, len(layout) + 1))
+    space = legal_trials(display_domains(layout.far_ids, layout.near_ids))
+    geometry = GeometryTable(layout.distances(), layout.cog_locs())
+    keys = dict(zip(LABELS, KEYS))
+
+    log = SessionLog(path, 1, 4, 60, locs, dict(zip(KEYS, LABELS)))
+    rows, elapsed, clock = [], 0.0, 1000.0
+    for block, schedule in enumerate([build_block(space, trials // 2, rng)] * 2, 1):
+        for trial_num, trial in enumerate(schedule, 1):
+            labels = tuple(locs[loc][1] for loc in trial[1:])
+            onsets, presses, scored = {}, [], []
+            for display, t_label in (('prime', labels[0]), ('probe', labels[2])):
+                onsets['array' if display == 'prime' else 'isi'] = clock
+                clock += 0.5 if display == 'prime' else 0.3
+                clock += rng.choice([0.0, 0.0, 0.0, 1 / 60.0])
+                onsets[display] = clock
+                if rng.random() < 0.03:
+                    scored.append(('NA', 'NA'))
+                    clock += 5.0
+                    continue
+                label = t_label if rng.random() < 0.9 else rng.choice(LABELS[::2])
+                press = clock + rng.uniform(0.25, 0.8)
+                presses.append((keys[label], press))
+                scored.append((label, (press - clock) * 1000.0))
+                clock = press + 0.005
+            onsets['feedback'] = clock
+            clock += 0.6
+
+            start = default_timer()
+            log.trial(block, False, trial)
+            log.interval_end('array', onsets['array'] + 0.5, 500)
+            if responses:
+                log.response('prime', *scored[0])
+            log.interval_end('isi', onsets['isi'] + 0.3, 300)
+            if responses:
+                log.response('probe', *scored[1])
+            log.onset('feedback', onsets['feedback'])
+            for display in ('array', 'prime', 'isi', 'probe'):
+                log.onset(display, onsets[display])
+            for key, t in presses:
+                log.key(key, t)
+            log.flush()
+            elapsed += default_timer() - start
+
+            rows.append(build_row(block, trial_num, False, trial[0], geometry[trial], labels, *scored))
+    log.close()
+    return rows, elapsed
+
+
+def compare(expected, replayed):
+    mismatched = 0
+    for a, b in zip(expected, replayed):
+        for col in a:
+            if isinstance(a[col], float):
+                if abs(a[col] - b[col]) > 1e-6:
+                    mismatched += 1
+                    break
+            elif a[col] != b[col]:
+                mismatched += 1
+                break
+    return mismatched + abs(len(expected) - len(replayed))
+
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    directory = tempfile.mkdtemp()
+
+    try:
+        path = os.path.join(directory, 'session.npsl')
+        rows, elapsed = simulate(path, trials, random.Random(1))
+        print("{0} trials logged: {1:.1f} us per trial, {2:.1f} KB ({3:.0f} bytes per trial)".format(
+            len(rows), elapsed / len(rows) * 1e6, os.path.getsize(path) / 1024.0, os.path.getsize(path) / float(len(rows))))
+
+        start = default_timer()
+        replayed = list(Replay(path).rows())
+        print("replay:                    {0:7.1f} ms, rows not matching: {1}".format(
+            (default_timer() - start) * 1000, compare(rows, replayed)))
+
+        keys_only = os.path.join(directory, 'keys_only.npsl')
+        rows, _ = simulate(keys_only, trials, random.Random(1), responses=False)
+        start = default_timer()
+        replayed = list(Replay(keys_only).rows())
+        print("replay from key presses:   {0:7.1f} ms, rows not matching: {1}".format(
+            (default_timer() - start) * 1000, compare(rows, replayed)))
+
+        with open(path, 'ab') as f:
+            f.write(b'\x03' * 10)
+        print("replay of truncated log:   {0} rows".format(len(list(Replay(path).rows()))))
+        print("")
+        print(audit_report(path))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Reproducible startup-time benchmark: runs the project's part of NP_IOR.setup() in fresh
+# interpreters, eagerly (deferred_startup = False) and deferred, & reports the median time
+# from the top of the script (imports included) to the first screen being ready, and to
+# every array frame & glyph being done (in the background, when deferred).
+#
+# klibs isn't needed: array frames are composited into numpy RGBA arrays the size of the
+# real ones, standing in for NumpySurface, & glyphs are rasterized into numpy arrays,
+# standing in for font rendering.
+#
+# Usage: python benchmarks/bench_startup.py [runs]
+
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Pixels for 1 degree of visual angle at a typical lab viewing distance & 1080p display
+PX_PER_DEG = 40
+
+
+def child(mode):
+    from timeit import default_timer
+    start = default_timer()
+
+    sys.path.insert(0, ROOT)
+    import random
+    import numpy as np
+    from trial_space import legal_trials, display_domains, build_block, PRACTICE_TRIALS
+    from trial_geometry import GeometryTable
+    from ring_layout import RingLayout, ring_rotation
+    from display_cache import DisplayCache
+    from glyph_atlas import GlyphAtlas
+    if mode == 'eager':
+        from simulated_participant import load_participant
+
+    centre = (960, 540)
+    box = int(1.8 * PX_PER_DEG)
+    layout = RingLayout(centre, 4, [2.8 * PX_PER_DEG], rotation=ring_rotation('square', 4))
+    locs = layout.locs(range(1, len(layout) + 1))
+    space = legal_trials(display_domains(layout.far_ids, layout.near_ids))
+
+    lengths = [PRACTICE_TRIALS, 288]
+    rng = random.Random(1)
+    schedules = [build_block(space, n, rng) for n in lengths]
+    geometry = GeometryTable(layout.distances(), layout.cog_locs())
+    for schedule in schedules:
+        geometry.prebuild(schedule)
+
+    size = int(2 * (layout.extent() + box))
+    sprite = np.full((box, box, 4), 255, dtype=np.uint8)
+    sprite[4:-4, 4:-4, 3] = 0
+    item = np.full((int(0.95 * PX_PER_DEG),) * 2 + (4,), 255, dtype=np.uint8)
+
+    def blend(frame, src, pos):
+        x, y = int(pos[0] - centre[0] + size // 2 - src.shape[1] // 2), int(pos[1] - centre[1] + size // 2 - src.shape[0] // 2)
+        region = frame[y:y + src.shape[0], x:x + src.shape[1]].astype(np.float32)
+        alpha = src[..., 3:4] / 255.0
+        frame[y:y + src.shape[0], x:x + src.shape[1]] = (src * alpha + region * (1 - alpha)).astype(np.uint8)
+
+    def composite(item_locs):
+        frame = np.zeros((size, size, 4), dtype=np.uint8)
+        for pos, _ in locs.values():
+            blend(frame, sprite, pos)
+        if item_locs is not None:
+            for loc in item_locs:
+                blend(frame, item, locs[loc][0])
+        return frame
+
+    def render_glyph(glyph):
+        # Supersampled rasterization of a glyph-sized bitmap, as font rendering does
+        canvas = np.random.RandomState(ord(glyph[0])).rand(23 * 4, 23 * 4 * len(glyph))
+        return (canvas.reshape(23, 4, -1, 4).mean(axis=(1, 3)) * 255).astype(np.uint8)
+
+    frames = DisplayCache(composite)
+    keys = [None] + sorted(space.item_pairs())
+    if mode == 'eager':
+        frames.prebuild(keys)
+    else:
+        frames.prefetch(keys)
+    glyphs = GlyphAtlas(render_glyph, '0123456789', ['WRONG'], lazy=(mode == 'deferred'))
+
+    ready = default_timer() - start
+
+    for key in keys:
+        frames[key]
+    glyphs.load()
+    complete = default_timer() - start
+
+    print(json.dumps({'ready': ready * 1000, 'complete': complete * 1000}))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    results = {'eager': [], 'deferred': []}
+    # Warm the OS file cache, then alternate modes
+    subprocess.check_output([sys.executable, __file__, '--child', 'eager'])
+    for _ in range(runs):
+        for mode in ('eager', 'deferred'):
+            out = subprocess.check_output([sys.executable, __file__, '--child', mode])
+            results[mode].append(json.loads(out.decode('utf-8')))
+
+    print("{0} runs each, median ms from script start, imports included".format(runs))
+    for mode in ('eager', 'deferred'):
+        print("{0:9} first screen ready {1:7.1f}   all frames & glyphs done {2:7.1f}".format(
+            mode, median([r['ready'] for r in results[mode]]), median([r['complete'] for r in results[mode]])
+        ))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# Simulates a lab of several stations on one machine, each running sessions in its own
+# process, and compares:
+#
+#   shared:   every station writing to one database file (each trial committed, as klibs does)
+#   station:  every station writing to its own database, merged by station_merge.py
+#
+# The merge runs repeatedly while the stations are still writing, then once more after,
+# and the central database is checked against the stations: row counts, each participant's
+# trials & frame timing rows, and that every row references a merged participant.
+#
+# Usage: python benchmarks/bench_station_merge.py [stations] [sessions_per_station]
+
+import os
+import sys
+import random
+import shutil
+import sqlite3
+import tempfile
+import multiprocessing
+from timeit import default_timer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from trial_space import legal_trials, build_block
+from station_merge import StationMerger, SCHEMA
+
+TRIAL_COLS = ('participant_id', 'block_num', 'trial_num', 'practicing', 'far_near', 'trial_type',
+              'prime_rt', 'probe_rt', 'prime_correct', 'probe_correct', 't_prime_to_t_probe',
+              't_prime_to_d_probe', 'd_prime_to_t_probe', 'd_prime_to_d_probe', 'prime_choice',
+              'probe_choice', 'prime_response', 'probe_response', 't_prime_loc', 'd_prime_loc',
+              't_probe_loc', 'd_probe_loc')
+TIMING_COLS = ('participant_id', 'block_num', 'trial_num', 'display', 'onset_latency',
+               'flip_duration', 'flips', 'dropped_frames', 'max_flip_interval')
+
+
+def create(path, wal):
+    # Station databases are local, so in WAL mode as set by the TrialWriter; a shared file
+    # on a network mount can't use WAL, so keeps SQLite's default rollback journal
+    conn = sqlite3.connect(path)
+    conn.executescript(open(SCHEMA).read())
+    if wal:
+        conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+
+
+def run_station(args):
+    # Runs the station's sessions, committing after every trial; returns (seconds, lock waits)
+    path, station, sessions, seed = args
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path, timeout=60)
+    trial_q = "INSERT INTO trials ({0}) VALUES ({1})".format(", ".join(TRIAL_COLS), ", ".join("?" * len(TRIAL_COLS)))
+    timing_q = "INSERT INTO frame_timing ({0}) VALUES ({1})".format(", ".join(TIMING_COLS), ", ".join("?" * len(TIMING_COLS)))
+
+    waits = 0
+    start = default_timer()
+    for session in range(sessions):
+        with conn:
+            pid = conn.execute(
+                "INSERT INTO participants (userhash, gender, age, handedness, created) VALUES (?, 'n', 20, 'r', '')",
+                ("{0}-{1}".format(station, session),)
+            ).lastrowid
+
+        for num, t in enumerate(build_block(legal_trials(), 288, rng)):
+            trial = (pid, 1, num + 1, 'False', t[0], 'control-far', rng.gauss(550, 80), rng.gauss(550, 80),
+                     'True', 'True', 1.0, 2.0, 3.0, 4.0, 'target', 'target', 'North', 'North',
+                     'North', 'East', 'South', 'West')
+            timing = [(pid, 1, num + 1, d, 8.3, 0.1, 30, 0, 16.7) for d in ('array', 'prime', 'isi', 'probe')]
+            while True:
+                try:
+                    with conn:
+                        conn.execute(trial_q, trial)
+                        conn.executemany(timing_q, timing)
+                    break
+                except sqlite3.OperationalError:
+                    waits += 1
+    conn.close()
+    return default_timer() - start, waits
+
+
+def check(central, stations):
+    conn = sqlite3.connect(central)
+    ok = True
+    for name, path in stations.items():
+        src = sqlite3.connect(path)
+        for userhash, trials, timing in src.execute(
+            "SELECT p.userhash, (SELECT count(*) FROM trials t WHERE t.participant_id = p.id), "
+            "(SELECT count(*) FROM frame_timing f WHERE f.participant_id = p.id) FROM participants p"
+        ):
+            row = conn.execute(
+                "SELECT (SELECT count(*) FROM trials t WHERE t.participant_id = p.id), "
+                "(SELECT count(*) FROM frame_timing f WHERE f.participant_id = p.id) "
+                "FROM participants p WHERE userhash = ?", (userhash,)
+            ).fetchall()
+            ok &= row == [(trials, timing)]
+        src.close()
+
+    orphans = conn.execute(
+        "SELECT count(*) FROM trials WHERE participant_id NOT IN (SELECT id FROM participants)"
+    ).fetchone()[0]
+    totals = [conn.execute("SELECT count(*) FROM {0}".format(t)).fetchone()[0]
+              for t in ('participants', 'trials', 'frame_timing')]
+    conn.close()
+    return ok and orphans == 0, totals
+
+
+def main():
+    n_stations = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    tmp = tempfile.mkdtemp()
+
+    try:
+        # Every station writing to one shared file
+        shared = os.path.join(tmp, 'shared.db')
+        create(shared, wal=False)
+        pool = multiprocessing.Pool(n_stations)
+        start = default_timer()
+        results = pool.map(run_station, [(shared, 'lab{0}'.format(i), sessions, i) for i in range(n_stations)])
+        shared_t = default_timer() - start
+        pool.close()
+
+        # One database per station, merged while they run
+        stations = dict(('lab{0}'.format(i), os.path.join(tmp, 'lab{0}.db'.format(i))) for i in range(n_stations))
+        for path in stations.values():
+            create(path, wal=True)
+
+        central = os.path.join(tmp, 'central.db')
+        merger = StationMerger(central)
+        pool = multiprocessing.Pool(n_stations)
+        start = default_timer()
+        running = pool.map_async(run_station, [(stations[n], n, sessions, i) for i, n in enumerate(sorted(stations))])
+
+        passes, pass_t = 0, []
+        while not running.ready():
+            pass_start = default_timer()
+            merger.merge(stations)
+            pass_t.append(default_timer() - pass_start)
+            passes += 1
+        station_t = default_timer() - start
+        station_results = running.get()
+        pool.close()
+
+        merge_start = default_timer()
+        merger.merge(stations)
+        final_t = default_timer() - merge_start
+        again = merger.merge(stations)
+
+        ok, totals = check(central, stations)
+
+        print("{0} stations x {1} sessions of 288 trials".format(n_stations, sessions))
+        print("shared file:   {0:6.2f} s   lock retries {1}".format(shared_t, sum(w for _, w in results)))
+        print("per station:   {0:6.2f} s   lock retries {1}   ({2} merges while running, {3:.3f} s max)".format(
+            station_t, sum(w for _, w in station_results), passes, max(pass_t)))
+        print("final merge:   {0:6.3f} s   central: {1} participants, {2} trials, {3} frame_timing rows".format(
+            final_t, *totals))
+        print("central matches stations: {0}   re-merge adds nothing: {1}".format(
+            ok, all(not any(c.values()) for c in again.values())))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
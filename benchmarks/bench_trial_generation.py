@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Compares setup time & resulting trial lists for the old generate-then-prune path
+# against the constraint-driven generator in trial_space.py.
+#
+# Usage: python benchmarks/bench_trial_generation.py [repeats]
+
+import os
+import sys
+import random
+import timeit
+from itertools import product
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trial_space import legal_trials, build_block, PRACTICE_TRIALS
+
+
+class Block(object):
+    # Minimal stand-in for a klibs trial iterator: removal while iterating is
+    # compensated for by decrementing i, as the old setup() did.
+    def __init__(self, trials):
+        self.trials = trials
+        self.length = len(trials)
+        self.i = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.i >= len(self.trials):
+            raise StopIteration
+        self.i += 1
+        return self.trials[self.i - 1]
+
+    next = __next__
+
+    def remove(self, trial):
+        self.trials.remove(trial)
+
+
+def cross_product():
+    trials = [list(t) for t in product(['far', 'near'], range(1, 5), range(1, 5), range(1, 9), range(1, 9))]
+    random.shuffle(trials)
+    return trials
+
+
+def prune(blocks):
+    # Verbatim port of the pruning loop previously found in NP_IOR.setup()
+    for ind_b, block in enumerate(blocks):
+        for trial in block:
+            if trial[1] == trial[2] or trial[3] == trial[4]:
+                blocks[ind_b].remove(trial)
+                block.i -= 1
+                block.length = len(block.trials)
+                continue
+            if trial[0] == 'near':
+                if trial[3] < 5 or trial[4] < 5:
+                    blocks[ind_b].remove(trial)
+                    block.i -= 1
+                    block.length = len(block.trials)
+            else:
+                if trial[3] > 4 or trial[4] > 4:
+                    blocks[ind_b].remove(trial)
+                    block.i -= 1
+                    block.length = len(block.trials)
+
+        if ind_b == 0:
+            for trial in block:
+                blocks[ind_b].remove(trial)
+                block.i -= 1
+                block.length = len(block.trials)
+                if block.length == 25:
+                    break
+
+    return blocks
+
+
+def old_setup():
+    return [b.trials for b in prune([Block(cross_product()), Block(cross_product())])]
+
+
+def new_setup():
+    trials = legal_trials()
+    return [build_block(trials, PRACTICE_TRIALS), build_block(trials, len(trials))]
+
+
+def is_legal(trial):
+    far_or_near, prime_t, prime_d, probe_t, probe_d = trial
+    probe_far = probe_t < 5 and probe_d < 5
+    probe_near = probe_t > 4 and probe_d > 4
+    return (prime_t != prime_d and probe_t != probe_d and prime_t < 5 and prime_d < 5
+            and (probe_far if far_or_near == 'far' else probe_near))
+
+
+def check(label, blocks):
+    practice, testing = blocks
+    legal = set(map(tuple, legal_trials()))
+    testing_set = set(map(tuple, testing))
+
+    print("{0}: practice={1} testing={2} unique={3} all_legal={4} complete={5}".format(
+        label, len(practice), len(testing), len(testing_set),
+        all(is_legal(t) for t in practice + testing), testing_set == legal
+    ))
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    check("old", old_setup())
+    check("new", new_setup())
+
+    old_t = min(timeit.repeat(old_setup, number=1, repeat=repeats))
+    new_t = min(timeit.repeat(new_setup, number=1, repeat=repeats))
+
+    print("old: {0:.2f} ms  new: {1:.2f} ms  speedup: {2:.1f}x".format(
+        old_t * 1000, new_t * 1000, old_t / new_t
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Memory & speed of a block's trials held as a TrialStore vs the list of 5-item lists
+# build_block() used to return, at 2048 trials (the size of klibs' full factorial of the
+# independent variables) & 100k trials: traced allocations of each block, time to build &
+# to iterate it, & vectorized vs per-trial filtering of the full factorial down to the
+# legal trials (the constraints the original setup() pruned by).
+#
+# Usage: python benchmarks/bench_trial_store.py
+
+import os
+import sys
+import random
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trial_space import legal_trials, build_block, FAR_LOCS, NEAR_LOCS, DISPLAY_DOMAINS
+from trial_store import TrialStore
+
+
+def list_block(trials, length, rng):
+    # build_block() as it was, before TrialStore
+    passes, remainder = divmod(length, len(trials))
+    block = [list(t) for _ in range(passes) for t in trials]
+    block += [list(t) for t in rng.sample(trials, remainder)]
+    rng.shuffle(block)
+    return block
+
+
+def traced(build):
+    tracemalloc.start()
+    block = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return block, size
+
+
+def best(fn, number=3):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1000
+
+
+def is_legal(t):
+    # Per-trial form of the declared constraints (see trial_space.py)
+    far_or_near, prime_t, prime_d, probe_t, probe_d = t
+    probe_domain = FAR_LOCS if far_or_near == 'far' else NEAR_LOCS
+    return (prime_t in FAR_LOCS and prime_d in FAR_LOCS and probe_t in probe_domain and
+            probe_d in probe_domain and prime_t != prime_d and probe_t != probe_d)
+
+
+def main():
+    space = legal_trials()
+
+    print("{0:>7}  {1:>12} {2:>12}  {3:>14} {4:>14}  {5:>13} {6:>13}".format(
+        'trials', 'lists KB', 'store KB', 'lists build ms', 'store build ms', 'lists iter ms', 'store iter ms'))
+    for n in (2048, 100000):
+        lists, list_bytes = traced(lambda: list_block(space, n, random.Random(1)))
+        store, store_bytes = traced(lambda: build_block(space, n, random.Random(1)))
+        assert store == lists
+
+        def iterate(block):
+            for t in block:
+                t[3]
+        print("{0:7d}  {1:12.1f} {2:12.1f}  {3:14.2f} {4:14.2f}  {5:13.2f} {6:13.2f}".format(
+            n, list_bytes / 1024.0, store_bytes / 1024.0,
+            best(lambda: list_block(space, n, random.Random(1))), best(lambda: build_block(space, n, random.Random(1))),
+            best(lambda: iterate(lists)), best(lambda: iterate(store))))
+
+    full = TrialStore.product(FAR_LOCS, FAR_LOCS + NEAR_LOCS)
+    full_lists = [list(t) for t in full]
+    per_trial = best(lambda: [t for t in full_lists if is_legal(t)], number=20)
+    vectorized = best(lambda: full.filter(full.legal_mask(DISPLAY_DOMAINS)), number=20)
+    legal = full.filter(full.legal_mask(DISPLAY_DOMAINS))
+    print("")
+    print("filter {0} factorial trials to {1} legal: per trial {2:.3f} ms, vectorized {3:.3f} ms, "
+          "matches legal_trials(): {4}".format(len(full), len(legal), per_trial, vectorized,
+                                             sorted(map(tuple, legal)) == sorted(map(tuple, space))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Compares the time the experiment's main thread spends writing each trial row when
+# inserting & committing synchronously (as klibs does) against queueing it on the
+# TrialWriter, and checks that every queued row reaches the database.
+#
+# Usage: python benchmarks/bench_trial_writer.py [trials]
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+from timeit import default_timer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from trial_writer import TrialWriter
+
+SCHEMA = os.path.join(ROOT, 'ExpAssets', 'Config', 'NP_IOR_schema.sql')
+
+ROW = {
+    'participant_id': 1, 'block_num': 1, 'trial_num': 1, 'practicing': 'False',
+    'far_near': 'far', 'trial_type': 'repeat', 'prime_rt': 512.3, 'probe_rt': 498.7,
+    'prime_correct': 'True', 'probe_correct': 'True', 't_prime_to_t_probe': 0.0,
+    't_prime_to_d_probe': 141.4, 'd_prime_to_t_probe': 141.4, 'd_prime_to_d_probe': 0.0,
+    'prime_choice': 'target', 'probe_choice': 'target', 'prime_response': 'NorthEast',
+    'probe_response': 'NorthEast', 't_prime_loc': 'NorthEast', 'd_prime_loc': 'SouthEast',
+    't_probe_loc': 'NorthEast', 'd_probe_loc': 'SouthEast'
+}
+
+
+def create_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(open(SCHEMA).read())
+    conn.close()
+
+
+def sync_writes(path, n):
+    conn = sqlite3.connect(path)
+    cols = sorted(ROW)
+    q = "INSERT INTO trials ({0}) VALUES ({1})".format(", ".join(cols), ", ".join("?" * len(cols)))
+    times = []
+    for i in range(n):
+        start = default_timer()
+        conn.execute(q, [ROW[c] for c in cols])
+        conn.commit()
+        times.append(default_timer() - start)
+    conn.close()
+    return times
+
+
+def queued_writes(path, n):
+    writer = TrialWriter(path)
+    times = []
+    for i in range(n):
+        start = default_timer()
+        writer.insert(ROW)
+        times.append(default_timer() - start)
+    writer.close()
+    return times
+
+
+def summary(times):
+    times = sorted(t * 1000 for t in times)
+    return "median {0:.3f} ms  p99 {1:.3f} ms  max {2:.3f} ms".format(
+        times[len(times) // 2], times[int(len(times) * 0.99)], times[-1]
+    )
+
+
+def count(path):
+    conn = sqlite3.connect(path)
+    n = conn.execute("SELECT count(*) FROM trials").fetchone()[0]
+    conn.close()
+    return n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 288
+    tmp = tempfile.mkdtemp()
+    try:
+        sync_db, queued_db = os.path.join(tmp, 'sync.db'), os.path.join(tmp, 'queued.db')
+        create_db(sync_db)
+        create_db(queued_db)
+
+        print("sync insert+commit: {0}  rows={1}".format(summary(sync_writes(sync_db, n)), count(sync_db)))
+        print("queued (WAL):       {0}  rows={1}".format(summary(queued_writes(queued_db, n)), count(queued_db)))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
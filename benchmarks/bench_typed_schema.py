@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Compares database size & the speed of a typical per-cell analysis query between the
+# all-text trials layout (NP_IOR_schema.sql) and the typed layout (trials_schema.py),
+# on synthetic sessions. Also checks that migration preserves every row.
+#
+# Usage: python benchmarks/bench_typed_schema.py [participants]
+
+import os
+import sys
+import random
+import shutil
+import sqlite3
+import tempfile
+from timeit import default_timer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from trial_space import legal_trials, build_block
+from ring_layout import ring_numbering
+from trial_geometry import trial_type
+from trials_schema import migrate, LOCATIONS
+
+SCHEMA = os.path.join(ROOT, 'ExpAssets', 'Config', 'NP_IOR_schema.sql')
+
+TEXT_QUERY = """
+SELECT participant_id, trial_type, far_near, AVG(CAST(probe_rt AS REAL)), COUNT(*)
+FROM trials WHERE probe_correct = 'True' AND probe_rt != 'NA' AND trial_type = 'T.at.CoG-near'
+GROUP BY participant_id, trial_type, far_near
+"""
+
+TYPED_QUERY = """
+SELECT participant_id, trial_type, far_near, AVG(probe_rt), COUNT(*)
+FROM trials WHERE probe_correct = 1 AND probe_rt IS NOT NULL
+AND trial_type = (SELECT id FROM trial_type_codes WHERE label = 'T.at.CoG-near')
+GROUP BY participant_id, trial_type, far_near
+"""
+
+
+def synthetic_rows(participants, rng):
+    cog_locs = dict((frozenset(pair), loc) for loc, pair in ring_numbering(4, 1)[1].items())
+    labels = dict(zip(range(1, 9), LOCATIONS[1::2] + LOCATIONS[0::2]))
+    trials = legal_trials()
+
+    for pid in range(1, participants + 1):
+        for num, t in enumerate(build_block(trials, 288, rng)):
+            missed = rng.random() < 0.02
+            rt = 'NA' if missed else rng.gauss(550, 80)
+            yield (
+                pid, 1, num + 1, 'False', t[0], trial_type(t[0], t[1], t[2], t[3], t[4], cog_locs),
+                rt, rt, str(not missed), str(not missed),
+                rng.random() * 200, rng.random() * 200, rng.random() * 200, rng.random() * 200,
+                'target', 'target', 'NA' if missed else labels[t[1]], 'NA' if missed else labels[t[3]],
+                labels[t[1]], labels[t[2]], labels[t[3]], labels[t[4]]
+            )
+
+
+def build_text_db(path, participants):
+    conn = sqlite3.connect(path)
+    conn.executescript(open(SCHEMA).read())
+    conn.executemany(
+        "INSERT INTO participants (userhash, gender, age, handedness, created) VALUES (?, 'n', 20, 'r', '')",
+        [(str(i),) for i in range(participants)]
+    )
+    conn.executemany(
+        "INSERT INTO trials (participant_id, block_num, trial_num, practicing, far_near, trial_type, "
+        "prime_rt, probe_rt, prime_correct, probe_correct, t_prime_to_t_probe, t_prime_to_d_probe, "
+        "d_prime_to_t_probe, d_prime_to_d_probe, prime_choice, probe_choice, prime_response, "
+        "probe_response, t_prime_loc, d_prime_loc, t_probe_loc, d_probe_loc) "
+        "VALUES ({0})".format(", ".join("?" * 22)),
+        synthetic_rows(participants, random.Random(1))
+    )
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def time_query(path, query, repeats=5):
+    conn = sqlite3.connect(path)
+    best = None
+    for _ in range(repeats):
+        start = default_timer()
+        rows = conn.execute(query).fetchall()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    n = conn.execute("SELECT count(*) FROM trials").fetchone()[0]
+    conn.close()
+    return best, len(rows), n
+
+
+def main():
+    participants = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tmp = tempfile.mkdtemp()
+    try:
+        text_db, typed_db = os.path.join(tmp, 'text.db'), os.path.join(tmp, 'typed.db')
+        build_text_db(text_db, participants)
+        shutil.copy(text_db, typed_db)
+
+        start = default_timer()
+        migrate(typed_db)
+        migration = default_timer() - start
+
+        for label, path, query in (('text', text_db, TEXT_QUERY), ('typed', typed_db, TYPED_QUERY)):
+            elapsed, groups, n = time_query(path, query)
+            print("{0:5}: {1:8.1f} KB  query {2:7.2f} ms  groups={3} rows={4}".format(
+                label, os.path.getsize(path) / 1024.0, elapsed * 1000, groups, n
+            ))
+
+        print("migration of {0} participants: {1:.2f} s".format(participants, migration))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
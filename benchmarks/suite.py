@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+# Micro-benchmarks of NP_IOR's hot paths, run headless (SDL's dummy video driver, a
+# temporary SQLite database), with results saved & compared against a baseline:
+#
+#   setup_trial_space       building the trial space & the practice & test schedules, in
+#                           place of pruning klibs' factorial (setup())
+#   setup_legal_check       vectorized check of setup()'s constraints over the factorial
+#   trial_prep              location & geometry lookups, frame prefetch & session logging
+#   determine_trial_type    classifying a trial's arrangement
+#   present_empty_array     clearing, blitting the cached empty array & flipping
+#   present_filled_array    the same, for the array with T & D
+#   present_feedback        composing the feedback lines from pre-rendered glyphs & flipping
+#   trial_row               scoring a trial into its row & updating the live statistics
+#   writer_insert           queueing a trial row with TrialWriter.insert(), as the trial
+#                           loop does (its thread commits them meanwhile, in batches)
+#   writer_flush            queueing 32 rows & TrialWriter.flush() committing them, per row
+#
+# Frames & glyphs are SDL surfaces blitted to the window surface, standing in for klibs'
+# OpenGL textures, which the dummy driver doesn't provide.
+#
+# The trial_prep & present_* cases repeat the calls NP_IOR's methods of those names make
+# into the project's modules, as the methods themselves need klibs' runtime.
+#
+# Usage: python benchmarks/suite.py [--only name ...] [--save] [--baseline path]
+#                                   [--threshold 0.25] [--update-baseline]
+#
+# Results are written to benchmarks/results/<time>.json with --save. When a baseline exists
+# (benchmarks/results/baseline.json unless given), any benchmark slower than it by more
+# than the threshold (a fraction) fails the run with exit status 1. --update-baseline
+# makes this run the baseline.
+
+import os
+import sys
+import json
+import time
+import random
+import timeit
+import sqlite3
+import argparse
+import platform
+import tempfile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import sdl2
+
+from trial_space import legal_trials, display_domains, build_block, PRACTICE_TRIALS
+from trial_store import TrialStore
+from trial_geometry import GeometryTable, trial_type
+from trial_record import build_row
+from ring_layout import RingLayout, ring_rotation
+from display_cache import DisplayCache
+from glyph_atlas import GlyphAtlas
+from frame_timing import FrameTimer
+from live_stats import LiveStats
+from session_log import SessionLog
+from trial_writer import TrialWriter
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SCHEMA = os.path.join(ROOT, 'ExpAssets', 'Config', 'NP_IOR_schema.sql')
+
+SCREEN = (1920, 1080)
+CENTRE = (960, 540)
+# Pixels for 1 degree of visual angle at a typical lab viewing distance & 1080p display
+PX_PER_DEG = 40
+
+
+class Surface(object):
+    # A filled SDL surface, sized like NumpySurface
+
+    def __init__(self, width, height, colour):
+        self.width, self.height = width, height
+        self.ptr = sdl2.SDL_CreateRGBSurfaceWithFormat(0, width, height, 32, sdl2.SDL_PIXELFORMAT_RGBA32)
+        sdl2.SDL_FillRect(self.ptr, None, colour)
+
+
+class Session(object):
+    # The state NP_IOR.setup() leaves behind, built from the project's own modules
+
+    def __init__(self, workdir):
+        self.window = sdl2.SDL_CreateWindow(b"NP_IOR bench", 0, 0, SCREEN[0], SCREEN[1], sdl2.SDL_WINDOW_HIDDEN)
+        self.screen = sdl2.SDL_GetWindowSurface(self.window)
+
+        self.layout = RingLayout(CENTRE, 4, [2.8 * PX_PER_DEG], rotation=ring_rotation('square', 4))
+        self.far_locs = self.layout.locs(self.layout.far_ids)
+        self.probe_locs = self.layout.locs(self.layout.far_ids + self.layout.near_ids)
+        self.cog_locs = self.layout.cog_locs()
+        self.space = legal_trials(display_domains(self.layout.far_ids, self.layout.near_ids))
+        self.schedule = build_block(self.space, 288, random.Random(1))
+
+        self.geometry = GeometryTable(self.layout.distances(), self.cog_locs)
+        self.geometry.prebuild(self.schedule)
+
+        size = int(2 * (self.layout.extent() + 1.8 * PX_PER_DEG))
+        self.frames = DisplayCache(lambda key: Surface(size, size, 0xff202020 if key is None else 0xff404040))
+        self.frames.prebuild([None] + sorted(self.space.item_pairs()))
+        self.frame_size = size
+
+        self.glyphs = GlyphAtlas(lambda g: Surface(14 * len(g), 23, 0xffffffff), '0123456789', ['WRONG'])
+        self.frame_timer = FrameTimer(60, lambda: sdl2.SDL_UpdateWindowSurface(self.window))
+        self.live_stats = LiveStats()
+        self.session_log = SessionLog(
+            os.path.join(workdir, 'bench.npsl'), 1, 4, 60, self.probe_locs,
+            dict(zip(range(8), [self.probe_locs[i][1] for i in sorted(self.probe_locs)]))
+        )
+
+        db_path = os.path.join(workdir, 'bench.db')
+        conn = sqlite3.connect(db_path)
+        conn.executescript(open(SCHEMA).read())
+        conn.close()
+        self.writer = TrialWriter(db_path)
+
+    def blit(self, s, registration=5, location=CENTRE):
+        # registration 5 centres s on location, 7 puts its top-left corner there
+        if registration == 5:
+            location = (location[0] - s.width // 2, location[1] - s.height // 2)
+        sdl2.SDL_BlitSurface(s.ptr, None, self.screen, sdl2.SDL_Rect(location[0], location[1], 0, 0))
+
+    def close(self):
+        self.writer.close()
+        self.session_log.close()
+        sdl2.SDL_DestroyWindow(self.window)
+
+
+def cases(session):
+    rng = random.Random(2)
+    trials = [tuple(t) for t in session.schedule]
+    counter = [0]
+
+    def next_trial():
+        counter[0] = (counter[0] + 1) % len(trials)
+        return trials[counter[0]]
+
+    def setup_trial_space():
+        space = legal_trials(display_domains(session.layout.far_ids, session.layout.near_ids))
+        r = random.Random(1)
+        return [build_block(space, PRACTICE_TRIALS, r), build_block(space, 288, r)]
+
+    factorial = TrialStore.product(session.layout.far_ids, session.layout.far_ids + session.layout.near_ids)
+
+    def setup_legal_check():
+        return factorial.filter(session.space.legal(factorial))
+
+    def trial_prep():
+        key = next_trial()
+        far_or_near, prime_t, prime_d, probe_t, probe_d = key
+        session.far_locs[prime_t], session.far_locs[prime_d]
+        session.probe_locs[probe_t], session.probe_locs[probe_d]
+        session.geometry[key]
+        session.frames.prefetch([(prime_t, prime_d), (probe_t, probe_d)])
+        session.session_log.trial(1, False, key)
+
+    def determine_trial_type():
+        return trial_type(*next_trial(), cog_locs=session.cog_locs)
+
+    def present_empty_array():
+        sdl2.SDL_FillRect(session.screen, None, 0)
+        session.blit(session.frames[None])
+        session.frame_timer.flip('array')
+
+    def present_filled_array():
+        key = next_trial()
+        sdl2.SDL_FillRect(session.screen, None, 0)
+        session.blit(session.frames[(key[1], key[2])])
+        session.frame_timer.flip('prime')
+
+    def present_feedback():
+        lines = [str(rng.randint(250, 900)), 'WRONG' if rng.random() < 0.1 else str(rng.randint(250, 900))]
+        sdl2.SDL_FillRect(session.screen, None, 0)
+        session.glyphs.blit_lines(lines, CENTRE, session.blit)
+        session.frame_timer.flip('feedback')
+
+    def trial_row():
+        key = next_trial()
+        labels = tuple(session.probe_locs[loc][1] for loc in key[1:])
+        row = build_row(1, counter[0] + 1, False, key[0], session.geometry[key], labels,
+                        (labels[0], 400.0 + counter[0] % 100), (labels[3], 450.0))
+        session.live_stats.update(row)
+        return row
+
+    rows = []
+    for _ in range(session.writer.batch_size):
+        row = trial_row()
+        row['participant_id'] = 1
+        rows.append(row)
+
+    def writer_insert():
+        session.writer.insert(rows[counter[0] % len(rows)])
+        next_trial()
+
+    def writer_flush():
+        for row in rows:
+            session.writer.insert(row)
+        session.writer.flush()
+
+    return [
+        ('setup_trial_space', setup_trial_space, 1),
+        ('setup_legal_check', setup_legal_check, 1),
+        ('trial_prep', trial_prep, 1),
+        ('determine_trial_type', determine_trial_type, 1),
+        ('present_empty_array', present_empty_array, 1),
+        ('present_filled_array', present_filled_array, 1),
+        ('present_feedback', present_feedback, 1),
+        ('trial_row', trial_row, 1),
+        ('writer_insert', writer_insert, 1),
+        ('writer_flush', writer_flush, len(rows)),
+    ]
+
+
+def measure(fn, per_call, repeat=7, target=0.1):
+    # Median & min time per operation (us) over repeat runs of about target seconds each
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= target / 10 or number >= 1 << 20:
+            break
+        number *= 4
+    number = max(1, int(number * target / max(elapsed, 1e-9)))
+
+    times = sorted(t / number / per_call * 1e6 for t in timeit.repeat(fn, number=number, repeat=repeat))
+    return {'median_us': times[len(times) // 2], 'min_us': times[0]}
+
+
+def compare(results, baseline, threshold):
+    # Returns the names of benchmarks slower than baseline by more than threshold
+    print("{0:22} {1:>12} {2:>12} {3:>9}".format('benchmark', 'median us', 'baseline us', 'change'))
+    slower = []
+    for name, result in results.items():
+        base = baseline.get(name) if baseline else None
+        if base is None:
+            print("{0:22} {1:12.3f} {2:>12} {3:>9}".format(name, result['median_us'], '-', '-'))
+            continue
+        change = result['median_us'] / base['median_us'] - 1
+        flag = ''
+        if change > threshold:
+            slower.append(name)
+            flag = '  SLOWER'
+        print("{0:22} {1:12.3f} {2:12.3f} {3:+8.1%}{4}".format(name, result['median_us'], base['median_us'], change, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NP_IOR hot-path micro-benchmarks")
+    parser.add_argument('--only', nargs='+')
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--baseline', default=os.path.join(RESULTS_DIR, 'baseline.json'))
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    if sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO) != 0:
+        sys.exit("SDL_Init failed: {0}".format(sdl2.SDL_GetError()))
+
+    workdir = tempfile.mkdtemp()
+    session = Session(workdir)
+    results = {}
+    try:
+        for name, fn, per_call in cases(session):
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(fn, per_call)
+    finally:
+        session.close()
+        sdl2.SDL_Quit()
+        for f in os.listdir(workdir):
+            os.remove(os.path.join(workdir, f))
+        os.rmdir(workdir)
+
+    run = {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    slower = compare(results, baseline, args.threshold)
+
+    if args.save or args.update_baseline:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        paths = [os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')] if args.save else []
+        if args.update_baseline:
+            paths.append(args.baseline)
+        for path in paths:
+            with open(path, 'w') as f:
+                json.dump(run, f, indent=2, sort_keys=True)
+            print("saved {0}".format(path))
+
+    if slower and not args.update_baseline:
+        sys.exit("{0} benchmark(s) more than {1:.0%} slower than baseline: {2}".format(
+            len(slower), args.threshold, ", ".join(slower)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Incremental, columnar counterpart to 'klibs export': writes each participant's trials as
+# a compressed Parquet file, partitioned by condition & participant,
+#
+#   <out_dir>/condition=<condition>/participant=<id>/trials.parquet
+#
+# The participants table doesn't record the condition, so it's told from the participant's
+# prime locations (see trials_schema.condition_case()).
+#
+# Only complete sessions are exported, i.e. those with all of their trials written (the
+# practice block, if run, & trials_per_block x blocks_per_experiment), so one still running
+# is picked up by a later run once it finishes. Exported participants are recorded in
+# <out_dir>/export_state.json: a high-water mark below which every participant has been
+# exported, plus those above it, so repeated runs append new sessions rather than
+# re-exporting everything. An unfinished session holds the mark back until it's exported,
+# e.g. with --include-incomplete once data collection is over. A participant with no trials
+# at all is never exported (or recorded), even then, so is picked up once trials arrive.
+#
+# As with the .txt export, participant info columns are joined onto each trial row,
+# honouring exclude_data_cols & append_info_cols from NP_IOR_params.py. Requires pyarrow.
+#
+#   python columnar_export.py ExpAssets/NP_IOR.db ExpAssets/Data/columnar [--include-incomplete]
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+
+from trials_schema import is_typed, condition_case, table_columns
+from atomic_file import atomic_write
+from trial_space import PRACTICE_TRIALS
+from ring_layout import CONDITIONS
+
+PARAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ExpAssets', 'Config', 'NP_IOR_params.py')
+STATE_FILE = 'export_state.json'
+
+
+def load_params(path=PARAMS):
+    params = {}
+    exec(compile(open(path).read(), path, 'exec'), params)
+    return params
+
+
+def export(db_path, out_dir, params_path=PARAMS, compression='zstd', include_incomplete=False):
+    # Returns the ids of the participants exported by this run, & of those left for a later
+    # run as their sessions aren't complete
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Columnar export requires pyarrow (pip install pyarrow)")
+
+    params = load_params(params_path)
+    exclude = set(params.get('exclude_data_cols', []))
+    append = [c for c in params.get('append_info_cols', []) if c not in exclude]
+    session_trials = expected_trials(params)
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    state = _read_state(out_dir)
+    done = set(state['exported'])
+
+    conn = sqlite3.connect(db_path)
+    typed = is_typed(conn)
+    trials_source = 'trials_labelled' if typed else 'trials'
+
+    participant_cols = table_columns(conn, 'participants')
+    trial_cols = [c for c in table_columns(conn, trials_source) if c not in exclude and c != 'id']
+    info_cols = [c for c in participant_cols if c not in exclude and c not in append and c != 'id']
+    # Appended info columns are taken from the participants table where present, or from
+    # a session_info table if the database has one
+    session_cols = set(table_columns(conn, 'session_info')) if _has_table(conn, 'session_info') else set()
+    missing = [c for c in append if c not in participant_cols and c not in session_cols]
+    if missing:
+        sys.stderr.write("append_info_cols not found in participants or session_info, so not exported: {0}\n".format(
+            ", ".join(missing)))
+    append = [c for c in append if c not in missing]
+
+    exported, incomplete = [], []
+    ids = [r[0] for r in conn.execute(
+        "SELECT id FROM participants WHERE id > ? ORDER BY id", (state['high_water_mark'],)
+    )]
+
+    for pid in ids:
+        if pid in done:
+            continue
+
+        n_trials = conn.execute("SELECT count(*) FROM trials WHERE participant_id = ?", (pid,)).fetchone()[0]
+        if n_trials == 0 or (n_trials < session_trials and not include_incomplete):
+            incomplete.append(pid)
+            continue
+
+        info = dict(zip(participant_cols, conn.execute("SELECT * FROM participants WHERE id = ?", (pid,)).fetchone()))
+        for col in append:
+            if col not in info:
+                row = conn.execute(
+                    "SELECT {0} FROM session_info WHERE participant_id = ? LIMIT 1".format(col), (pid,)
+                ).fetchone()
+                info[col] = row[0] if row else None
+
+        rows = conn.execute(
+            "SELECT {0} FROM {1} WHERE participant_id = ? ORDER BY id".format(", ".join(trial_cols), trials_source),
+            (pid,)
+        ).fetchall()
+
+        columns = dict((col, [info[col]] * len(rows)) for col in info_cols + append)
+        for i, col in enumerate(trial_cols):
+            columns[col] = [r[i] for r in rows]
+
+        table = pa.table([columns[c] for c in info_cols + trial_cols + append],
+                         names=info_cols + trial_cols + append)
+
+        partition = os.path.join(
+            out_dir, 'condition={0}'.format(participant_condition(conn, pid, typed)), 'participant={0}'.format(pid)
+        )
+
+        with atomic_write(os.path.join(partition, 'trials.parquet'), 'wb') as f:
+            pq.write_table(table, f, compression=compression)
+        exported.append(pid)
+
+        done.add(pid)
+        _write_state(out_dir, _advance(state, done, ids))
+
+    conn.close()
+    return exported, incomplete
+
+
+def expected_trials(params):
+    # Trials in a complete session
+    practice = PRACTICE_TRIALS if params.get('run_practice_blocks', True) else 0
+    return practice + params['trials_per_block'] * params['blocks_per_experiment']
+
+
+def participant_condition(conn, pid, typed):
+    # The condition all of a participant's trials were run in, or 'unknown' if that can't
+    # be told (no trials, or prime locations fitting neither or both)
+    found = [r[0] for r in conn.execute(
+        "SELECT DISTINCT {0} FROM trials WHERE participant_id = ?".format(condition_case('t_prime_loc', typed)), (pid,)
+    )]
+    return CONDITIONS[found[0]] if len(found) == 1 and found[0] >= 0 else 'unknown'
+
+
+def _advance(state, done, ids):
+    # Moves the high-water mark up past the run of exported participants above it
+    mark = state['high_water_mark']
+    for pid in ids:
+        if pid not in done:
+            break
+        mark = pid
+    return {'high_water_mark': mark, 'exported': sorted(p for p in done if p > mark)}
+
+
+def _has_table(conn, name):
+    return conn.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (name,)
+    ).fetchone()[0] > 0
+
+
+def _read_state(out_dir):
+    path = os.path.join(out_dir, STATE_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        state.setdefault('exported', [])
+        return state
+    return {'high_water_mark': 0, 'exported': []}
+
+
+def _write_state(out_dir, state):
+    with atomic_write(os.path.join(out_dir, STATE_FILE)) as f:
+        json.dump(state, f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Incremental, partitioned Parquet export of trials")
+    parser.add_argument('database')
+    parser.add_argument('out_dir')
+    parser.add_argument('--include-incomplete', action='store_true',
+                        help="also export sessions with fewer trials than a complete one")
+    args = parser.parse_args()
+    if not os.path.exists(args.database):
+        parser.error("no such database: {0}".format(args.database))
+
+    ids, incomplete = export(args.database, args.out_dir, include_incomplete=args.include_incomplete)
+    print("Exported {0} participant(s){1}".format(len(ids), ": " + ", ".join(map(str, ids)) if ids else "."))
+    if incomplete:
+        print("Not yet complete, left for a later run: {0}".format(", ".join(map(str, incomplete))))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+import threading
+from collections import OrderedDict
+
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+
+
+class DisplayCache(object):
+    # Holds pre-composited frames, built by calling build(key) the first time each key is
+    # requested. If maxsize is set, the least recently used frame is evicted once the
+    # cache is full; otherwise frames are kept for the whole session.
+    #
+    # Frames that will be needed soon can be handed to prefetch(), which builds them on a
+    # background thread (e.g. while a fixation or feedback screen waits on a key press);
+    # the lookup that follows collects the staged frame rather than building it.
+
+    def __init__(self, build, maxsize=None):
+        self.build = build
+        self.maxsize = maxsize
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+        self._staged = {}
+        self._queue = None
+
+    def __getitem__(self, key):
+        try:
+            frame = self.frames.pop(key)
+            self.hits += 1
+        except KeyError:
+            frame = self._collect(key)
+            if self.maxsize is not None and len(self.frames) >= self.maxsize:
+                self.frames.popitem(last=False)
+
+        # Re-inserting keeps the most recently used frames at the end
+        self.frames[key] = frame
+        return frame
+
+    def __contains__(self, key):
+        return key in self.frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def prebuild(self, keys):
+        for key in keys:
+            if key not in self.frames:
+                self.frames[key] = self.build(key)
+
+    def prefetch(self, keys):
+        for key in keys:
+            if key not in self.frames and key not in self._staged:
+                if self._queue is None:
+                    self._start_worker()
+                # [done, frame, error]
+                staged = [threading.Event(), None, None]
+                self._staged[key] = staged
+                self._queue.put((key, staged))
+
+    def clear(self):
+        self.frames.clear()
+
+    def _collect(self, key):
+        staged = self._staged.pop(key, None)
+        if staged is not None:
+            staged[0].wait()
+            if staged[2] is None:
+                self.prefetched += 1
+                return staged[1]
+
+        # Not prefetched, or building it in the background failed
+        self.misses += 1
+        return self.build(key)
+
+    def _start_worker(self):
+        self._queue = Queue()
+        worker = threading.Thread(target=self._work, name='DisplayCachePrefetch')
+        worker.daemon = True
+        worker.start()
+
+    def _work(self):
+        while True:
+            key, staged = self._queue.get()
+            try:
+                staged[1] = self.build(key)
+            except Exception as e:
+                staged[2] = e
+            staged[0].set()
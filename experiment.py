@@ -2,34 +2,57 @@
 
 __author__ = "Brett Feltmate"
 
+import time
+import random
+
 import klibs
 from klibs import P
-from klibs.KLUtilities import deg_to_px, point_pos, midpoint, smart_sleep, hide_mouse_cursor, line_segment_len
-from klibs.KLUserInterface import ui_request, key_pressed, any_key
+from klibs.KLUtilities import deg_to_px, smart_sleep, hide_mouse_cursor
 from klibs.KLCommunication import message
-from klibs.KLResponseCollectors import ResponseCollector, RC_KEYPRESS, KeyMap, ResponseListener, Response
+from klibs.KLResponseCollectors import ResponseCollector, RC_KEYPRESS, KeyMap
 from klibs.KLGraphics import fill, blit, flip
 from klibs.KLGraphics import KLDraw as kld
+from klibs.KLGraphics.KLNumpySurface import NumpySurface
 from klibs.KLConstants import TK_MS, STROKE_CENTER
-from klibs.KLTrialFactory import BlockIterator, TrialFactory
-from klibs.KLTime import CountDown
 
 import sdl2
 
+from trial_space import legal_trials, display_domains, build_block, load_block, PRACTICE_TRIALS
+from trial_geometry import GeometryTable, trial_type
+from ring_layout import RingLayout, ring_rotation
+from display_cache import DisplayCache
+from glyph_atlas import GlyphAtlas
+from frame_timing import FrameTimer
+from frame_scheduler import VsyncScheduler, measure_refresh
+from key_wait import wait_for_key
+from key_capture import KeyCapture, precise_time
+from trial_writer import TrialWriter
+from schedule_bank import ScheduleBank
+from trials_schema import encode_trial
+from live_stats import LiveStats, stats_path
+from phase_profiler import PhaseProfiler, NullProfiler, profile_path, save_report
+from trial_record import build_row
+from session_log import SessionLog, NullSessionLog, log_path
+
 WHITE = [255, 255, 255, 255]
 GREEN = [0, 255, 0, 255]
 
+# Key of the array frame with no target or distractor present
+EMPTY_ARRAY = None
+
 
 class NP_IOR(klibs.Experiment):
 
     def setup(self):
+        # Per-phase timing of the experiment lifecycle, when enabled (see phase_profiler.py)
+        self.profiler = PhaseProfiler(P.profile_buffer) if P.profile_phases else NullProfiler()
+        setup_phase = self.profiler.begin('setup')
 
         box_size   = deg_to_px(1.8)
         box_thick  = deg_to_px(0.05)
         stim_size  = deg_to_px(0.95)
         stim_thick = deg_to_px(0.1)
         fix_size   = deg_to_px(1)
-        fix_offset = deg_to_px(2.8)
 
         box_stroke = [box_thick, WHITE, STROKE_CENTER]
 
@@ -44,133 +67,234 @@ class NP_IOR(klibs.Experiment):
         self.fixation    = kld.Asterisk(size=fix_size, thickness=stim_thick, fill=WHITE, rotation=rotate, spokes=8)
 
         # Which locations are labelled far or near is dependent on arrangement of display
-        # 'near' locations refer to those that lie at the intersection of 'far' locations
-        if P.condition == 'square':
-            self.far_locs = {
-                1: [point_pos(P.screen_c, amplitude=fix_offset, angle=315, clockwise=True), 'NorthEast'],
-                2: [point_pos(P.screen_c, amplitude=fix_offset, angle=45,  clockwise=True), 'SouthEast'],
-                3: [point_pos(P.screen_c, amplitude=fix_offset, angle=135, clockwise=True), 'SouthWest'],
-                4: [point_pos(P.screen_c, amplitude=fix_offset, angle=225, clockwise=True), 'NorthWest']
-            }
-
-            self.near_locs = {
-                5: [midpoint(self.far_locs[4][0], self.far_locs[1][0]), 'North'],
-                6: [midpoint(self.far_locs[1][0], self.far_locs[2][0]), 'East'],
-                7: [midpoint(self.far_locs[3][0], self.far_locs[2][0]), 'South'],
-                8: [midpoint(self.far_locs[3][0], self.far_locs[4][0]), 'West']
-            }
-
-        else:  # if P.condition == 'diamond'
-            self.far_locs = {
-                1: [point_pos(P.screen_c, amplitude=fix_offset, angle=270, clockwise=True), 'North'],
-                2: [point_pos(P.screen_c, amplitude=fix_offset, angle=0,   clockwise=True), 'East'],
-                3: [point_pos(P.screen_c, amplitude=fix_offset, angle=90,  clockwise=True), 'South'],
-                4: [point_pos(P.screen_c, amplitude=fix_offset, angle=180, clockwise=True), 'West']
-            }
-
-            self.near_locs = {
-                5: [midpoint(self.far_locs[4][0], self.far_locs[1][0]), 'NorthWest'],
-                6: [midpoint(self.far_locs[1][0], self.far_locs[2][0]), 'NorthEast'],
-                7: [midpoint(self.far_locs[3][0], self.far_locs[2][0]), 'SouthEast'],
-                8: [midpoint(self.far_locs[3][0], self.far_locs[4][0]), 'SouthWest']
-            }
+        # 'near' locations refer to those that lie at the intersection of 'far' locations.
+        # By default a single ring of 4 far & 4 near locations (see ring_layout.py).
+        eccentricities = [deg_to_px(deg) for deg in P.array_eccentricities]
+        self.layout = RingLayout(
+            P.screen_c, P.array_locations, eccentricities,
+            rotation=ring_rotation(P.condition, P.array_locations)
+        )
+        self.far_locs = self.layout.locs(self.layout.far_ids)
+        self.near_locs = self.layout.locs(self.layout.near_ids)
+
+        response_labels = ['North', 'NorthEast', 'East', 'SouthEast',
+                           'South', 'SouthWest', 'West', 'NorthWest']
 
         if not P.development_mode:
-            self.keymap = KeyMap(
-                'directional_response',
-                ['North', 'NorthEast', 'East', 'SouthEast',
-                 'South', 'SouthWest', 'West', 'NorthWest'],
-                ['North', 'NorthEast', 'East', 'SouthEast',
-                 'South', 'SouthWest', 'West', 'NorthWest'],
-                [sdl2.SDLK_KP_8, sdl2.SDLK_KP_9, sdl2.SDLK_KP_6, sdl2.SDLK_KP_3,
-                 sdl2.SDLK_KP_2, sdl2.SDLK_KP_1, sdl2.SDLK_KP_4, sdl2.SDLK_KP_7]
-            )
+            response_keys = [sdl2.SDLK_KP_8, sdl2.SDLK_KP_9, sdl2.SDLK_KP_6, sdl2.SDLK_KP_3,
+                             sdl2.SDLK_KP_2, sdl2.SDLK_KP_1, sdl2.SDLK_KP_4, sdl2.SDLK_KP_7]
 
         else:  # Don't have a numpad myself, so I need an alternative when developing
-            self.keymap = KeyMap(
-                'directional_response',
-                ['North', 'NorthEast', 'East', 'SouthEast',
-                 'South', 'SouthWest', 'West', 'NorthWest'],
-                ['North', 'NorthEast', 'East', 'SouthEast',
-                 'South', 'SouthWest', 'West', 'NorthWest'],
-                [sdl2.SDLK_i, sdl2.SDLK_o, sdl2.SDLK_l, sdl2.SDLK_PERIOD,
-                 sdl2.SDLK_COMMA, sdl2.SDLK_m, sdl2.SDLK_j, sdl2.SDLK_u]
-            )
+            response_keys = [sdl2.SDLK_i, sdl2.SDLK_o, sdl2.SDLK_l, sdl2.SDLK_PERIOD,
+                             sdl2.SDLK_COMMA, sdl2.SDLK_m, sdl2.SDLK_j, sdl2.SDLK_u]
+
+        # Responses name the target's location, so every location needs a key of its own
+        unmapped = set(self.layout.labels.values()) - set(response_labels)
+        if unmapped:
+            raise ValueError("No response key for location(s): {0}".format(", ".join(sorted(unmapped))))
+
+        self.keymap = KeyMap('directional_response', response_labels, response_labels, response_keys)
+
+        # Response keys are also timestamped as SDL queues them, so RTs can be measured
+        # from each display's actual onset; events are pumped between the flips of the
+        # prime & probe displays (see present_filled_array()), so that's within about a ms
+        self.response_labels = dict(zip(response_keys, response_labels))
+        self.key_capture = KeyCapture(response_keys)
 
         # Prime items always presented in far locations
         self.prime_locs = self.far_locs.copy()
         # Probe items can be far or near, determined conditionally
         self.probe_locs = dict(self.near_locs.items() + self.far_locs.items())
+        # Maps each pair of prime locations to the near location at their centre of gravity
+        self.cog_locs = self.layout.cog_locs()
+
+        # KLibs auto-generates trials for each product of ind_vars.py, most of which
+        # are 'vestigial' (overlapping Ts & Ds, or probes at the wrong eccentricity).
+        # Rather than pruning those out, each block is filled directly from the
+        # 288 legitimate permutations (see trial_space.py for the constraints).
+        self.insert_practice_block(1, PRACTICE_TRIALS)
 
-        # So, to get a practice block of 25, we first need to generate the full set of 2048
-        # possible permutations, trim that down to the 288 legitimate permutations,
-        # then trim that down to 25...
-        self.insert_practice_block(1, 2048)
+        self.legal_trials = legal_trials(display_domains(self.layout.far_ids, self.layout.near_ids))
 
-        # Because KLibs auto-generates trials for each product of ind_vars.py,
-        # a lot of 'vestigial' trials are generated that we don't want, this sorts
-        # through the trial list and removes those trials.
+        blocks, block_lengths = [], []
         for ind_b, block in enumerate(self.trial_factory.blocks):
-            for trial in block:
-
-                # targets & distractors cannot overlap within a given display
-                if trial[1] == trial[2] or trial[3] == trial[4]:
-
-                    self.trial_factory.blocks[ind_b].remove(trial)
-                    block.i -= 1
-                    block.length = len(block.trials)
-                    continue
-                # For 'near' trials, Ts & Ds cannot appear at 'far' locations
-                if trial[0] == 'near':
-                    if trial[3] < 5 or trial[4] < 5:
-
-                        self.trial_factory.blocks[ind_b].remove(trial)
-                        block.i -= 1
-                        block.length = len(block.trials)
-
-                # Conversely, cannot appear at 'near' locations on 'far' trials
-                else:
-                    if trial[3] > 4 or trial[4] > 4:
-
-                        self.trial_factory.blocks[ind_b].remove(trial)
-                        block.i -= 1
-                        block.length = len(block.trials)
-
-            # We only want 25 trials for practice, this trims the block
-            # to the appropriate length
-            if ind_b == 0:
-                for trial in block:
-                    self.trial_factory.blocks[ind_b].remove(trial)
-                    block.i -= 1
-                    block.length = len(block.trials)
-
-                    if block.length == 25:
-                        break
+            blocks.append(block)
+            if ind_b == 0 and P.run_practice_blocks:
+                block_lengths.append(PRACTICE_TRIALS)
+            else:
+                block_lengths.append(P.trials_per_block)
+
+        # Schedules are drawn from their own seeded generator; each block's trial list is
+        # kept to look ahead to upcoming trials
+        rng = random.Random(P.random_seed)
+        self.schedules = [build_block(self.legal_trials, length, rng) for length in block_lengths]
+
+        for block, schedule in zip(blocks, self.schedules):
+            load_block(block, schedule)
+
+        # When a schedule bank is given, these are replaced by the participant's own
+        # schedules at the first block, once their id is known (see load_banked_schedules())
+        self.banked = False
+
+        # Distances & trial types are fixed once locations are known, so work them out
+        # for every scheduled trial now rather than during each trial_prep()
+        self.trial_geometry = GeometryTable(self.layout.distances(), self.cog_locs)
+        for schedule in self.schedules:
+            self.trial_geometry.prebuild(schedule)
+
+        # Every frame of the prime & probe displays is either the empty array, or the array
+        # with T & D at one of a small set of location pairs, so each is composited once
+        # into a single surface spanning the array & presented with one blit.
+        self.array_size = int(2 * (self.layout.extent() + box_size))
+        self.array_frames = DisplayCache(self.composite_array, maxsize=P.array_cache_size)
+
+        # Render stimuli up front, so frames can be safely composited off the main thread
+        for drawable in (self.placeholder, self.target, self.distractor, self.fixation):
+            drawable.render()
+
+        if P.array_cache_size is None:
+            frames = [EMPTY_ARRAY] + sorted(self.legal_trials.item_pairs())
+            if P.deferred_startup:
+                # Composited on the prefetch thread while demographics & instructions are up,
+                # rather than before the first screen (a frame wanted sooner is waited on)
+                self.array_frames.prefetch(frames)
+            else:
+                self.array_frames.prebuild(frames)
+
+        # When set, responses come from a simulated participant, pressing the response keys
+        # for the collectors, and all other waits & intervals are skipped, so whole
+        # sessions run headless
+        self.participant = None
+        if P.simulated_participant is not None:
+            from simulated_participant import load_participant, KeyPresser
+            self.participant = load_participant(P.simulated_participant, seed=P.random_seed)
+            self.key_presser = KeyPresser(
+                dict((label, key) for key, label in self.response_labels.items()), precise_time
+            )
+            self.trials_run = 0
+            self.session_start = time.time()
+
+        # Trial & frame timing rows are queued & committed in batches on a background thread,
+        # rather than written inside the trial loop; see flushes in block() & trial_clean_up()
+        self.writer = TrialWriter(P.database_path, batch_size=P.trial_write_batch)
+        # If the database has been migrated to the typed trials layout, rows are encoded to match
+        transforms = {'trials': encode_trial} if P.typed_trials else None
+        self.writer.intercept(
+            self.db, ['trials', 'frame_timing'], default_table=P.primary_table, transforms=transforms
+        )
+
+        # Running per-condition RT, accuracy & choice summaries, updated from each trial's
+        # row & saved at the end of each block (see live_stats.py)
+        self.live_stats = LiveStats()
+
+        # Rendered text is cached by (text, align, style), and trial feedback is composed from
+        # pre-rendered digits & 'WRONG', keeping font rendering out of the inter-trial path
+        self.text_cache = DisplayCache(self.render_message, maxsize=P.text_cache_size)
+        self.feedback_glyphs = GlyphAtlas(self.render_glyph, '0123456789', ['WRONG'], lazy=P.deferred_startup)
+
+        # Timestamps each flip of the trial displays, to log onset latency & dropped frames
+        self.frame_timer = FrameTimer(P.refresh_rate, flip, clock=precise_time)
+
+        # The 500 & 300ms intervals are held for whole refreshes, each following display being
+        # flipped on the refresh it's due (see frame_scheduler.py); the refresh period is
+        # measured at the first block, until then it's taken from P.refresh_rate
+        self.frame_scheduler = VsyncScheduler(
+            1000.0 / P.refresh_rate, precise_time, pump=sdl2.SDL_PumpEvents, locked=P.vsync_intervals
+        )
+        self.refresh_measured = False
+
+        # Binary log of each trial's parameters, onsets, key presses & responses, from which
+        # the session can be replayed & re-scored (see session_log.py); opened in block(),
+        # once the participant id is known
+        self.session_log = NullSessionLog()
 
         # Set to True once instructions are provided
         self.instructed = False
 
+        self.profiler.end(setup_phase)
+
+        # Lifecycle methods are profiled by wrapping them on the instance, so nothing is
+        # wrapped at all when profiling is off
+        for name in ('block', 'trial_prep', 'trial', 'trial_clean_up', 'give_instructions'):
+            setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+
     def block(self):
+        # Make sure everything from the previous block is on disk
+        self.writer.flush()
+
+        if P.schedule_bank is not None and not self.banked:
+            self.load_banked_schedules()
+
         # Only present instructions the first time.
         if not self.instructed:
             self.instructed = True
             self.give_instructions()
 
+        # Deferred at startup, the feedback glyphs are rendered before the block's first trial
+        self.feedback_glyphs.load()
+
+        if P.session_log and isinstance(self.session_log, NullSessionLog):
+            self.session_log = SessionLog(
+                log_path(P.participant_id), P.participant_id, P.array_locations, P.refresh_rate,
+                self.probe_locs, self.response_labels
+            )
+
         # Inform as to block progress
         if P.practicing:
-            msg = message("PRACTICE ROUND\n\nPress '5' to begin...", blit_txt=False)
+            msg = self.cached_message("PRACTICE ROUND\n\nPress '5' to begin...")
 
         else:
-            msg = message("TESTING ROUND\n\nPress '5' to begin...", blit_txt=False)
+            msg = self.cached_message("TESTING ROUND\n\nPress '5' to begin...")
 
-        fill()
-        blit(msg, location=P.screen_c, registration=5)
-        flip()
+        def present_msg():
+            fill()
+            blit(msg, location=P.screen_c, registration=5)
+            flip()
+
+        present_msg()
+
+        # Time the refresh period over a second's worth of flips of the first block's message
+        if P.vsync_intervals and self.participant is None and not self.refresh_measured:
+            self.set_refresh(measure_refresh(present_msg, precise_time, samples=int(P.refresh_rate)))
 
         # Hangs until '5' key
         self.continue_on()
 
 
+    # Swaps the schedules built in setup() for the participant's pre-generated ones from
+    # the schedule bank (see schedule_bank.py), which must match this session's setup.
+    # Participant ids are only unique to a station's database, so banked schedules are
+    # looked up by P.station_id as well.
+    def load_banked_schedules(self):
+        bank = ScheduleBank(P.schedule_bank)
+        key = (P.station_id, P.participant_id)
+        try:
+            if key not in bank:
+                raise ValueError("Participant {0} of station {1} isn't in schedule bank {2}".format(
+                    P.participant_id, P.station_id, P.schedule_bank))
+
+            seed, condition, valid = bank.entry(key)
+            lengths = [len(schedule) for schedule in self.schedules]
+            if condition != P.condition:
+                raise ValueError("Participant {0} of station {1} is banked for the '{2}' condition, not '{3}'".format(
+                    P.participant_id, P.station_id, condition, P.condition))
+            if bank.block_lengths != lengths or bank.practice != P.run_practice_blocks:
+                raise ValueError("Schedule bank blocks {0} don't match the session's {1}".format(bank.block_lengths, lengths))
+            if (bank.far_per_ring, bank.rings) != (P.array_locations, len(P.array_eccentricities)):
+                raise ValueError("Schedule bank was built for a different array")
+            if not valid:
+                print "[BANK] - participant {0} of station {1}'s schedules failed validation when banked".format(
+                    P.participant_id, P.station_id)
+
+            self.schedules = bank.schedules(key)
+        finally:
+            bank.close()
+
+        for block, schedule in zip(self.trial_factory.blocks, self.schedules):
+            load_block(block, schedule)
+            self.trial_geometry.prebuild(schedule)
+        self.banked = True
+
     def setup_response_collector(self):
         self.probe_rc = ResponseCollector(uses=RC_KEYPRESS)
         self.prime_rc = ResponseCollector(uses=RC_KEYPRESS)
@@ -189,128 +313,201 @@ class NP_IOR(klibs.Experiment):
 
     def trial_prep(self):
         # Grab locations (and their cardinal labels) for each T & D
-        self.T_prime_loc = list(self.prime_locs[self.prime_target])
-        self.D_prime_loc = list(self.prime_locs[self.prime_distractor])
-        self.T_probe_loc = list(self.probe_locs[self.probe_target])
-        self.D_probe_loc = list(self.probe_locs[self.probe_distractor])
+        self.T_prime_loc = self.prime_locs[self.prime_target]
+        self.D_prime_loc = self.prime_locs[self.prime_distractor]
+        self.T_probe_loc = self.probe_locs[self.probe_target]
+        self.D_probe_loc = self.probe_locs[self.probe_distractor]
 
-        # Grab distance between each item pair
-        self.T_prime_to_T_probe = line_segment_len(self.T_prime_loc[0], self.T_probe_loc[0])
-        self.T_prime_to_D_probe = line_segment_len(self.T_prime_loc[0], self.D_probe_loc[0])
-        self.D_prime_to_T_probe = line_segment_len(self.D_prime_loc[0], self.T_probe_loc[0])
-        self.D_prime_to_D_probe = line_segment_len(self.D_prime_loc[0], self.D_probe_loc[0])
+        # Grab distance between each item pair & the trial type, precomputed in setup()
+        self.geometry = self.trial_geometry[self.trial_key()]
+        (self.T_prime_to_T_probe, self.T_prime_to_D_probe,
+         self.D_prime_to_T_probe, self.D_prime_to_D_probe,
+         self.trial_type, self.at_cog) = self.geometry
 
-        # Once locations selected, determine which trial type this trial would fall under.
-        self.trial_type = self.determine_trial_type()
+        self.session_log.trial(P.block_number, P.practicing, self.trial_key())
 
         # Hide mouse cursor throughout trial
         hide_mouse_cursor()
 
+        # Have this trial's frames ready before the fixation's key press (a no-op if they
+        # were composited at setup or prefetched during the previous trial's feedback)
+        self.prefetch_frames(self.trial_key())
+
         # Present fixation & start trial
         self.present_fixation()
 
     def trial(self):
         hide_mouse_cursor()
 
-        # Begin with empty array...
-        self.present_empty_array()
-
-        smart_sleep(500)
+        self.frame_timer.reset()
+        self.frame_scheduler.reset()
 
-        # 500ms later present prime array & record response
-        self.prime_rc.collect()
+        # Begin with empty array...
+        phase = self.profiler.begin('empty_array')
+        self.present_empty_array('array')
 
-        # If response, log, otherwise NA
-        response_prime, rt_prime = 'NA', 'NA'
+        self.interval(500, 'array', 'prime')
+        self.profiler.end(phase)
 
-        if len(self.prime_rc.keypress_listener.response()):
-            response_prime, rt_prime = self.prime_rc.keypress_listener.response()
+        # 500ms later present prime array & record response (if none, NA)
+        phase = self.profiler.begin('prime_collect')
+        self.frame_timer.start('prime')
+        response_prime, rt_prime = self.collect_response(self.prime_rc, 'prime', self.T_prime_loc, self.D_prime_loc)
+        self.session_log.response('prime', response_prime, rt_prime)
+        self.profiler.end(phase)
 
         # Reset to empty array following response
-        self.present_empty_array()
+        phase = self.profiler.begin('isi')
+        self.present_empty_array('isi')
 
-        smart_sleep(300)
+        self.interval(300, 'isi', 'probe')
+        self.profiler.end(phase)
 
         # 300ms later present probe array
-        self.probe_rc.collect()
-
-        response_probe, rt_probe = 'NA', 'NA'
-
-        if len(self.probe_rc.keypress_listener.response()):
-            response_probe, rt_probe = self.probe_rc.keypress_listener.response()
+        phase = self.profiler.begin('probe_collect')
+        self.frame_timer.start('probe')
+        response_probe, rt_probe = self.collect_response(self.probe_rc, 'probe', self.T_probe_loc, self.D_probe_loc)
+        self.session_log.response('probe', response_probe, rt_probe)
+        self.profiler.end(phase)
 
         # Determine accuracy of responses (i.e., whether target selected)
         prime_correct = response_prime == self.T_prime_loc[1]
         probe_correct = response_probe == self.T_probe_loc[1]
 
+        # Build the next trial's frames in the background while feedback is up
+        phase = self.profiler.begin('feedback')
+        next_trial = self.upcoming_trial()
+        if next_trial is not None:
+            self.prefetch_frames(next_trial)
+
         # Present feedback on performance (mean RT for correct, 'WRONG' for incorrect)
         self.present_feedback(prime_correct, rt_prime, probe_correct, rt_probe)
+        self.profiler.end(phase)
 
-        prime_choice, probe_choice = 'NA', 'NA'
+        # Scored as the session log replay scores it (see trial_record.py)
+        labels = (self.T_prime_loc[1], self.D_prime_loc[1], self.T_probe_loc[1], self.D_probe_loc[1])
+        row = build_row(P.block_number, P.trial_number, P.practicing, self.far_or_near, self.geometry,
+                        labels, (response_prime, rt_prime), (response_probe, rt_probe))
 
-        if response_prime == self.T_prime_loc[1]:
-            prime_choice = 'target'
-        elif response_prime == self.D_prime_loc[1]:
-            prime_choice = 'distractor'
-        else:
-            prime_choice = "empty_cell"
+        self.live_stats.update(row)
 
-        if response_probe == self.T_probe_loc[1]:
-            probe_choice = 'target'
-        elif response_probe == self.D_probe_loc[1]:
-            probe_choice = 'distractor'
-        else:
-            probe_choice = "empty_cell"
-
-        return {
-            "block_num":            P.block_number,
-            "trial_num":            P.trial_number,
-            "practicing":           str(P.practicing),
-            "far_near":             self.far_or_near,
-            'trial_type':           self.trial_type,
-            'prime_rt':             rt_prime,
-            'probe_rt':             rt_probe,
-            'prime_correct':        str(prime_correct),
-            'probe_correct':        str(probe_correct),
-            't_prime_to_t_probe':   self.T_prime_to_T_probe,
-            't_prime_to_d_probe':   self.T_prime_to_D_probe,
-            'd_prime_to_t_probe':   self.D_prime_to_T_probe,
-            'd_prime_to_d_probe':   self.D_prime_to_D_probe,
-            'prime_choice':         prime_choice,
-            'probe_choice':         probe_choice,
-            'prime_response':       response_prime,
-            'probe_response':       response_probe,
-            't_prime_loc':          self.T_prime_loc[1],
-            'd_prime_loc':          self.D_prime_loc[1],
-            't_probe_loc':          self.T_probe_loc[1],
-            'd_probe_loc':          self.D_probe_loc[1]
-        }
+        return row
+
+    # Returns the (response, rt) made to a display, or ('NA', 'NA') if none was made
+    def collect_response(self, rc, display, t_loc, d_loc):
+        if self.participant is not None:
+            # The simulated response's key is pressed once the display is up (see KeyPresser)
+            labels = [value[1] for value in self.probe_locs.values()]
+            response, rt = self.participant.respond(display, t_loc[1], d_loc[1], labels)
+            if response != 'NA':
+                self.key_presser.press(response, lambda: self.frame_timer.onset(display), rt)
+
+        rc.collect()
+
+        if self.participant is not None:
+            self.key_presser.join()
+
+        if not len(rc.keypress_listener.response()):
+            return 'NA', 'NA'
+
+        response, rt = rc.keypress_listener.response()
+
+        # Prefer the RT from the captured key press & the display's measured onset,
+        # falling back on the collector's own if the press wasn't captured
+        onset = self.frame_timer.onset(display)
+        press = self.key_capture.first_press(onset) if onset is not None else None
+        if press is not None and self.response_labels[press[0]] == response:
+            rt = (press[1] - onset) * 1000.0
+
+        return response, rt
+
+    def save_live_stats(self):
+        self.live_stats.save(stats_path(P.participant_id))
+
+    # Holds display on screen for ms before next_display is presented. When vsync-locked,
+    # returns a refresh ahead of the one next_display is due on, leaving time to start its
+    # collector & draw it. Intervals are skipped entirely when simulating a participant.
+    def interval(self, ms, display, next_display):
+        if self.participant is None:
+            self.frame_scheduler.hold(next_display, self.frame_timer.onset(display), ms)
+            if self.frame_scheduler.locked:
+                self.frame_scheduler.wait(next_display, early=self.frame_scheduler.frame_ms)
+            else:
+                smart_sleep(ms)
+        self.session_log.interval_end(display, precise_time(), ms)
+
+    def set_refresh(self, frame_ms):
+        # A period far from the nominal one means flips aren't synced to the display, in
+        # which case there's nothing to lock to & P.refresh_rate is kept
+        nominal = 1000.0 / P.refresh_rate
+        if abs(frame_ms - nominal) > nominal * 0.25:
+            print "[VSYNC] - measured refresh {0:.2f}ms, expected {1:.2f}ms; is vsync on? using {1:.2f}ms".format(
+                frame_ms, nominal
+            )
+            frame_ms = nominal
+
+        self.frame_scheduler.frame_ms = frame_ms
+        self.frame_timer.frame_ms = frame_ms
+        self.refresh_measured = True
 
     def trial_clean_up(self):
+        # Log when each of the trial's displays actually reached the screen
+        for row in self.frame_timer.rows():
+            row.update(self.frame_scheduler.timing(row['display'], self.frame_timer.onset(row['display'])))
+            row.update({
+                'participant_id': P.participant_id,
+                'block_num':      P.block_number,
+                'trial_num':      P.trial_number
+            })
+            self.db.insert(row, table='frame_timing')
+
+        # Log the onsets, & every response key pressed from the array's onset on
+        for display in self.frame_timer.order:
+            self.session_log.onset(display, self.frame_timer.onset(display))
+        array_onset = self.frame_timer.onset('array')
+        if array_onset is not None:
+            for key, t in list(self.key_capture.presses):
+                if t >= array_onset:
+                    self.session_log.key(key, t)
+        self.session_log.flush()
+
+        # Save running summaries once the block's last trial is done
+        if self.upcoming_trial() is None:
+            self.save_live_stats()
+
+        if self.participant is not None:
+            self.trials_run += 1
+            return
 
         # Provide break 1/2 through experimental block
         if P.trial_number == P.trials_per_block / 2:
             txt = "You're 1/2 through, take a break if you like\nand press '5' when you're ready to continue"
-            msg = message(txt, blit_txt=False)
+            msg = self.cached_message(txt)
 
             fill()
             blit(msg, location=P.screen_c, registration=5)
             flip()
 
-            while True:
-                if key_pressed(key=sdl2.SDLK_KP_5):
-                    break
+            # Commit the first half of the block while the participant rests
+            self.writer.flush()
+
+            self.save_live_stats()
+            print "[STATS] - block {0}, first half:\n{1}".format(
+                P.block_number, self.live_stats.report(P.block_number, P.practicing)
+            )
+
+            wait_for_key([sdl2.SDLK_KP_5])
 
     # When called, hangs until appropriate key is depressed
     def continue_on(self):
-        while True:
-            if not P.development_mode:
-                if key_pressed(key=sdl2.SDLK_KP_5):
-                    break
+        if self.participant is not None:
+            return
 
-            else:
-                if key_pressed(key=sdl2.SDLK_k):
-                    break
+        if not P.development_mode:
+            wait_for_key([sdl2.SDLK_KP_5])
+
+        else:
+            wait_for_key([sdl2.SDLK_k])
 
     def present_fixation(self):
         fill()
@@ -324,94 +521,105 @@ class NP_IOR(klibs.Experiment):
         prime_fb = int(prime_rt) if prime_correct else 'WRONG'
         probe_fb = int(probe_rt) if probe_correct else 'WRONG'
 
-        fb_txt = "{0}\n{1}".format(prime_fb, probe_fb)
-
-        fb = message(fb_txt, align='center', blit_txt=False)
-
+        # Composed from pre-rendered glyphs, so no text is rendered between trials
         fill()
-        blit(fb, location=P.screen_c, registration=5)
+        self.feedback_glyphs.blit_lines([str(prime_fb), str(probe_fb)], P.screen_c, blit)
         flip()
+        self.session_log.onset('feedback', precise_time())
 
-        while True:
-            if key_pressed(key=sdl2.SDLK_SPACE):
-                break
+        if self.participant is None:
+            wait_for_key([sdl2.SDLK_SPACE])
 
+    def prefetch_frames(self, trial):
+        far_or_near, prime_t, prime_d, probe_t, probe_d = trial
+        self.array_frames.prefetch([(prime_t, prime_d), (probe_t, probe_d)])
 
+    # Best guess at the next trial, from the block schedules built in setup() (if
+    # klibs recycles a trial, the guess is simply wrong & that frame is built on use)
+    def upcoming_trial(self):
+        schedule = self.schedules[P.block_number - 1] if P.block_number <= len(self.schedules) else []
+        return schedule[P.trial_number] if P.trial_number < len(schedule) else None
 
-    def present_empty_array(self):
-        fill()
-        for value in self.probe_locs.values():
-            blit(self.placeholder, registration=5, location=value[0])
-        blit(self.fixation, location=P.screen_c, registration=5)
-        flip()
+    # Equivalent to message(text, blit_txt=False, ...), reusing previously rendered surfaces
+    def cached_message(self, text, align=None, style=None):
+        return self.text_cache[(text, align, style)]
 
-    def present_filled_array(self, display):
+    def render_message(self, key):
+        text, align, style = key
+        kwargs = dict((k, v) for k, v in (('align', align), ('style', style)) if v is not None)
+        return message(text, blit_txt=False, **kwargs)
+
+    def render_glyph(self, glyph):
+        return message(glyph, align='center', blit_txt=False)
+
+    def present_empty_array(self, display='array'):
         fill()
-        for value in self.probe_locs.values():
-            blit(self.placeholder, registration=5, location=value[0])
+        blit(self.array_frames[EMPTY_ARRAY], location=P.screen_c, registration=5)
+        self.frame_timer.flip(display)
 
+    def present_filled_array(self, display):
         if display == 'prime':
-            blit(self.target, registration=5, location=self.T_prime_loc[0])
-            blit(self.distractor, registration=5, location=self.D_prime_loc[0])
+            frame = self.array_frames[(self.prime_target, self.prime_distractor)]
         else:
-            blit(self.target, registration=5, location=self.T_probe_loc[0])
-            blit(self.distractor, registration=5, location=self.D_probe_loc[0])
+            frame = self.array_frames[(self.probe_target, self.probe_distractor)]
 
-        blit(self.fixation, location=P.screen_c, registration=5)
-        flip()
-
-
-    def determine_trial_type(self):
-
-        if self.far_or_near == 'far':
+        fill()
+        blit(frame, location=P.screen_c, registration=5)
+        if self.frame_timer.current == display:
+            # Events are pumped up to the next refresh, rather than once a frame by the
+            # collector, so key presses are timestamped within about a ms of being made
+            self.frame_scheduler.idle(self.frame_timer.last_flip())
+        else:
+            # The first frame of a held display is flipped just ahead of the refresh it's due on
+            self.frame_scheduler.wait(display)
+        self.frame_timer.flip(display)
 
-            if (self.T_prime_loc, self.D_prime_loc) == (self.T_probe_loc, self.D_probe_loc):
-                return 'repeat'
+    # Draws placeholders & fixation, plus T & D if given an item_locs pair of
+    # (target, distractor) location indices, onto a single surface centred on fixation
+    def composite_array(self, item_locs):
+        centre = (self.array_size // 2, self.array_size // 2)
+        offset = (P.screen_c[0] - centre[0], P.screen_c[1] - centre[1])
 
-            elif (self.T_prime_loc, self.D_prime_loc) == (self.D_probe_loc, self.T_probe_loc):
-                return 'switch'
+        def local(pos):
+            return (pos[0] - offset[0], pos[1] - offset[1])
 
-            elif (self.T_prime_loc != self.T_probe_loc) and (self.D_prime_loc != self.D_probe_loc) and \
-                 (self.T_prime_loc != self.D_probe_loc) and (self.D_prime_loc != self.T_probe_loc):
-                return 'control-far'
+        frame = NumpySurface(width=self.array_size, height=self.array_size)
 
-            elif (self.T_prime_loc == self.T_probe_loc) and (self.D_prime_loc != self.D_probe_loc):
-                return 'T.to.T-far'
+        for value in self.probe_locs.values():
+            frame.blit(self.placeholder, registration=5, location=local(value[0]))
 
-            elif (self.D_prime_loc == self.D_probe_loc) and (self.T_prime_loc != self.T_probe_loc):
-                return 'D.to.D-far'
+        if item_locs is not EMPTY_ARRAY:
+            t_loc, d_loc = item_locs
+            frame.blit(self.target, registration=5, location=local(self.probe_locs[t_loc][0]))
+            frame.blit(self.distractor, registration=5, location=local(self.probe_locs[d_loc][0]))
 
-            elif (self.D_probe_loc == self.T_prime_loc) and (self.T_probe_loc != self.D_prime_loc):
-                return 'D.to.T-far'
+        frame.blit(self.fixation, registration=5, location=centre)
 
-            elif (self.T_probe_loc == self.D_prime_loc) and (self.D_probe_loc != self.T_prime_loc):
-                return 'T.to.D-far'
+        return frame.render()
 
-            else:
-                print "[FAR] - unanticipated display arrangement / trial type for trial {0}".format(P.trial_number)
-                return 'erroneous'
 
-        else:
+    def trial_key(self):
+        return (self.far_or_near, self.prime_target, self.prime_distractor,
+                self.probe_target, self.probe_distractor)
 
-            if self.T_probe_loc[0] == midpoint(self.T_prime_loc[0], self.D_prime_loc[0]):
-                return 'T.at.CoG-near'
+    def determine_trial_type(self):
+        label = trial_type(*self.trial_key(), cog_locs=self.cog_locs)
 
-            elif self.D_probe_loc[0] == midpoint(self.T_prime_loc[0], self.D_prime_loc[0]):
-                return 'D.at.CoG-near'
+        if label == 'erroneous':
+            print "[FAR] - unanticipated display arrangement / trial type for trial {0}".format(P.trial_number)
 
-            else:
-                return 'control-near'
+        return label
 
     def give_instructions(self):
         button_map = {
-            'North':     message("8", align='center', blit_txt=False, style='greentext'),
-            'East':      message("6", align='center', blit_txt=False, style='greentext'),
-            'South':     message("2", align='center', blit_txt=False, style='greentext'),
-            'West':      message("4", align='center', blit_txt=False, style='greentext'),
-            'NorthEast': message("9", align='center', blit_txt=False, style='greentext'),
-            'NorthWest': message("7", align='center', blit_txt=False, style='greentext'),
-            'SouthWest': message("1", align='center', blit_txt=False, style='greentext'),
-            'SouthEast': message("3", align='center', blit_txt=False, style='greentext')
+            'North':     self.cached_message("8", align='center', style='greentext'),
+            'East':      self.cached_message("6", align='center', style='greentext'),
+            'South':     self.cached_message("2", align='center', style='greentext'),
+            'West':      self.cached_message("4", align='center', style='greentext'),
+            'NorthEast': self.cached_message("9", align='center', style='greentext'),
+            'NorthWest': self.cached_message("7", align='center', style='greentext'),
+            'SouthWest': self.cached_message("1", align='center', style='greentext'),
+            'SouthEast': self.cached_message("3", align='center', style='greentext')
         }
 
 
@@ -421,7 +629,7 @@ class NP_IOR(klibs.Experiment):
                "while ignoring the distractor '+'."
                "\n\n(press the '5' on the numpad to continue past each message)")
 
-        instruction_msg = message(txt, align='center', blit_txt=False)
+        instruction_msg = self.cached_message(txt, align='center')
 
 
         fill()
@@ -434,7 +642,7 @@ class NP_IOR(klibs.Experiment):
                "you may begin the trial by pressing the '5' key on the numpad.\n"
                "Shortly after which an array will appear")
 
-        instruction_msg = message(txt, align='center', blit_txt=False)
+        instruction_msg = self.cached_message(txt, align='center')
 
         fill()
         blit(instruction_msg, location=(P.screen_c[0], int(P.screen_c[1] * 0.3)), registration=5)
@@ -455,7 +663,7 @@ class NP_IOR(klibs.Experiment):
         txt = ("Shortly after the array appears, both the target 'o' and distractor '+'\n"
                "will appear in random locations within the array...")
 
-        instruction_msg = message(txt, align='center', blit_txt=False)
+        instruction_msg = self.cached_message(txt, align='center')
 
         t_loc = self.prime_locs[1][0]
         d_loc = self.prime_locs[3][0]
@@ -476,7 +684,7 @@ class NP_IOR(klibs.Experiment):
                "Each trial will actually consist of two displays, each requiring their own response,\n"
                "one after the other")
 
-        instruction_msg = message(txt, align='center', blit_txt=False)
+        instruction_msg = self.cached_message(txt, align='center')
 
         fill()
         blit(instruction_msg, location=(P.screen_c[0], int(P.screen_c[1] * 0.3)), registration=5)
@@ -495,7 +703,7 @@ class NP_IOR(klibs.Experiment):
                "in the first and second display, respectively.\n"
                "Please press spacebar to skip past the feedback display")
 
-        instruction_msg = message(txt, align='center', blit_txt=False)
+        instruction_msg = self.cached_message(txt, align='center')
 
         fill()
         blit(instruction_msg, location=P.screen_c, registration=5)
@@ -504,27 +712,25 @@ class NP_IOR(klibs.Experiment):
         self.continue_on()
 
         txt = "For correct responses, your reaction time will be provided to you."
-        fb_txt = "360\n412"
+        fb_lines = ['360', '412']
 
-        instruction_msg = message(txt, align='center', blit_txt=False)
-        fb_msg = message(fb_txt, align='center', blit_txt=False)
+        instruction_msg = self.cached_message(txt, align='center')
 
         fill()
         blit(instruction_msg, location=(P.screen_c[0], int(P.screen_c[1] * 0.3)), registration=5)
-        blit(fb_msg, location=P.screen_c, registration=5)
+        self.feedback_glyphs.blit_lines(fb_lines, P.screen_c, blit)
         flip()
 
         self.continue_on()
 
         txt = "For incorrect responses, your reaction time will be replaced by the word WRONG."
-        fb_txt = "323\nWRONG"
+        fb_lines = ['323', 'WRONG']
 
-        instruction_msg = message(txt, align='center', blit_txt=False)
-        fb_msg = message(fb_txt, align='center', blit_txt=False)
+        instruction_msg = self.cached_message(txt, align='center')
 
         fill()
         blit(instruction_msg, location=(P.screen_c[0], int(P.screen_c[1] * 0.3)), registration=5)
-        blit(fb_msg, location=P.screen_c, registration=5)
+        self.feedback_glyphs.blit_lines(fb_lines, P.screen_c, blit)
         flip()
 
         self.continue_on()
@@ -534,7 +740,7 @@ class NP_IOR(klibs.Experiment):
                         "The experiment will begin with a short practice round to familiarize you with the task\n\n"
                         "When you're ready, press the '5' key to begin...")
 
-        continue_msg = message(continue_txt, align='center', blit_txt=False)
+        continue_msg = self.cached_message(continue_txt, align='center')
 
 
         fill()
@@ -544,4 +750,19 @@ class NP_IOR(klibs.Experiment):
         self.continue_on()
 
     def clean_up(self):
-        pass
+        self.save_live_stats()
+
+        if P.profile_phases:
+            report = self.profiler.report()
+            save_report(report, profile_path(P.participant_id))
+            print "[PROFILE] - lifecycle phase timings:\n{0}".format(report)
+
+        self.key_capture.close()
+        self.writer.close()
+        self.session_log.close()
+
+        if self.participant is not None:
+            elapsed = time.time() - self.session_start
+            print "[SIM] - {0} trials in {1:.2f}s ({2:.1f} trials/s), choices: {3}".format(
+                self.trials_run, elapsed, self.trials_run / max(elapsed, 1e-6), self.participant.choices
+            )
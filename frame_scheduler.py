@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+import time
+
+
+def measure_refresh(present, clock, samples=60, warmup=5):
+    # Median interval (ms) between the returns of successive calls to present(), which
+    # should draw a frame & flip it; with vsync on, each flip returns on a display refresh
+    stamps = []
+    for _ in range(warmup + samples + 1):
+        present()
+        stamps.append(clock())
+    stamps = stamps[warmup:]
+    intervals = sorted((b - a) * 1000.0 for a, b in zip(stamps, stamps[1:]))
+    return intervals[len(intervals) // 2]
+
+
+class VsyncScheduler(object):
+    # Turns the intervals between displays into whole numbers of display refreshes & holds
+    # each following display for the refresh it's due on. hold() sets a display's deadline
+    # from the onset of the display before it; wait() then returns just ahead of that
+    # refresh, so the following flip (which blocks until the next vsync) lands on it,
+    # rather than on whichever refresh follows a sleep & a draw.
+    #
+    # Events are pumped while waiting, & by idle() between the flips of a display held on
+    # screen, so key presses are queued (& timestamped by KeyCapture) within about a ms of
+    # being made. When not locked, deadlines are recorded but never waited on, leaving the
+    # intervals to the caller's sleep, so the two can be compared.
+
+    def __init__(self, frame_ms, clock, pump=None, locked=True, sleep=time.sleep):
+        self.frame_ms = frame_ms
+        self.locked = locked
+        self._clock = clock
+        self._pump = pump
+        self._sleep = sleep
+        self.reset()
+
+    def reset(self):
+        # Called at the start of each trial
+        # {display: [deadline, requested ms, refreshes, onset of the display before it]}
+        self.deadlines = {}
+
+    def frames(self, ms):
+        return max(1, int(round(ms / self.frame_ms)))
+
+    def hold(self, display, after_onset, ms):
+        # display is due ms (to the nearest refresh) after the onset of the display before it
+        n = self.frames(ms)
+        self.deadlines[display] = [after_onset + n * self.frame_ms / 1000.0, ms, n, after_onset]
+
+    def wait(self, display, early=0.0):
+        # Returns half a refresh (plus early, in ms) ahead of display's deadline, or at
+        # once if it has none or the scheduler isn't locked
+        if not self.locked or display not in self.deadlines:
+            return
+        self._pump_until(self.deadlines[display][0] - (self.frame_ms / 2.0 + early) / 1000.0)
+
+    def idle(self, last_flip, early=3.0):
+        # Between the flips of a display already on screen, pumps events until early ms
+        # before the next refresh after last_flip. SDL only queues key presses (& so
+        # KeyCapture only stamps them) when events are pumped, which would otherwise be
+        # once per frame, after each flip.
+        if self._pump is not None:
+            self._pump_until(last_flip + (self.frame_ms - early) / 1000.0)
+
+    def _pump_until(self, until):
+        while True:
+            if self._pump is not None:
+                self._pump()
+            remaining = until - self._clock()
+            if remaining <= 0:
+                return
+            # Sleep in short slices while there's time, then spin the last couple of ms
+            if remaining > 0.002:
+                self._sleep(min(remaining - 0.002, 0.001))
+
+    def timing(self, display, onset):
+        # Requested & achieved time (ms) from the onset of the display before it to the
+        # display's onset, or None for both if it wasn't held
+        deadline = self.deadlines.get(display)
+        if deadline is None or onset is None:
+            return {'requested_soa': None, 'achieved_soa': None}
+        return {'requested_soa': float(deadline[1]), 'achieved_soa': (onset - deadline[3]) * 1000.0}
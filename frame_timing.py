@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+from timeit import default_timer
+
+
+class FrameTimer(object):
+    # Wraps the display flip, timestamping each one to record, per display (e.g. 'prime'),
+    # how long it took to reach the screen & how many refreshes were missed between
+    # consecutive flips. Bookkeeping is a handful of arithmetic ops per flip, so it can
+    # stay on for production sessions.
+
+    def __init__(self, refresh_rate, flip, clock=default_timer):
+        self.frame_ms = 1000.0 / refresh_rate
+        self._flip = flip
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        # Called at the start of each trial
+        self.displays = {}
+        self.order = []
+        self.current = None
+        self.started = None
+
+    def start(self, display):
+        # Marks when a display was requested (e.g. just before a ResponseCollector's collect()),
+        # so its onset latency covers everything up to the end of its first flip
+        self.started = self._clock()
+
+    def flip(self, display):
+        before = self._clock()
+        self._flip()
+        after = self._clock()
+
+        if display != self.current:
+            start = self.started if self.started is not None else before
+            # [start, first flip start, first flip end, last flip end, flips, dropped, max interval]
+            self.displays[display] = [start, before, after, after, 1, 0, 0.0]
+            self.order.append(display)
+            self.current = display
+            self.started = None
+            return
+
+        record = self.displays[display]
+        interval = (after - record[3]) * 1000.0
+        missed = int(interval / self.frame_ms + 0.5) - 1
+
+        record[3] = after
+        record[4] += 1
+        if missed > 0:
+            record[5] += missed
+        if interval > record[6]:
+            record[6] = interval
+
+    def last_flip(self):
+        # When the latest flip finished, on the timer's clock
+        record = self.displays.get(self.current)
+        return record[3] if record is not None else None
+
+    def onset(self, display):
+        # When the display's first frame finished flipping, on the timer's clock
+        record = self.displays.get(display)
+        return record[2] if record is not None else None
+
+    def rows(self):
+        for display in self.order:
+            start, first_before, first_after, last_after, flips, dropped, max_interval = self.displays[display]
+            yield {
+                'display':           display,
+                'onset_latency':     (first_after - start) * 1000.0,
+                'flip_duration':     (first_after - first_before) * 1000.0,
+                'flips':             flips,
+                'dropped_frames':    dropped,
+                'max_flip_interval': max_interval
+            }
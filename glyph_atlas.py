@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+
+def surface_size(surface):
+    # (width, height) of a rendered surface, whether a NumpySurface or a bare pixel array
+    if hasattr(surface, 'width'):
+        return surface.width, surface.height
+    return surface.shape[1], surface.shape[0]
+
+
+class GlyphAtlas(object):
+    # Pre-rendered glyphs (plus whole-word tokens, e.g. 'WRONG') from which short, centred
+    # lines of text are composed at display time by blitting, without rasterizing any text.
+    # If lazy, nothing is rendered until load() is called, or the atlas is first used.
+
+    def __init__(self, render, glyphs, tokens=(), line_spacing=0.25, lazy=False):
+        self.render = render
+        self.glyphs = list(glyphs) + list(tokens)
+        self.tokens = set(tokens)
+        self.line_spacing = line_spacing
+        self.surfaces = None
+        self.line_height = None
+
+        if not lazy:
+            self.load()
+
+    def load(self):
+        if self.surfaces is None:
+            self.surfaces = dict((g, self.render(g)) for g in self.glyphs)
+            self.line_height = max(surface_size(s)[1] for s in self.surfaces.values())
+
+    def layout(self, line):
+        # Surfaces making up a line, with their x offsets from its left edge, & its width
+        self.load()
+        parts = [line] if line in self.tokens else list(line)
+
+        placed, x = [], 0
+        for part in parts:
+            surface = self.surfaces[part]
+            placed.append((surface, x))
+            x += surface_size(surface)[0]
+
+        return placed, x
+
+    def blit_lines(self, lines, centre, blit):
+        # Draws lines stacked vertically & each centred horizontally on centre
+        self.load()
+        step = int(self.line_height * (1 + self.line_spacing))
+        top = centre[1] - (step * (len(lines) - 1) + self.line_height) // 2
+
+        for i, line in enumerate(lines):
+            placed, width = self.layout(line)
+            left = centre[0] - width // 2
+            for surface, x in placed:
+                blit(surface, registration=7, location=(left + x, top + i * step))
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+from collections import deque
+
+import sdl2
+
+_FREQ = float(sdl2.SDL_GetPerformanceFrequency())
+
+
+def precise_time():
+    # Seconds on SDL's high-resolution performance counter
+    return sdl2.SDL_GetPerformanceCounter() / _FREQ
+
+
+class KeyCapture(object):
+    # Timestamps presses of the given keys on the performance counter at the moment SDL
+    # queues them, using an event watch, rather than when the render loop next gets round
+    # to reading the queue. Presses are kept in a small ring buffer; first_press() finds
+    # the first one at or after a given time (e.g. a display's measured onset).
+    #
+    # SDL only queues the OS's key events when events are pumped on the main thread, so a
+    # stamp is only as fine as the pumping: once per frame if the render loop just flips &
+    # polls. The trial displays pump every ms or so between flips (VsyncScheduler.wait() &
+    # idle()), which bounds the error at about a ms plus the OS's own input latency.
+
+    def __init__(self, keys, capacity=64):
+        self.keys = set(keys)
+        self.presses = deque(maxlen=capacity)
+
+        # The ctypes callback must be kept referenced for as long as the watch is installed
+        self._watch = sdl2.SDL_EventFilter(self._on_event)
+        sdl2.SDL_AddEventWatch(self._watch, None)
+
+    def _on_event(self, userdata, event):
+        e = event.contents
+        if e.type == sdl2.SDL_KEYDOWN and not e.key.repeat and e.key.keysym.sym in self.keys:
+            self.presses.append((e.key.keysym.sym, precise_time()))
+        return 0
+
+    def first_press(self, since):
+        for press in list(self.presses):
+            if press[1] >= since:
+                return press
+        return None
+
+    def close(self):
+        sdl2.SDL_DelEventWatch(self._watch, None)
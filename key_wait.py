@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+from ctypes import byref
+
+import sdl2
+from klibs.KLUserInterface import ui_request
+
+# Longest the process sleeps on the event queue before waking to check the overall timeout
+WAIT_SLICE_MS = 50
+
+
+def wait_for_key(keys, timeout=None):
+    # Blocks on the SDL event queue until one of keys is pressed, returning that key,
+    # or None if timeout (ms) elapses first. Unlike polling key_pressed() in a loop,
+    # the process sleeps between events, leaving the CPU idle on waiting screens.
+    # Quit/calibrate requests are still serviced through ui_request().
+    if timeout is not None:
+        deadline = sdl2.SDL_GetTicks() + timeout
+
+    event = sdl2.SDL_Event()
+
+    while True:
+        slice_ms = WAIT_SLICE_MS
+        if timeout is not None:
+            remaining = deadline - sdl2.SDL_GetTicks()
+            if remaining <= 0:
+                return None
+            slice_ms = min(slice_ms, remaining)
+
+        if not sdl2.SDL_WaitEventTimeout(byref(event), slice_ms):
+            continue
+
+        if event.type == sdl2.SDL_KEYDOWN:
+            keysym = event.key.keysym
+            ui_request(keysym)
+
+            if keysym.sym in keys:
+                return keysym.sym
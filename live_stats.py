@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Running per-condition summaries of a session, updated from each row returned by
+# NP_IOR.trial() in constant time, so performance can be checked mid-session (e.g. at the
+# half-way break, or by an operator) without querying the database. Cells are kept per
+# block, trial_type & far_near; each holds, for the prime & probe displays, a running
+# (Welford) mean & variance of correct RTs, the number correct & a tally of choices.
+#
+# Saved as JSON at the end of each block, so the summaries survive an aborted session.
+# To view a saved file:
+#
+#   python live_stats.py ExpAssets/Data/live_stats/p1_stats.json
+
+import os
+import sys
+import json
+import math
+
+from trials_schema import CHOICES
+from atomic_file import atomic_write
+
+STATS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ExpAssets', 'Data', 'live_stats')
+DISPLAYS = ('prime', 'probe')
+
+
+class RunningStat(object):
+    # Welford's online mean & variance
+
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other):
+        # Combines two sets of observations (Chan et al.'s parallel update)
+        if not other.n:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else float('nan')
+
+    @property
+    def sd(self):
+        return math.sqrt(self.variance)
+
+    def copy(self):
+        return RunningStat(self.n, self.mean, self.m2)
+
+
+class Cell(object):
+
+    def __init__(self):
+        self.trials = 0
+        self.rt = dict((d, RunningStat()) for d in DISPLAYS)
+        self.correct = dict((d, 0) for d in DISPLAYS)
+        self.choices = dict((d, dict((c, 0) for c in CHOICES)) for d in DISPLAYS)
+
+    def add(self, row):
+        self.trials += 1
+        for display in DISPLAYS:
+            choice = row[display + '_choice']
+            if choice in self.choices[display]:
+                self.choices[display][choice] += 1
+
+            if str(row[display + '_correct']) == 'True':
+                self.correct[display] += 1
+                rt = row[display + '_rt']
+                if rt != 'NA' and rt is not None:
+                    self.rt[display].add(float(rt))
+
+    def merge(self, other):
+        self.trials += other.trials
+        for display in DISPLAYS:
+            self.rt[display].merge(other.rt[display])
+            self.correct[display] += other.correct[display]
+            for choice, count in other.choices[display].items():
+                self.choices[display][choice] += count
+
+    def summary(self):
+        out = {'trials': self.trials}
+        for display in DISPLAYS:
+            rt = self.rt[display]
+            out[display] = {
+                'rt_mean':  rt.mean if rt.n else float('nan'),
+                'rt_sd':    rt.sd,
+                'rt_n':     rt.n,
+                'accuracy': self.correct[display] / float(self.trials),
+                'choice_rates': dict(
+                    (c, n / float(self.trials)) for c, n in self.choices[display].items()
+                )
+            }
+        return out
+
+    def to_dict(self):
+        return {
+            'trials':  self.trials,
+            'rt':      dict((d, [s.n, s.mean, s.m2]) for d, s in self.rt.items()),
+            'correct': self.correct,
+            'choices': self.choices
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        cell = cls()
+        cell.trials = d['trials']
+        cell.rt = dict((k, RunningStat(*v)) for k, v in d['rt'].items())
+        cell.correct = d['correct']
+        cell.choices = d['choices']
+        return cell
+
+
+class LiveStats(object):
+
+    def __init__(self):
+        # {(block_num, practicing, trial_type, far_near): Cell}
+        self.cells = {}
+
+    def update(self, row):
+        key = (row['block_num'], str(row['practicing']) == 'True', row['trial_type'], row['far_near'])
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = Cell()
+        cell.add(row)
+
+    def cell(self, trial_type, far_near, block=None, practicing=False):
+        # Combined cell across blocks (or for one block), or None if no trials are in it
+        combined = None
+        for (b, p, t, f), cell in self.cells.items():
+            if (t, f) != (trial_type, far_near) or p != practicing or (block is not None and b != block):
+                continue
+            if combined is None:
+                combined = Cell()
+            combined.merge(cell)
+        return combined
+
+    def summary(self, block=None, practicing=False):
+        # {(trial_type, far_near): summary dict}
+        conditions = set((t, f) for (b, p, t, f) in self.cells
+                         if p == practicing and (block is None or b == block))
+        return dict(
+            (cond, self.cell(cond[0], cond[1], block, practicing).summary()) for cond in conditions
+        )
+
+    def report(self, block=None, practicing=False):
+        lines = ["{0:<15} {1:<5} {2:>5}  {3:>8} {4:>7} {5:>6}  {6:>8} {7:>7} {8:>6} {9:>6}".format(
+            'trial_type', 'f/n', 'N', 'prime_rt', 'sd', 'acc', 'probe_rt', 'sd', 'acc', 'D-rate'
+        )]
+        for (trial_type, far_near), s in sorted(self.summary(block, practicing).items()):
+            prime, probe = s['prime'], s['probe']
+            lines.append(
+                "{0:<15} {1:<5} {2:>5}  {3:>8.1f} {4:>7.1f} {5:>6.3f}  {6:>8.1f} {7:>7.1f} {8:>6.3f} {9:>6.3f}".format(
+                    trial_type, far_near, s['trials'], prime['rt_mean'], prime['rt_sd'], prime['accuracy'],
+                    probe['rt_mean'], probe['rt_sd'], probe['accuracy'], probe['choice_rates']['distractor']
+                )
+            )
+        return "\n".join(lines)
+
+    def save(self, path):
+        state = [list(key) + [cell.to_dict()] for key, cell in sorted(self.cells.items())]
+        with atomic_write(path) as f:
+            json.dump(state, f)
+
+    @classmethod
+    def load(cls, path):
+        stats = cls()
+        with open(path) as f:
+            for block, practicing, trial_type, far_near, cell in json.load(f):
+                stats.cells[(block, practicing, trial_type, far_near)] = Cell.from_dict(cell)
+        return stats
+
+
+def stats_path(participant_id, stats_dir=STATS_DIR):
+    return os.path.join(stats_dir, 'p{0}_stats.json'.format(participant_id))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit("usage: python live_stats.py <stats.json>")
+
+    stats = LiveStats.load(sys.argv[1])
+    blocks = sorted(set((b, p) for (b, p, _, _) in stats.cells))
+    for block, practicing in blocks:
+        print("Block {0}{1}".format(block, " (practice)" if practicing else ""))
+        print(stats.report(block, practicing))
+        print("")
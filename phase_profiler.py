@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Wall time, CPU time & allocations for each phase of the experiment lifecycle (setup,
+# trial_prep, the parts of trial()...), recorded into preallocated arrays used as a ring
+# buffer, so memory use is fixed however long the session & only the most recent `capacity`
+# phases are kept. report() gives percentiles of each, to find what overruns the trial's intervals.
+#
+# When profiling is off, NullProfiler stands in: its begin() & end() do nothing, & wrap()
+# returns methods untouched, so lifecycle methods pay nothing at all.
+
+import os
+import gc
+import sys
+import time
+from array import array
+from timeit import default_timer
+
+from atomic_file import atomic_write
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ExpAssets', 'Data', 'profiles')
+
+# CPU time of this process
+cpu_time = getattr(time, 'process_time', None) or time.clock
+
+# Blocks currently allocated by the interpreter (Python 3), or else the net number of
+# container objects allocated since the last collection (so negative across a collection)
+allocated = getattr(sys, 'getallocatedblocks', None) or (lambda: gc.get_count()[0])
+
+
+class PhaseProfiler(object):
+
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.count = 0
+        self.names = []
+        self._ids = {}
+
+        self._phase = array('H', [0]) * capacity
+        self._wall = array('d', [0.0]) * capacity
+        self._cpu = array('d', [0.0]) * capacity
+        self._allocs = array('l', [0]) * capacity
+
+    def begin(self, name):
+        # Wall time is read last, & first in end(), to keep bookkeeping out of the phase
+        return name, allocated(), cpu_time(), default_timer()
+
+    def end(self, token):
+        wall = default_timer()
+        cpu = cpu_time()
+        allocs = allocated()
+        name, allocs_0, cpu_0, wall_0 = token
+
+        phase = self._ids.get(name)
+        if phase is None:
+            phase = self._ids[name] = len(self.names)
+            self.names.append(name)
+
+        i = self.count % self.capacity
+        self._phase[i] = phase
+        self._wall[i] = (wall - wall_0) * 1000.0
+        self._cpu[i] = (cpu - cpu_0) * 1000.0
+        self._allocs[i] = allocs - allocs_0
+        self.count += 1
+
+    def wrap(self, name, method):
+        def profiled(*args, **kwargs):
+            token = self.begin(name)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.end(token)
+        return profiled
+
+    def samples(self):
+        # {phase: ([wall ms], [cpu ms], [allocs])} over the phases still in the buffer
+        out = dict((name, ([], [], [])) for name in self.names)
+        for i in range(min(self.count, self.capacity)):
+            wall, cpu, allocs = out[self.names[self._phase[i]]]
+            wall.append(self._wall[i])
+            cpu.append(self._cpu[i])
+            allocs.append(self._allocs[i])
+        return out
+
+    def report(self):
+        lines = ["{0:<18} {1:>6}  {2:>8} {3:>8} {4:>8} {5:>8}  {6:>7} {7:>7}  {8:>9} {9:>9}".format(
+            'phase (ms)', 'N', 'wall p50', 'p90', 'p99', 'max', 'cpu p50', 'p99', 'alloc p50', 'p99'
+        )]
+        if self.count > self.capacity:
+            lines.append("(last {0} of {1} phases)".format(self.capacity, self.count))
+
+        samples = self.samples()
+        for name in self.names:
+            wall, cpu, allocs = (sorted(s) for s in samples[name])
+            if not wall:
+                continue
+            lines.append("{0:<18} {1:>6}  {2:>8.2f} {3:>8.2f} {4:>8.2f} {5:>8.2f}  {6:>7.2f} {7:>7.2f}  {8:>9} {9:>9}".format(
+                name, len(wall), percentile(wall, 50), percentile(wall, 90), percentile(wall, 99), wall[-1],
+                percentile(cpu, 50), percentile(cpu, 99), percentile(allocs, 50), percentile(allocs, 99)
+            ))
+        return "\n".join(lines)
+
+
+class NullProfiler(object):
+
+    count = 0
+
+    def begin(self, name):
+        return None
+
+    def end(self, token):
+        pass
+
+    def wrap(self, name, method):
+        return method
+
+    def report(self):
+        return ""
+
+
+def percentile(ordered, p):
+    # Nearest-rank percentile of an already sorted list
+    rank = max(1, int(-(-p * len(ordered) // 100)))
+    return ordered[rank - 1]
+
+
+def profile_path(participant_id, profile_dir=PROFILE_DIR):
+    return os.path.join(profile_dir, 'p{0}_phases.txt'.format(participant_id))
+
+
+def save_report(report, path):
+    with atomic_write(path) as f:
+        f.write(report + "\n")
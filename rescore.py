@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Re-scores trials already in the database with the current classification & scoring rules
+# (trial_type() / classify() in trial_geometry.py, choice() & correctness in
+# trial_record.py), e.g. after a rule is revised. The stored location labels & responses
+# are read in chunks, mapped back to location numbers, re-scored with NumPy & any rows
+# whose trial_type, choices or correctness (and distances, if --radius is given) differ are
+# written back. Works on both the text & typed trials layouts.
+#
+#   python rescore.py ExpAssets/NP_IOR.db [--radius px] [--chunk 5000] [--dry-run]
+#
+# Each chunk is committed in one transaction together with the id of its last trial, in
+# the rescore_progress table, so an interrupted run picks up after the last committed
+# chunk when started again. Runs are keyed by the rules' source files & the options given,
+# so changing a rule starts a fresh pass over every trial.
+#
+# Labels are mapped to location numbers through the 4-location layout of each condition;
+# a trial's condition follows from its prime locations (always far: diagonal points for
+# 'square', cardinal points for 'diamond'). Trials whose labels fit neither are left alone.
+
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+
+import numpy as np
+
+from trials_schema import FAR_NEAR, TRIAL_TYPES, CHOICES, LOCATIONS, is_typed
+from trial_geometry import GeometryTable, classify
+from ring_layout import RingLayout, ring_rotation, CONDITIONS
+
+_here = os.path.dirname(os.path.abspath(__file__))
+RULE_SOURCES = [os.path.join(_here, name) for name in ('trial_geometry.py', 'trial_record.py', 'rescore.py')]
+
+PROGRESS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rescore_progress (
+    run text primary key not null,
+    last_id integer not null,
+    scanned integer not null,
+    updated integer not null,
+    started text not null,
+    finished text
+);
+"""
+
+LOC_COLS = ('t_prime_loc', 'd_prime_loc', 't_probe_loc', 'd_probe_loc', 'prime_response', 'probe_response')
+DIST_COLS = ('t_prime_to_t_probe', 't_prime_to_d_probe', 'd_prime_to_t_probe', 'd_prime_to_d_probe')
+
+# Columns of each chunk, as numbers: id, far/near, the location & response label codes
+# (-1 for none or unknown), then the stored trial type, choices & correctness, then distances
+_ID, _FN = 0, 1
+_LOCS = slice(2, 8)
+_TYPE, _PCHOICE, _QCHOICE, _PCORRECT, _QCORRECT = range(8, 13)
+_DIST = slice(13, 17)
+
+
+def run_key(radius):
+    digest = hashlib.sha1()
+    digest.update(repr(radius).encode('utf-8'))
+    for path in RULE_SOURCES:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _case(col, labels):
+    return "CASE {0} {1} ELSE -1 END".format(col, " ".join("WHEN '{0}' THEN {1}".format(l, i) for i, l in enumerate(labels)))
+
+
+def _select(typed):
+    # Every column as a number, 0-based codes, whichever layout the database uses
+    if typed:
+        cols = ["far_near - 1"] + ["coalesce({0} - 1, -1)".format(c) for c in LOC_COLS] + [
+            "trial_type - 1", "prime_choice - 1", "probe_choice - 1", "prime_correct", "probe_correct"]
+    else:
+        cols = [_case('far_near', FAR_NEAR)] + [_case(c, LOCATIONS) for c in LOC_COLS] + [
+            _case('trial_type', TRIAL_TYPES), _case('prime_choice', CHOICES), _case('probe_choice', CHOICES),
+            "prime_correct = 'True'", "probe_correct = 'True'"]
+    cols += ["CAST({0} AS REAL)".format(c) for c in DIST_COLS]
+    return "SELECT id, {0} FROM trials WHERE id > ? ORDER BY id LIMIT ?".format(", ".join(cols))
+
+
+class Rescorer(object):
+    # Label code -> location number for each condition, & the centre of gravity & distance
+    # matrices over location numbers
+
+    def __init__(self, radius=None):
+        self.radius = radius
+        self.location = np.zeros((len(CONDITIONS), len(LOCATIONS)), dtype=np.intp)
+        self.far = np.zeros((len(CONDITIONS), len(LOCATIONS)), dtype=bool)
+        distances = []
+
+        for c, condition in enumerate(CONDITIONS):
+            layout = RingLayout((0, 0), 4, [radius or 100.0], rotation=ring_rotation(condition, 4))
+            for loc, label in layout.labels.items():
+                self.location[c, LOCATIONS.index(label)] = loc
+                self.far[c, LOCATIONS.index(label)] = loc in layout.far_ids
+            distances.append(layout.distances())
+
+        # Location numbering, & so the centre of gravity of each pair, is the same in both
+        self.cog = GeometryTable(distances[-1], layout.cog_locs()).cog
+        self.distances = np.stack(distances)
+
+    def score(self, data):
+        # Re-scored (trial type, prime choice, probe choice, prime correct, probe correct,
+        # distances) codes for each row of a chunk, plus the mask of rows that could be scored
+        labels = data[:, _LOCS].astype(np.intp)
+        t_prime, d_prime, t_probe, d_probe, prime_resp, probe_resp = labels.T
+
+        # Prime items are always far, which only one condition's layout allows
+        condition = np.where(self.far[0, t_prime.clip(0)], 0, 1)
+        scorable = (labels[:, :4] >= 0).all(axis=1) & (data[:, _FN] >= 0)
+        scorable &= self.far[condition, t_prime.clip(0)] & self.far[condition, d_prime.clip(0)]
+
+        locs = self.location[condition[:, None], labels[:, :4].clip(0)]
+        trials = np.column_stack([data[:, _FN].astype(np.intp).clip(0), locs])
+        trial_type = classify(trials, self.cog)
+
+        def choice(response, target, distractor):
+            return np.where(response == target, CHOICES.index('target'),
+                            np.where(response == distractor, CHOICES.index('distractor'), CHOICES.index('empty_cell')))
+
+        t_p, d_p, t_q, d_q = locs.T
+        dist = self.distances
+        distances = np.column_stack([
+            dist[condition, t_p, t_q], dist[condition, t_p, d_q], dist[condition, d_p, t_q], dist[condition, d_p, d_q]
+        ])
+        return (trial_type, choice(prime_resp, t_prime, d_prime), choice(probe_resp, t_probe, d_probe),
+                prime_resp == t_prime, probe_resp == t_probe, distances), scorable
+
+
+def _values(typed, new, rows, radius):
+    # Rows of UPDATE parameters for the changed rows, in the database's layout
+    trial_type, prime_choice, probe_choice, prime_correct, probe_correct, distances = [np.asarray(a)[rows] for a in new]
+    params = []
+    for i in range(len(trial_type)):
+        if typed:
+            values = [int(trial_type[i]) + 1, int(prime_choice[i]) + 1, int(probe_choice[i]) + 1,
+                      int(prime_correct[i]), int(probe_correct[i])]
+        else:
+            values = [TRIAL_TYPES[trial_type[i]], CHOICES[prime_choice[i]], CHOICES[probe_choice[i]],
+                      str(bool(prime_correct[i])), str(bool(probe_correct[i]))]
+        if radius is not None:
+            values += [float(d) for d in distances[i]]
+        params.append(values)
+    return params
+
+
+def rescore(db_path, radius=None, chunk_size=5000, dry_run=False, restart=False, report=None):
+    # Returns {'scanned', 'updated', 'skipped', 'changed': {column: count}} for this run
+    conn = sqlite3.connect(db_path)
+    conn.isolation_level = None
+    typed = is_typed(conn)
+
+    key = run_key(radius)
+    progress_q = "SELECT last_id, finished FROM rescore_progress WHERE run = ?"
+    if dry_run:
+        # Nothing is written, not even the progress table; scans from where this run would
+        # carry on from (or the first trial, with restart)
+        has_progress = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rescore_progress'").fetchone()
+        progress = conn.execute(progress_q, (key,)).fetchone() if has_progress and not restart else None
+    else:
+        conn.executescript(PROGRESS_SCHEMA)
+        if restart:
+            conn.execute("DELETE FROM rescore_progress WHERE run = ?", (key,))
+        progress = conn.execute(progress_q, (key,)).fetchone()
+        if progress is None:
+            conn.execute("INSERT INTO rescore_progress VALUES (?, 0, 0, 0, ?, NULL)", (key, time.strftime('%Y-%m-%d %H:%M:%S')))
+    last_id = progress[0] if progress else 0
+
+    rescorer = Rescorer(radius)
+    query = _select(typed)
+    cols = ['trial_type', 'prime_choice', 'probe_choice', 'prime_correct', 'probe_correct']
+    update = "UPDATE trials SET {0} WHERE id = ?".format(
+        ", ".join("{0} = ?".format(c) for c in cols + (list(DIST_COLS) if radius is not None else [])))
+
+    # Names of the comparisons in differs below, in order
+    names = cols + (['distances'] if radius is not None else [])
+    stats = {'scanned': 0, 'updated': 0, 'skipped': 0, 'changed': dict.fromkeys(names, 0)}
+    try:
+        while True:
+            rows = conn.execute(query, (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            data = np.array(rows, dtype=float)
+            new, scorable = rescorer.score(data)
+
+            differs = [
+                new[0] != data[:, _TYPE], new[1] != data[:, _PCHOICE], new[2] != data[:, _QCHOICE],
+                new[3] != (data[:, _PCORRECT] == 1), new[4] != (data[:, _QCORRECT] == 1),
+            ]
+            if radius is not None:
+                differs.append(~np.isclose(new[5], data[:, _DIST], atol=1e-6).all(axis=1))
+            for col, d in zip(names, differs):
+                stats['changed'][col] += int((d & scorable).sum())
+            changed = np.flatnonzero(np.any(differs, axis=0) & scorable)
+
+            last_id = int(data[-1, _ID])
+            stats['scanned'] += len(rows)
+            stats['skipped'] += int((~scorable).sum())
+            stats['updated'] += len(changed)
+
+            if not dry_run:
+                params = _values(typed, new, changed, radius)
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany(update, [p + [int(data[i, _ID])] for p, i in zip(params, changed)])
+                    conn.execute(
+                        "UPDATE rescore_progress SET last_id = ?, scanned = scanned + ?, updated = updated + ? WHERE run = ?",
+                        (last_id, len(rows), len(changed), key)
+                    )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+
+            if report is not None:
+                report(stats, last_id)
+
+        if not dry_run:
+            conn.execute("UPDATE rescore_progress SET finished = ? WHERE run = ?", (time.strftime('%Y-%m-%d %H:%M:%S'), key))
+    finally:
+        conn.close()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Re-score stored trials with the current rules")
+    parser.add_argument('database')
+    parser.add_argument('--radius', type=float,
+                        help="array radius in px on the testing display (deg_to_px(2.8)); distances are re-computed only if given")
+    parser.add_argument('--chunk', type=int, default=5000)
+    parser.add_argument('--dry-run', action='store_true', help="count what would change without writing")
+    parser.add_argument('--restart', action='store_true', help="start this run over from the first trial")
+    args = parser.parse_args()
+    if not os.path.exists(args.database):
+        parser.error("no such database: {0}".format(args.database))
+
+    def progress(stats, last_id):
+        sys.stdout.write("\r{0} trials scanned, {1} updated (last id {2})".format(stats['scanned'], stats['updated'], last_id))
+        sys.stdout.flush()
+
+    stats = rescore(args.database, args.radius, args.chunk, args.dry_run, args.restart, report=progress)
+    print("")
+    print("{0} trials scanned, {1} {2}, {3} skipped (unrecognised labels)".format(
+        stats['scanned'], stats['updated'], "would change" if args.dry_run else "updated", stats['skipped']))
+    for col, n in sorted(stats['changed'].items()):
+        if n:
+            print("  {0}: {1}".format(col, n))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Far & near locations for arrays of any size, laid out on one or more concentric rings.
+# Each ring has n far locations evenly spaced around fixation, and n near locations, each
+# at the centre of gravity (midpoint) of a pair of adjacent far locations.
+#
+# Locations are numbered ring by ring, far before near, so a single ring of 4 gives the
+# original layout: far 1-4, then near 5-8, near n + k lying between far k - 1 & far k.
+# Angles run clockwise from East, as with klibs' point_pos(clockwise=True).
+
+import numpy as np
+
+# Array arrangements, as given by P.condition
+CONDITIONS = ('square', 'diamond')
+
+COMPASS = ('East', 'SouthEast', 'South', 'SouthWest', 'West', 'NorthWest', 'North', 'NorthEast')
+
+
+def compass_label(angle):
+    # Compass name of an angle if it falls on one of the 8 points, otherwise the angle itself
+    angle = round(angle, 6) % 360
+    if angle % 45 == 0:
+        return COMPASS[int(angle // 45)]
+    return '{0:g}deg'.format(angle)
+
+
+def ring_rotation(condition, n):
+    # Angle of the first far location: 'diamond' places one at North, 'square' places
+    # North midway between two (i.e. at a near location), as in the original 4-location arrays
+    return 270.0 + (180.0 / n if condition == 'square' else 0.0)
+
+
+def ring_numbering(n, rings):
+    # Far location numbers of each ring, & {near location: (far, far)} for the pair of
+    # adjacent far locations each near one lies between
+    far = [[2 * n * ring + 1 + k for k in range(n)] for ring in range(rings)]
+    near_pairs = {}
+    for ring in far:
+        for k, loc in enumerate(ring):
+            near_pairs[loc + n] = (ring[k - 1], loc)
+    return far, near_pairs
+
+
+class RingLayout(object):
+
+    def __init__(self, centre, n, radii, rotation=270.0):
+        if n < 3:
+            raise ValueError("A ring needs at least 3 far locations, got {0}".format(n))
+
+        self.n = n
+        self.radii = list(radii)
+        self.centre = centre
+
+        # (rings, n, 2) far positions; every ring shares the same angles
+        step = 360.0 / n
+        far_angles = rotation + step * np.arange(n)
+        radii = np.asarray(self.radii, dtype=float)[:, None]
+
+        far_xy = self._polar(np.broadcast_to(far_angles, (len(self.radii), n)), radii)
+        # Near k lies between far k - 1 & far k
+        near_xy = (far_xy + np.roll(far_xy, 1, axis=1)) / 2.0
+
+        # (locations, 2) positions, ordered by location number
+        self.positions = np.concatenate([far_xy, near_xy], axis=1).reshape(-1, 2)
+        offsets = self.positions - np.asarray(centre, dtype=float)
+        self.angles = np.degrees(np.arctan2(offsets[:, 1], offsets[:, 0])) % 360
+
+        far, self.near_pairs = ring_numbering(n, len(self.radii))
+        self.far_ids = tuple(loc for ring in far for loc in ring)
+        self.near_ids = tuple(loc + n for loc in self.far_ids)
+
+        self.labels = {}
+        for ring in range(len(self.radii)):
+            suffix = '' if ring == 0 else '-{0}'.format(ring + 1)
+            for i in range(2 * n * ring, 2 * n * (ring + 1)):
+                self.labels[i + 1] = compass_label(self.angles[i]) + suffix
+
+    def _polar(self, angles, radii):
+        theta = np.radians(angles)
+        x = self.centre[0] + radii * np.cos(theta)
+        y = self.centre[1] + radii * np.sin(theta)
+        return np.stack([x, y], axis=-1)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def locs(self, ids):
+        # {id: [(x, y), label]}, as used for the prime & probe locations in NP_IOR.setup()
+        return dict(
+            (i, [tuple(int(round(v)) for v in self.positions[i - 1]), self.labels[i]]) for i in ids
+        )
+
+    def cog_locs(self):
+        # Maps each (unordered) pair of adjacent far locations to the near location between them
+        return dict((frozenset(pair), near) for near, pair in self.near_pairs.items())
+
+    def distances(self):
+        # (locations + 1) square matrix of pairwise distances between the (pixel-rounded)
+        # positions items are drawn at, indexed by location number (row & column 0 are unused)
+        xy = np.vstack([np.full((1, 2), np.nan), np.round(self.positions)])
+        return np.sqrt(((xy[:, None, :] - xy[None, :, :]) ** 2).sum(axis=-1))
+
+    def extent(self):
+        # Largest distance of any location from fixation
+        return float(max(self.radii))
+
+
+def prime_labels(condition, n=4):
+    # Labels of a condition's far locations on a single ring of n, where prime items always
+    # appear. With the default 4, 'square' primes sit at the diagonal points & 'diamond' ones
+    # at the cardinal points, so a trial's prime locations show which arrangement it used.
+    layout = RingLayout((0, 0), n, [1.0], rotation=ring_rotation(condition, n))
+    return [layout.labels[loc] for loc in layout.far_ids]
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Pre-generated, validated trial schedules for a whole study, in one file a session loads
+# its schedules from by station & participant id (see P.schedule_bank). Each station keeps
+# its own database (see station_merge.py), so participant ids restart at 1 on every one of
+# them, & entries are keyed on P.station_id as well. Each participant's schedules are
+# built as NP_IOR.setup() builds them, from build_block() & a generator seeded with
+# the participant's own seed, so a bank entry is exactly the session's schedule had it
+# been run with P.random_seed set to that seed. Participants are built & validated in
+# parallel across a process pool:
+#
+#   python schedule_bank.py build ExpAssets/NP_IOR.bank --stations 1-4 --participants 1-100 --seed 2024
+#   python schedule_bank.py validate ExpAssets/NP_IOR.bank
+#   python schedule_bank.py show ExpAssets/NP_IOR.bank 17 --station 2
+#
+# Validation checks each schedule is made of legitimate trials, that every test block's
+# trial_type distribution (as classified by trial_type()) & target locations match those
+# of the full trial space to within a tolerance, and that the practice block is a subset
+# of distinct trials with a mix of far & near trials and trial types. A participant whose
+# schedules fail is redrawn from their next seed; the seed used is kept in the bank.
+#
+# File layout: b'NPSB', uint16 version, uint16 block count, uint32 participant count,
+# uint32 study seed, uint16 far locations per ring, uint16 rings, uint8 practice flag, then
+# uint32 length of each block, then one fixed-size entry per participant (sorted by station,
+# then id): uint16 station, uint32 participant id, uint32 seed, uint8 condition, uint8 valid, then its trials at
+# 5 bytes each (as TrialStore.tobytes() writes them).
+
+import os
+import sys
+import mmap
+import random
+import struct
+import argparse
+from collections import Counter
+from multiprocessing import Pool, cpu_count
+
+from trial_space import TrialSpace, display_domains, build_block, PRACTICE_TRIALS
+from trial_geometry import trial_type
+from ring_layout import ring_numbering, CONDITIONS
+from trial_store import TrialStore, as_store, TRIAL_BYTES
+from atomic_file import atomic_write
+
+MAGIC = b'NPSB'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIIHHB')
+ENTRY = struct.Struct('<HIIBB')
+
+# Default validation criteria; shares are fractions of a block's trials
+CRITERIA = {
+    # Max difference between a test block's share of any trial type, or of trials with the
+    # prime or probe target at any location, & that share across the full trial space
+    'type_tolerance': 0.02,
+    'location_tolerance': 0.02,
+    # Range the practice block's share of far trials must fall in, & the fewest trial
+    # types it must include
+    'practice_far_share': (0.3, 0.7),
+    'practice_min_types': 6,
+    # Seeds tried per participant before their schedules are banked as failing
+    'attempts': 20,
+}
+
+
+def participant_seed(study_seed, participant_id, attempt=0, station=1):
+    return (study_seed * 1000003 + (station - 1) * 2 ** 20 + participant_id + attempt * 7919 * 1000003) % 2 ** 32
+
+
+def study_space(far_per_ring, rings):
+    # The trial space & {frozenset(prime pair): near location} for an array of the given
+    # size, from location numbering alone (rotation doesn't affect either)
+    far, near_pairs = ring_numbering(far_per_ring, rings)
+    far_ids = [loc for ring in far for loc in ring]
+    near_ids = [loc + far_per_ring for loc in far_ids]
+    cog_locs = dict((frozenset(pair), near) for near, pair in near_pairs.items())
+    return TrialSpace(display_domains(far_ids, near_ids)), cog_locs
+
+
+def _shares(counts, total):
+    return dict((k, n / float(total)) for k, n in counts.items())
+
+
+def _distributions(trials, cog_locs):
+    types, prime_locs, probe_locs = Counter(), Counter(), Counter()
+    for t in trials:
+        types[trial_type(*t, cog_locs=cog_locs)] += 1
+        prime_locs[t[1]] += 1
+        probe_locs[t[3]] += 1
+    return types, prime_locs, probe_locs
+
+
+_expected = {}
+
+
+def expected_shares(far_per_ring, rings):
+    # Trial type & target location shares across the full trial space, worked out once
+    # per process
+    key = (far_per_ring, rings)
+    if key not in _expected:
+        space, cog_locs = study_space(far_per_ring, rings)
+        _expected[key] = [_shares(c, len(space)) for c in _distributions(space, cog_locs)]
+    return _expected[key]
+
+
+def _max_diff(shares, expected):
+    keys = set(shares) | set(expected)
+    key = max(keys, key=lambda k: abs(shares.get(k, 0.0) - expected.get(k, 0.0)))
+    return key, shares.get(key, 0.0) - expected.get(key, 0.0)
+
+
+def validate(schedules, far_per_ring, rings, practice=True, criteria=CRITERIA):
+    # Returns a list of the ways schedules fail the criteria (empty if none)
+    space, cog_locs = study_space(far_per_ring, rings)
+    expected = expected_shares(far_per_ring, rings)
+    problems = []
+
+    for b, schedule in enumerate(schedules, 1):
+        schedule = as_store(schedule)
+        illegal = schedule.filter(~space.legal(schedule))
+        if len(illegal):
+            problems.append("block {0}: {1} illegitimate trials, e.g. {2}".format(b, len(illegal), illegal[0]))
+            continue
+
+        trials = schedule.tuples()
+        types, prime_locs, probe_locs = _distributions(trials, cog_locs)
+        if b == 1 and practice:
+            far = sum(1 for t in trials if t[0] == 'far') / float(len(trials))
+            low, high = criteria['practice_far_share']
+            if len(set(trials)) != len(trials):
+                problems.append("block 1 (practice): repeated trials")
+            if not low <= far <= high:
+                problems.append("block 1 (practice): far share {0:.2f} outside {1}-{2}".format(far, low, high))
+            if len(types) < criteria['practice_min_types']:
+                problems.append("block 1 (practice): only {0} trial types".format(len(types)))
+            continue
+
+        for name, counts, exp, tolerance in (
+            ('trial_type', types, expected[0], criteria['type_tolerance']),
+            ('prime target location', prime_locs, expected[1], criteria['location_tolerance']),
+            ('probe target location', probe_locs, expected[2], criteria['location_tolerance']),
+        ):
+            key, diff = _max_diff(_shares(counts, len(schedule)), exp)
+            if abs(diff) > tolerance:
+                problems.append("block {0}: {1} {2} share off by {3:+.3f}".format(b, name, key, diff))
+
+    return problems
+
+
+def build_participant(job):
+    # Worker: builds & validates one participant's schedules, drawing them again from the
+    # participant's next seed until they pass (up to criteria['attempts'] seeds). Returns
+    # ((station, participant id), seed, condition, schedules, problems).
+    key, study_seed, condition, block_lengths, far_per_ring, rings, practice, criteria = job
+    station, participant_id = key
+    space, _ = study_space(far_per_ring, rings)
+
+    for attempt in range(criteria['attempts']):
+        seed = participant_seed(study_seed, participant_id, attempt, station)
+        rng = random.Random(seed)
+        schedules = [build_block(space, length, rng) for length in block_lengths]
+        problems = validate(schedules, far_per_ring, rings, practice, criteria)
+        if not problems:
+            break
+    return key, seed, condition, schedules, problems
+
+
+def build_bank(path, participant_ids, study_seed, block_lengths, far_per_ring=4, rings=1,
+               practice=True, conditions=CONDITIONS, criteria=CRITERIA, processes=None, stations=(1,)):
+    # Builds, validates & writes schedules for every participant id on every station,
+    # counterbalancing conditions by participant id (offset by station, so each station's
+    # first participant starts on a different condition). Returns {(station, participant
+    # id): problems} for those failing validation (still written to the bank, but flagged
+    # as invalid).
+    jobs = [
+        ((station, pid), study_seed, CONDITIONS.index(conditions[(pid + station - 2) % len(conditions)]),
+         list(block_lengths), far_per_ring, rings, practice, criteria)
+        for station in sorted(stations) for pid in sorted(participant_ids)
+    ]
+
+    processes = processes or min(len(jobs), cpu_count())
+    pool = Pool(processes) if processes > 1 else None
+    entries, failed = [], {}
+    try:
+        results = pool.imap(build_participant, jobs, chunksize=max(1, len(jobs) // (processes * 4))) \
+            if pool else map(build_participant, jobs)
+        for key, seed, condition, schedules, problems in results:
+            entries.append((key, seed, condition, schedules, not problems))
+            if problems:
+                failed[key] = problems
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    save(path, entries, study_seed, block_lengths, far_per_ring, rings, practice)
+    return failed
+
+
+def save(path, entries, study_seed, block_lengths, far_per_ring, rings, practice):
+    header = HEADER.pack(MAGIC, VERSION, len(block_lengths), len(entries), study_seed,
+                         far_per_ring, rings, int(practice))
+    header += struct.pack('<{0}I'.format(len(block_lengths)), *block_lengths)
+
+    with atomic_write(path, 'wb') as f:
+        f.write(header)
+        for (station, pid), seed, condition, schedules, valid in entries:
+            f.write(ENTRY.pack(station, pid, seed, condition, int(valid)))
+            for schedule in schedules:
+                f.write(as_store(schedule).tobytes())
+
+
+class ScheduleBank(object):
+    # Read access to a bank file; entries are fixed-size, so one participant's schedules
+    # are decoded without reading anyone else's. Participants are given by (station, id).
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, n_blocks, n_participants, self.study_seed,
+         self.far_per_ring, self.rings, practice) = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{0} is not a version {1} schedule bank".format(path, VERSION))
+
+        self.practice = bool(practice)
+        self.block_lengths = list(struct.unpack_from('<{0}I'.format(n_blocks), self._data, HEADER.size))
+        self._start = HEADER.size + 4 * n_blocks
+        self._stride = ENTRY.size + TRIAL_BYTES * sum(self.block_lengths)
+        if len(self._data) != self._start + self._stride * n_participants:
+            raise ValueError("{0} is truncated".format(path))
+
+        self._index = dict(
+            (ENTRY.unpack_from(self._data, self._start + i * self._stride)[:2], i) for i in range(n_participants)
+        )
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def participants(self):
+        return sorted(self._index)
+
+    def entry(self, key):
+        # (seed, condition, valid) for a participant
+        offset = self._start + self._index[key] * self._stride
+        _, _, seed, condition, valid = ENTRY.unpack_from(self._data, offset)
+        return seed, CONDITIONS[condition], bool(valid)
+
+    def schedules(self, key):
+        offset = self._start + self._index[key] * self._stride + ENTRY.size
+        schedules = []
+        for length in self.block_lengths:
+            schedules.append(TrialStore.frombuffer(self._data[offset:offset + TRIAL_BYTES * length]))
+            offset += TRIAL_BYTES * length
+        return schedules
+
+    def close(self):
+        self._data.close()
+
+
+def _validate_job(job):
+    path, key, criteria = job
+    bank = ScheduleBank(path)
+    try:
+        problems = validate(bank.schedules(key), bank.far_per_ring, bank.rings, bank.practice, criteria)
+    finally:
+        bank.close()
+    return key, problems
+
+
+def validate_bank(path, criteria=CRITERIA, processes=None):
+    # Re-validates every entry of a bank (e.g. against stricter criteria), in parallel;
+    # returns {(station, participant id): problems} for those failing
+    bank = ScheduleBank(path)
+    jobs = [(path, key, criteria) for key in bank.participants()]
+    bank.close()
+
+    processes = processes or min(len(jobs), cpu_count())
+    pool = Pool(processes) if processes > 1 else None
+    try:
+        results = pool.imap_unordered(_validate_job, jobs, chunksize=max(1, len(jobs) // (processes * 4))) \
+            if pool else map(_validate_job, jobs)
+        return dict((key, problems) for key, problems in results if problems)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def _parse_ids(spec):
+    # '1-400' or '1,2,5-9'
+    ids = set()
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        ids.update(range(int(first), int(last or first) + 1))
+    return sorted(ids)
+
+
+def _report(failed, total):
+    for (station, pid), problems in sorted(failed.items()):
+        print("station {0}, participant {1}:\n  {2}".format(station, pid, "\n  ".join(problems)))
+    print("{0} of {1} participants pass".format(total - len(failed), total))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-generated, validated trial schedules by participant")
+    commands = parser.add_subparsers(dest='command')
+
+    build = commands.add_parser('build')
+    build.add_argument('bank')
+    build.add_argument('--participants', required=True, help="ids on each station, e.g. 1-400 or 1,2,5-9")
+    build.add_argument('--stations', default='1', help="P.station_id of each station, e.g. 1-4")
+    build.add_argument('--seed', type=int, required=True)
+    build.add_argument('--conditions', nargs='+', choices=CONDITIONS, default=list(CONDITIONS))
+    build.add_argument('--blocks', type=int, default=1)
+    build.add_argument('--trials-per-block', type=int, default=288)
+    build.add_argument('--no-practice', action='store_true')
+    build.add_argument('--locations', type=int, default=4)
+    build.add_argument('--rings', type=int, default=1)
+    build.add_argument('--processes', type=int)
+
+    check = commands.add_parser('validate')
+    check.add_argument('bank')
+    check.add_argument('--type-tolerance', type=float, default=CRITERIA['type_tolerance'])
+    check.add_argument('--location-tolerance', type=float, default=CRITERIA['location_tolerance'])
+    check.add_argument('--processes', type=int)
+
+    show = commands.add_parser('show')
+    show.add_argument('bank')
+    show.add_argument('participant', type=int)
+    show.add_argument('--station', type=int, default=1)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        lengths = ([] if args.no_practice else [PRACTICE_TRIALS]) + [args.trials_per_block] * args.blocks
+        ids = _parse_ids(args.participants)
+        stations = _parse_ids(args.stations)
+        failed = build_bank(args.bank, ids, args.seed, lengths, args.locations, args.rings,
+                            not args.no_practice, args.conditions, processes=args.processes, stations=stations)
+        _report(failed, len(ids) * len(stations))
+
+    elif args.command == 'validate':
+        criteria = dict(CRITERIA, type_tolerance=args.type_tolerance, location_tolerance=args.location_tolerance)
+        failed = validate_bank(args.bank, criteria, args.processes)
+        bank = ScheduleBank(args.bank)
+        _report(failed, len(bank))
+
+    else:
+        bank = ScheduleBank(args.bank)
+        key = (args.station, args.participant)
+        if key not in bank:
+            sys.exit("station {0}, participant {1} isn't in the bank".format(*key))
+        seed, condition, valid = bank.entry(key)
+        print("station {0}, participant {1}: seed {2}, {3}, {4}".format(
+            args.station, args.participant, seed, condition, "valid" if valid else "INVALID"))
+        space, cog_locs = study_space(bank.far_per_ring, bank.rings)
+        for b, schedule in enumerate(bank.schedules(key), 1):
+            types = Counter(trial_type(*t, cog_locs=cog_locs) for t in schedule.tuples())
+            print("  block {0}: {1} trials, {2}".format(
+                b, len(schedule), ", ".join("{0} {1}".format(k, n) for k, n in sorted(types.items()))))
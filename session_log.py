@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Compact, append-only binary log of everything that happens in a session: the array's
+# locations & the response keymap, then, for every trial, its parameters, each display's
+# onset, the end of each interval, every key press & the response accepted for each display.
+#
+# The file is a 24 byte header followed by 24 byte records, so it can be memory-mapped as a
+# numpy record array. Replaying a log re-scores its trials with the same logic as
+# NP_IOR.trial() (see trial_record.py), without a display or a participant, to rebuild the
+# trials table, audit display timing, or step through the events of a single trial:
+#
+#   python session_log.py replay ExpAssets/Data/session_logs/p1_<time>.npsl ExpAssets/NP_IOR.db 1
+#   python session_log.py audit ExpAssets/Data/session_logs/p1_<time>.npsl
+#   python session_log.py show ExpAssets/Data/session_logs/p1_<time>.npsl 42
+
+import os
+import sys
+import time
+import struct
+import sqlite3
+
+from trials_schema import FAR_NEAR, LOCATIONS, is_typed, encode_trial
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ExpAssets', 'Data', 'session_logs')
+
+MAGIC = b'NPSL'
+VERSION = 1
+
+# magic, version, record size, session start (epoch s), participant id, far locations per
+# ring, refresh rate (Hz)
+HEADER = struct.Struct('<4sHHdIHH')
+# kind, a, b, trial (running count, 0 before the first), t, u, v
+RECORD = struct.Struct('<BBHIdII')
+
+# Record kinds & the meaning of their fields
+LOCATION = 1      # a: location, b: label (index into LOCATIONS), u & v: x & y (px)
+KEYMAP = 2        # b: label, u: key code
+TRIAL = 3         # a: far/near code, b: block, u: packed locations (one byte each), v: practicing
+ONSET = 4         # a: display, t: time its first frame was on screen (s)
+INTERVAL_END = 5  # a: display the interval followed, t: time it ended (s), u: its length (ms)
+KEY = 6           # t: time the key was pressed (s), u: key code
+RESPONSE = 7      # a: display, b: label (NO_RESPONSE if none), t: rt (ms)
+
+DISPLAYS = ('array', 'prime', 'isi', 'probe', 'feedback')
+NO_RESPONSE = 0xFFFF
+
+# The interval each display is held for before the next appears, in ms
+INTERVALS = {'array': 500, 'isi': 300}
+
+
+def log_path(participant_id, log_dir=LOG_DIR):
+    return os.path.join(log_dir, 'p{0}_{1}.npsl'.format(participant_id, time.strftime('%Y%m%d-%H%M%S')))
+
+
+class SessionLog(object):
+    # Appends records through a buffered file, flushed once per trial (see flush()), so
+    # logging an event costs a struct pack & a buffer copy
+
+    def __init__(self, path, participant_id, far_per_ring, refresh_rate, locs, keymap):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.trials = 0
+        self._f = open(path, 'ab')
+        if self._f.tell() == 0:
+            self._f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, time.time(), participant_id,
+                                      far_per_ring, int(round(refresh_rate))))
+
+        # locs: {location: [(x, y), label]}, keymap: {key code: label}
+        for loc, (pos, label) in sorted(locs.items()):
+            self._write(LOCATION, loc, LOCATIONS.index(label), u=int(pos[0]), v=int(pos[1]))
+        for key, label in sorted(keymap.items()):
+            self._write(KEYMAP, 0, LOCATIONS.index(label), u=key)
+        self.flush()
+
+    def _write(self, kind, a=0, b=0, t=0.0, u=0, v=0):
+        self._f.write(RECORD.pack(kind, a, b, self.trials, t, u, v))
+
+    def trial(self, block_num, practicing, trial):
+        far_or_near, prime_t, prime_d, probe_t, probe_d = trial
+        self.trials += 1
+        self._write(TRIAL, FAR_NEAR.index(far_or_near), block_num,
+                    u=prime_t | prime_d << 8 | probe_t << 16 | probe_d << 24, v=int(bool(practicing)))
+
+    def onset(self, display, t):
+        self._write(ONSET, DISPLAYS.index(display), t=t)
+
+    def interval_end(self, display, t, ms):
+        self._write(INTERVAL_END, DISPLAYS.index(display), t=t, u=ms)
+
+    def key(self, key, t):
+        self._write(KEY, t=t, u=key)
+
+    def response(self, display, label, rt):
+        if label == 'NA':
+            self._write(RESPONSE, DISPLAYS.index(display), NO_RESPONSE, t=float('nan'))
+        else:
+            self._write(RESPONSE, DISPLAYS.index(display), LOCATIONS.index(label), t=rt)
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+
+class NullSessionLog(object):
+    # Stands in when session logging is off
+
+    def trial(self, block_num, practicing, trial):
+        pass
+
+    def onset(self, display, t):
+        pass
+
+    def interval_end(self, display, t, ms):
+        pass
+
+    def key(self, key, t):
+        pass
+
+    def response(self, display, label, rt):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def read_log(path):
+    # Returns (header dict, records) with records memory-mapped as a numpy record array;
+    # a partly written final record (e.g. after a crash) is ignored
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        magic, version, record_size, started, participant_id, far_per_ring, refresh = \
+            HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError("{0} is not a version {1} session log".format(path, VERSION))
+
+    dtype = np.dtype([('kind', 'u1'), ('a', 'u1'), ('b', '<u2'), ('trial', '<u4'),
+                      ('t', '<f8'), ('u', '<u4'), ('v', '<u4')])
+    count = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+    records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER.size, shape=(count,)) \
+        if count else np.zeros(0, dtype=dtype)
+
+    header = {'started': started, 'participant_id': participant_id,
+              'far_per_ring': far_per_ring, 'refresh_rate': refresh}
+    return header, records
+
+
+class Replay(object):
+    # A session log's trials, re-scored as NP_IOR.trial() scores them
+
+    def __init__(self, path):
+        import numpy as np
+        from ring_layout import ring_numbering
+        from trial_geometry import GeometryTable
+
+        self.header, self.records = read_log(path)
+        records = self.records
+
+        loc_records = records[records['kind'] == LOCATION]
+        self.labels = dict((int(r['a']), LOCATIONS[r['b']]) for r in loc_records)
+        positions = dict((int(r['a']), (float(r['u']), float(r['v']))) for r in loc_records)
+        self.keymap = dict((int(r['u']), LOCATIONS[r['b']]) for r in records[records['kind'] == KEYMAP])
+
+        n = self.header['far_per_ring']
+        _, near_pairs = ring_numbering(n, len(positions) // (2 * n))
+        xy = np.full((len(positions) + 1, 2), np.nan)
+        for loc, pos in positions.items():
+            xy[loc] = pos
+        distances = np.sqrt(((xy[:, None, :] - xy[None, :, :]) ** 2).sum(axis=-1))
+        self.geometry = GeometryTable(distances, dict((frozenset(p), c) for c, p in near_pairs.items()))
+
+        # Each trial's records run from its TRIAL record to the next one
+        starts = np.flatnonzero(records['kind'] == TRIAL)
+        self.spans = list(zip(starts, list(starts[1:]) + [len(records)]))
+
+    def __len__(self):
+        return len(self.spans)
+
+    def events(self, i):
+        # The records of the i-th trial (0-based), as a numpy record array
+        start, end = self.spans[i]
+        return self.records[start:end]
+
+    def trial(self, i):
+        # (trial tuple, block, practicing, onsets, responses, key presses) for the i-th trial
+        events = self.events(i)
+        head = events[0]
+        packed = int(head['u'])
+        trial = (FAR_NEAR[head['a']], packed & 0xFF, packed >> 8 & 0xFF, packed >> 16 & 0xFF, packed >> 24 & 0xFF)
+
+        onsets, responses, keys = {}, {}, []
+        for kind, a, b, t, u in zip(events['kind'].tolist(), events['a'].tolist(), events['b'].tolist(),
+                                    events['t'].tolist(), events['u'].tolist()):
+            if kind == ONSET:
+                onsets[DISPLAYS[a]] = t
+            elif kind == RESPONSE:
+                responses[DISPLAYS[a]] = ('NA', 'NA') if b == NO_RESPONSE else (LOCATIONS[b], t)
+            elif kind == KEY:
+                keys.append((u, t))
+        return trial, int(head['b']), bool(head['v']), onsets, responses, keys
+
+    def key_response(self, display, onsets, keys):
+        # The response & rt given by the first mapped key press during a display, or None
+        start = onsets.get(display)
+        if start is None:
+            return None
+        following = [t for d, t in onsets.items() if t > start]
+        end = min(following) if following else float('inf')
+        for key, t in sorted(keys, key=lambda k: k[1]):
+            if start <= t < end and key in self.keymap:
+                return self.keymap[key], (t - start) * 1000.0
+        return None
+
+    def rows(self):
+        # Rows for the trials table, in session order (participant_id aside)
+        trial_nums = {}
+        for i in range(len(self)):
+            trial, block, practicing, onsets, responses, keys = self.trial(i)
+            trial_nums[block] = trial_nums.get(block, 0) + 1
+
+            displays = []
+            for display in ('prime', 'probe'):
+                response = responses.get(display) or self.key_response(display, onsets, keys) or ('NA', 'NA')
+                displays.append(response)
+
+            yield self._row(block, trial_nums[block], practicing, trial, displays)
+
+    def _row(self, block, trial_num, practicing, trial, displays):
+        from trial_record import build_row
+        labels = tuple(self.labels[loc] for loc in trial[1:])
+        return build_row(block, trial_num, practicing, trial[0], self.geometry[trial], labels, *displays)
+
+    def audit(self):
+        # Per trial: how far the prime & probe onsets were from their nominal intervals after
+        # the array & ISI onsets, & whether the logged response matches the key presses
+        for i in range(len(self)):
+            trial, block, practicing, onsets, responses, keys = self.trial(i)
+            late = {}
+            for before, after in (('array', 'prime'), ('isi', 'probe')):
+                if before in onsets and after in onsets:
+                    late[after] = (onsets[after] - onsets[before]) * 1000.0 - INTERVALS[before]
+
+            mismatched = []
+            for display in ('prime', 'probe'):
+                logged, from_keys = responses.get(display), self.key_response(display, onsets, keys)
+                if logged and from_keys and (logged[0] != from_keys[0] or abs(logged[1] - from_keys[1]) > 1.0):
+                    mismatched.append(display)
+            yield i, late, mismatched
+
+
+def rebuild_trials(log, db_path, participant_id):
+    # Inserts a session log's replayed trials into a database's trials table (text or typed
+    # layout); returns the number of rows written
+    rows = []
+    conn = sqlite3.connect(db_path)
+    typed = is_typed(conn)
+    for row in Replay(log).rows():
+        row['participant_id'] = participant_id
+        rows.append(encode_trial(row) if typed else row)
+
+    if rows:
+        cols = sorted(rows[0])
+        with conn:
+            conn.executemany("INSERT INTO trials ({0}) VALUES ({1})".format(
+                ", ".join(cols), ", ".join("?" * len(cols))), [tuple(r[c] for c in cols) for r in rows])
+    conn.close()
+    return len(rows)
+
+
+def audit_report(log):
+    replay = Replay(log)
+    late = {'prime': [], 'probe': []}
+    mismatched = 0
+    for _, trial_late, trial_mismatched in replay.audit():
+        for display, ms in trial_late.items():
+            late[display].append(ms)
+        mismatched += len(trial_mismatched)
+
+    frame_ms = 1000.0 / max(replay.header['refresh_rate'], 1)
+    lines = ["{0} trials, participant {1}".format(len(replay), replay.header['participant_id'])]
+    for display, values in sorted(late.items()):
+        if not values:
+            continue
+        values.sort()
+        lines.append("{0:6} onset vs nominal: median {1:+7.2f} ms  max {2:+7.2f} ms  missed a frame: {3}".format(
+            display, values[len(values) // 2], values[-1], sum(1 for v in values if v > frame_ms / 2)))
+    lines.append("responses not matching key presses: {0}".format(mismatched))
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    usage = ("usage: python session_log.py replay <log> <db> <participant_id>\n"
+             "       python session_log.py audit <log>\n"
+             "       python session_log.py show <log> <trial>")
+    if len(sys.argv) < 3:
+        sys.exit(usage)
+
+    command, log = sys.argv[1], sys.argv[2]
+    if command == 'replay' and len(sys.argv) == 5:
+        print("{0} trials written".format(rebuild_trials(log, sys.argv[3], int(sys.argv[4]))))
+    elif command == 'audit':
+        print(audit_report(log))
+    elif command == 'show' and len(sys.argv) == 4:
+        replay = Replay(log)
+        i = int(sys.argv[3]) - 1
+        kinds = {TRIAL: 'TRIAL', ONSET: 'ONSET', INTERVAL_END: 'INTERVAL_END', KEY: 'KEY', RESPONSE: 'RESPONSE'}
+        events = replay.events(i)
+        # Times are shown relative to the trial's first onset, RTs as logged
+        onsets = events['t'][events['kind'] == ONSET]
+        t0 = float(onsets.min()) if len(onsets) else 0.0
+        for r in events:
+            kind = int(r['kind'])
+            if kind == TRIAL:
+                detail = "{0}".format(replay.trial(i)[0])
+            elif kind in (ONSET, INTERVAL_END):
+                detail = "{0:<8} {1:+9.2f} ms".format(DISPLAYS[r['a']], (float(r['t']) - t0) * 1000.0)
+            elif kind == KEY:
+                detail = "{0:<8} {1:+9.2f} ms".format(replay.keymap.get(int(r['u']), int(r['u'])),
+                                                       (float(r['t']) - t0) * 1000.0)
+            else:
+                label = 'NA' if r['b'] == NO_RESPONSE else LOCATIONS[r['b']]
+                detail = "{0:<8} {1} (rt {2:.2f} ms)".format(DISPLAYS[r['a']], label, float(r['t']))
+            print("{0:<13} {1}".format(kinds[kind], detail))
+    else:
+        sys.exit(usage)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+import time
+import random
+import threading
+from ctypes import byref
+from importlib import import_module
+
+import sdl2
+
+from trials_schema import CHOICES
+
+
+class SimulatedParticipant(object):
+    # Stands in for a human when running sessions headless: for each prime or probe display
+    # it picks a response location & RT, which a KeyPresser then presses on the keyboard's
+    # behalf for the display's ResponseCollector to collect.
+    #
+    # RTs are drawn from an ex-Gaussian (mu, sigma, tau, in ms). On error_rate of displays the
+    # response goes to the distractor or an empty cell, split according to error_bias; on
+    # miss_rate of displays no response is made before the timeout. Subclass & override
+    # choose() / rt() for other response models.
+
+    def __init__(self, rt_mu=450.0, rt_sigma=50.0, rt_tau=100.0, error_rate=0.05, miss_rate=0.0,
+                 error_bias=None, timeout=5000, seed=None):
+        self.rt_mu = rt_mu
+        self.rt_sigma = rt_sigma
+        self.rt_tau = rt_tau
+        self.error_rate = error_rate
+        self.miss_rate = miss_rate
+        self.error_bias = error_bias or {'distractor': 0.5, 'empty_cell': 0.5}
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+
+        self.choices = dict((c, 0) for c in CHOICES + ('NA',))
+
+    def respond(self, display, target, distractor, locations):
+        # Returns a (response, rt) pair in the same form as a keypress listener's response,
+        # or ('NA', 'NA') for a miss. target & distractor are location labels, locations
+        # the labels of every location in the array.
+        rt = self.rt(display)
+        if self.rng.random() < self.miss_rate or rt >= self.timeout:
+            self.choices['NA'] += 1
+            return 'NA', 'NA'
+
+        choice = self.choose(display)
+        self.choices[choice] += 1
+
+        if choice == 'target':
+            response = target
+        elif choice == 'distractor':
+            response = distractor
+        else:
+            response = self.rng.choice([l for l in locations if l not in (target, distractor)])
+
+        return response, rt
+
+    def choose(self, display):
+        if self.rng.random() >= self.error_rate:
+            return 'target'
+
+        threshold = self.rng.random() * sum(self.error_bias.values())
+        for choice in ('distractor', 'empty_cell'):
+            threshold -= self.error_bias.get(choice, 0)
+            if threshold < 0:
+                return choice
+
+        return 'empty_cell'
+
+    def rt(self, display):
+        return max(1.0, self.rng.gauss(self.rt_mu, self.rt_sigma) + self.rng.expovariate(1.0 / self.rt_tau))
+
+
+class KeyPresser(object):
+    # Makes a simulated participant's responses as key presses: SDL key events for the
+    # response's mapped key are queued rt ms after the display's onset, from a background
+    # thread, so they go through the ResponseCollector, KeyMap & KeyCapture as a real
+    # press does. RTs therefore play out in real time.
+
+    def __init__(self, keys, clock, poll=0.0005):
+        # keys: {location label: SDL keycode}; clock: the clock display onsets are taken on
+        self.keys = keys
+        self.clock = clock
+        self.poll = poll
+        self._thread = None
+
+    def press(self, response, onset, rt):
+        # onset: a callable returning the display's onset, or None until it's been shown
+        self._thread = threading.Thread(target=self._press, args=(self.keys[response], onset, rt / 1000.0))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def join(self):
+        # Waits for the last press to be made
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _press(self, key, onset, delay):
+        while onset() is None:
+            time.sleep(self.poll)
+        remaining = onset() + delay - self.clock()
+        if remaining > 0:
+            time.sleep(remaining)
+
+        for kind in (sdl2.SDL_KEYDOWN, sdl2.SDL_KEYUP):
+            event = sdl2.SDL_Event()
+            event.type = kind
+            event.key.keysym.sym = key
+            sdl2.SDL_PushEvent(byref(event))
+
+
+def load_participant(settings, seed=None):
+    # Builds the agent described by the simulated_participant param: a dict of keyword
+    # arguments, optionally naming an alternative agent class as 'agent': 'module.Class'
+    settings = dict(settings)
+    agent = settings.pop('agent', SimulatedParticipant)
+
+    if not isinstance(agent, type):
+        module, name = agent.rsplit('.', 1)
+        agent = getattr(import_module(module), name)
+
+    settings.setdefault('seed', seed)
+    return agent(**settings)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Merges the databases of several testing stations into one central database. Each station
+# runs NP_IOR against its own, local copy of the database (rather than all of them sharing
+# one SQLite file over a network mount), and this folds their new rows into the central
+# store, as often as needed:
+#
+#   python station_merge.py Central.db lab1=/mnt/lab1/NP_IOR.db lab2=/mnt/lab2/NP_IOR.db
+#   python station_merge.py Central.db lab1=... lab2=... --every 60
+#
+# Stations are read concurrently, each by its own worker process, in a single read
+# transaction (so a station can keep running meanwhile), and only rows added since the
+# station's last merge are read. The rows are then written by this process alone, in
+# batched transactions, each of which also records how far the station has been merged;
+# an interrupted merge simply resumes. Participants get new ids in the central database, &
+# the participant_id of every row referencing them (trials, frame_timing...) is remapped.
+
+import os
+import sys
+import time
+import sqlite3
+from multiprocessing import Pool, cpu_count
+
+from trials_schema import is_typed, migrate, table_columns
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ExpAssets', 'Config', 'NP_IOR_schema.sql')
+
+MERGE_STATE = """
+CREATE TABLE IF NOT EXISTS merge_marks (
+    station text not null,
+    table_name text not null,
+    last_id integer not null,
+    primary key (station, table_name)
+);
+CREATE TABLE IF NOT EXISTS merge_participants (
+    station text not null,
+    source_id integer not null,
+    central_id integer not null references participants(id),
+    primary key (station, source_id)
+);
+"""
+
+BATCH_ROWS = 5000
+
+
+def _data_tables(conn):
+    # Tables whose rows belong to a participant, in the order they're merged
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND name NOT LIKE 'merge_%' ORDER BY name"
+    )]
+    return [t for t in names if 'participant_id' in table_columns(conn, t)]
+
+
+def read_station(args):
+    # Runs in a worker process: returns (station, typed, {table: (cols, rows)}) holding
+    # every row added to each table since the marks given, all read from one snapshot
+    station, path, marks, tables = args
+    conn = sqlite3.connect(path, timeout=30)
+    # Transactions are managed here, so the sqlite3 module doesn't end the snapshot early
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN")
+        typed = is_typed(conn)
+        new = {}
+        for table in ['participants'] + [t for t in _data_tables(conn) if t in tables]:
+            cols = [c for c in table_columns(conn, table) if c in tables.get(table, ())]
+            rows = conn.execute("SELECT id, {0} FROM {1} WHERE id > ? ORDER BY id".format(
+                ", ".join(cols), table), (marks.get(table, 0),)
+            ).fetchall()
+            new[table] = (cols, rows)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return station, typed, new
+
+
+class StationMerger(object):
+
+    def __init__(self, central_path, schema=SCHEMA, batch_rows=BATCH_ROWS):
+        self.central_path = central_path
+        self.schema = schema
+        self.batch_rows = batch_rows
+
+    def _connect(self, typed):
+        if not os.path.exists(self.central_path):
+            conn = sqlite3.connect(self.central_path)
+            conn.executescript(open(self.schema).read())
+            conn.close()
+            if typed:
+                migrate(self.central_path)
+
+        conn = sqlite3.connect(self.central_path, timeout=30)
+        conn.executescript(MERGE_STATE)
+        if is_typed(conn) != typed:
+            conn.close()
+            raise ValueError("Central & station databases must use the same trials layout "
+                             "(see trials_schema.py)")
+        return conn
+
+    def merge(self, stations, processes=None):
+        # stations: {name: db_path}. Returns {name: {table: rows merged}}
+        if not stations:
+            return {}
+
+        # The central layout follows the first station's when it needs creating
+        first = sqlite3.connect(list(stations.values())[0])
+        typed = is_typed(first)
+        first.close()
+        conn = self._connect(typed)
+
+        tables = dict((t, [c for c in table_columns(conn, t) if c != 'id'])
+                      for t in ['participants'] + _data_tables(conn))
+        jobs = []
+        for name, path in sorted(stations.items()):
+            marks = dict(conn.execute(
+                "SELECT table_name, last_id FROM merge_marks WHERE station = ?", (name,)
+            ).fetchall())
+            jobs.append((name, path, marks, tables))
+
+        merged = {}
+        processes = processes or min(len(jobs), cpu_count())
+        pool = Pool(processes) if processes > 1 else None
+        try:
+            results = pool.imap_unordered(read_station, jobs) if pool else map(read_station, jobs)
+            for station, station_typed, new in results:
+                if station_typed != typed:
+                    raise ValueError("Station '{0}' uses a different trials layout".format(station))
+                merged[station] = self._apply(conn, station, new)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            conn.close()
+
+        return merged
+
+    def _apply(self, conn, station, new):
+        counts = {}
+        remap = dict(conn.execute(
+            "SELECT source_id, central_id FROM merge_participants WHERE station = ?", (station,)
+        ).fetchall())
+
+        # Participants first, one at a time as each needs its new id
+        cols, rows = new.pop('participants')
+        if rows:
+            q = "INSERT INTO participants ({0}) VALUES ({1})".format(", ".join(cols), ", ".join("?" * len(cols)))
+            with conn:
+                for row in rows:
+                    remap[row[0]] = conn.execute(q, row[1:]).lastrowid
+                    conn.execute("INSERT INTO merge_participants VALUES (?, ?, ?)", (station, row[0], remap[row[0]]))
+                self._mark(conn, station, 'participants', rows[-1][0])
+        counts['participants'] = len(rows)
+
+        for table, (cols, rows) in sorted(new.items()):
+            pid = cols.index('participant_id') + 1
+            q = "INSERT INTO {0} ({1}) VALUES ({2})".format(table, ", ".join(cols), ", ".join("?" * len(cols)))
+
+            for start in range(0, len(rows), self.batch_rows):
+                batch = rows[start:start + self.batch_rows]
+                values = []
+                for row in batch:
+                    if row[pid] not in remap:
+                        raise ValueError("Row {0} of {1} on station '{2}' references unknown participant {3}".format(
+                            row[0], table, station, row[pid]))
+                    values.append(row[1:pid] + (remap[row[pid]],) + row[pid + 1:])
+                with conn:
+                    conn.executemany(q, values)
+                    self._mark(conn, station, table, batch[-1][0])
+            counts[table] = len(rows)
+
+        return counts
+
+    def _mark(self, conn, station, table, last_id):
+        conn.execute("INSERT OR REPLACE INTO merge_marks VALUES (?, ?, ?)", (station, table, last_id))
+
+
+def _parse_stations(args):
+    stations = {}
+    for arg in args:
+        name, _, path = arg.rpartition('=')
+        stations[name or os.path.splitext(os.path.basename(path))[0]] = path
+    return stations
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    every = None
+    if '--every' in args:
+        i = args.index('--every')
+        every = float(args[i + 1])
+        del args[i:i + 2]
+
+    if len(args) < 2:
+        sys.exit("usage: python station_merge.py <central.db> [name=]<station.db> ... [--every seconds]")
+
+    merger = StationMerger(args[0])
+    stations = _parse_stations(args[1:])
+    while True:
+        for station, counts in sorted(merger.merge(stations).items()):
+            print("{0}: {1}".format(station, ", ".join(
+                "{0} {1}".format(n, t) for t, n in sorted(counts.items()))))
+        if every is None:
+            break
+        time.sleep(every)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# Synthetic sessions for the tests: trial rows as NP_IOR.trial() returns them, for the
+# default 4-location array, & text-layout databases holding them.
+
+import os
+import sys
+import random
+import sqlite3
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from trial_space import legal_trials, display_domains, build_block
+from trial_geometry import GeometryTable
+from trial_record import build_row
+from ring_layout import RingLayout, ring_rotation
+
+SCHEMA = os.path.join(ROOT, 'ExpAssets', 'Config', 'NP_IOR_schema.sql')
+RADIUS = 112.0
+
+
+def layout(condition='square'):
+    return RingLayout((960, 540), 4, [RADIUS], rotation=ring_rotation(condition, 4))
+
+
+def session_rows(participant_id, n, rng, condition='square'):
+    # n trials' rows, responding to the target, the distractor, an empty cell or not at all
+    ring = layout(condition)
+    space = legal_trials(display_domains(ring.far_ids, ring.near_ids))
+    geometry = GeometryTable(ring.distances(), ring.cog_locs())
+    every = [ring.labels[loc] for loc in ring.far_ids + ring.near_ids]
+
+    rows = []
+    for t, trial in enumerate(build_block(space, n, rng)):
+        labels = tuple(ring.labels[loc] for loc in trial[1:])
+        responses = []
+        for target, distractor in (labels[:2], labels[2:]):
+            pick = rng.random()
+            if pick < 0.8:
+                responses.append((target, rng.uniform(300, 700)))
+            elif pick < 0.9:
+                responses.append((distractor, rng.uniform(300, 700)))
+            elif pick < 0.95:
+                other = [l for l in every if l not in (target, distractor)]
+                responses.append((rng.choice(other), rng.uniform(300, 700)))
+            else:
+                responses.append(('NA', 'NA'))
+        row = build_row(1, t + 1, t < 10, trial[0], geometry[trial], labels, responses[0], responses[1])
+        row['participant_id'] = participant_id
+        rows.append(row)
+    return rows
+
+
+def build_db(path, participants=((1, 'square', 96),), seed=1):
+    # A text-layout database holding a session for each (id, condition, trials) given
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(open(SCHEMA).read())
+    for pid, condition, n in participants:
+        conn.execute("INSERT INTO participants (id, userhash, gender, age, handedness, created) "
+                     "VALUES (?, ?, 'f', 20, 'r', '')", (pid, 'p{0}'.format(pid)))
+        rows = session_rows(pid, n, rng, condition)
+        cols = sorted(rows[0])
+        conn.executemany(
+            "INSERT INTO trials ({0}) VALUES ({1})".format(", ".join(cols), ", ".join("?" * len(cols))),
+            [tuple(r[c] for c in cols) for r in rows]
+        )
+    conn.commit()
+    conn.close()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import os
+import math
+import random
+import shutil
+import tempfile
+import unittest
+
+from sessions import session_rows
+from live_stats import RunningStat, Cell, LiveStats
+
+
+def mean_var(values):
+    # Two-pass mean & sample variance
+    mean = sum(values) / len(values)
+    return mean, sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+
+
+class RunningStatTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(5)
+        # Large RTs with a small spread, where a naive sum of squares loses precision
+        self.values = [1e6 + rng.gauss(450, 80) for _ in range(1000)]
+
+    def test_add(self):
+        stat = RunningStat()
+        for v in self.values:
+            stat.add(v)
+        mean, var = mean_var(self.values)
+        self.assertEqual(stat.n, len(self.values))
+        self.assertAlmostEqual(stat.mean, mean, places=6)
+        self.assertAlmostEqual(stat.variance / var, 1.0, places=9)
+        self.assertAlmostEqual(stat.sd, math.sqrt(var), places=6)
+
+    def test_merge_equals_adding(self):
+        whole, parts = RunningStat(), [RunningStat() for _ in range(3)]
+        for i, v in enumerate(self.values):
+            whole.add(v)
+            parts[i % 7 % 3].add(v)
+
+        merged = RunningStat()
+        for part in parts + [RunningStat()]:
+            merged.merge(part)
+        self.assertEqual(merged.n, whole.n)
+        self.assertAlmostEqual(merged.mean, whole.mean, places=6)
+        self.assertAlmostEqual(merged.variance / whole.variance, 1.0, places=9)
+
+    def test_too_few_observations(self):
+        stat = RunningStat()
+        self.assertTrue(math.isnan(stat.variance))
+        stat.add(500.0)
+        self.assertTrue(math.isnan(stat.sd))
+        self.assertEqual(stat.mean, 500.0)
+
+
+class LiveStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        rows = session_rows(1, 288, random.Random(2))
+        for i, row in enumerate(rows):
+            row['block_num'], row['practicing'] = (1, 'True') if i < 25 else (2 + (i - 25) // 88, 'False')
+        self.rows = rows
+
+        self.stats = LiveStats()
+        for row in rows:
+            self.stats.update(row)
+
+    def expected(self, trial_type, far_near, block=None):
+        # A cell's summary computed directly from the rows
+        rows = [r for r in self.rows if (r['trial_type'], r['far_near']) == (trial_type, far_near)
+                and r['practicing'] == 'False' and (block is None or r['block_num'] == block)]
+        out = {'trials': len(rows)}
+        for display in ('prime', 'probe'):
+            correct = [r for r in rows if r[display + '_correct'] == 'True']
+            rts = [float(r[display + '_rt']) for r in correct]
+            out[display] = (len(correct) / float(len(rows)), rts,
+                            sum(1 for r in rows if r[display + '_choice'] == 'distractor') / float(len(rows)))
+        return out
+
+    def check(self, summary, block=None):
+        self.assertTrue(summary)
+        for (trial_type, far_near), s in summary.items():
+            expected = self.expected(trial_type, far_near, block)
+            self.assertEqual(s['trials'], expected['trials'])
+            for display in ('prime', 'probe'):
+                accuracy, rts, distractor = expected[display]
+                self.assertAlmostEqual(s[display]['accuracy'], accuracy)
+                self.assertAlmostEqual(s[display]['choice_rates']['distractor'], distractor)
+                self.assertEqual(s[display]['rt_n'], len(rts))
+                if len(rts) > 1:
+                    mean, var = mean_var(rts)
+                    self.assertAlmostEqual(s[display]['rt_mean'], mean, places=6)
+                    self.assertAlmostEqual(s[display]['rt_sd'], math.sqrt(var), places=6)
+
+    def test_summary_across_blocks(self):
+        self.check(self.stats.summary())
+
+    def test_summary_of_one_block(self):
+        self.check(self.stats.summary(block=3), block=3)
+
+    def test_practice_is_kept_apart(self):
+        practice = self.stats.summary(practicing=True)
+        self.assertEqual(sum(s['trials'] for s in practice.values()), 25)
+        self.assertEqual(sum(s['trials'] for s in self.stats.summary().values()), len(self.rows) - 25)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'p1_stats.json')
+            self.stats.save(path)
+            self.assertEqual(LiveStats.load(path).report(), self.stats.report())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_cell_merge_equals_adding(self):
+        whole, halves = Cell(), (Cell(), Cell())
+        for i, row in enumerate(self.rows):
+            whole.add(row)
+            halves[i % 2].add(row)
+        halves[0].merge(halves[1])
+        self.assertEqual(halves[0].to_dict()['correct'], whole.to_dict()['correct'])
+        self.assertEqual(halves[0].choices, whole.choices)
+        for display in ('prime', 'probe'):
+            self.assertEqual(halves[0].rt[display].n, whole.rt[display].n)
+            self.assertAlmostEqual(halves[0].rt[display].mean, whole.rt[display].mean, places=6)
+            self.assertAlmostEqual(halves[0].rt[display].variance, whole.rt[display].variance, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
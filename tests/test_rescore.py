@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from sessions import build_db, RADIUS
+from rescore import rescore
+
+
+class RescoreCountsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'trials.db')
+        build_db(self.path)
+
+        # Mis-score the prime choices of some trials & the trial types of others
+        conn = sqlite3.connect(self.path)
+        ids = [i for (i,) in conn.execute("SELECT id FROM trials WHERE prime_choice = 'target' ORDER BY id")]
+        self.choices, self.types = ids[:7], ids[10:13]
+        conn.executemany("UPDATE trials SET prime_choice = 'distractor' WHERE id = ?", [(i,) for i in self.choices])
+        conn.executemany("UPDATE trials SET trial_type = 'erroneous' WHERE id = ?", [(i,) for i in self.types])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_counts_are_reported_against_their_columns(self):
+        stats = rescore(self.path, dry_run=True)
+        self.assertEqual(stats['changed'], {
+            'trial_type': len(self.types), 'prime_choice': len(self.choices), 'probe_choice': 0,
+            'prime_correct': 0, 'probe_correct': 0,
+        })
+        self.assertEqual(stats['updated'], len(self.types) + len(self.choices))
+
+    def test_distances_are_counted_only_with_a_radius(self):
+        stats = rescore(self.path, radius=RADIUS, dry_run=True)
+        self.assertEqual(stats['changed']['distances'], 0)
+        self.assertEqual(stats['changed']['prime_choice'], len(self.choices))
+
+    def test_rescoring_fixes_the_mis_scored_trials(self):
+        rescore(self.path)
+        self.assertEqual(rescore(self.path, restart=True)['updated'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
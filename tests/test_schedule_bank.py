@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trial_space import build_block, PRACTICE_TRIALS
+from schedule_bank import build_bank, validate_bank, study_space, ScheduleBank
+
+LENGTHS = [PRACTICE_TRIALS, 288]
+
+
+class ScheduleBankTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'study.bank')
+        self.failed = build_bank(self.path, [1, 2, 3], 2024, LENGTHS, processes=1, stations=(1, 2))
+        self.bank = ScheduleBank(self.path)
+
+    def tearDown(self):
+        self.bank.close()
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        self.assertEqual(self.failed, {})
+        self.assertEqual(len(self.bank), 6)
+        self.assertEqual(self.bank.participants(), [(s, p) for s in (1, 2) for p in (1, 2, 3)])
+        self.assertEqual(self.bank.block_lengths, LENGTHS)
+        self.assertEqual((self.bank.study_seed, self.bank.far_per_ring, self.bank.rings), (2024, 4, 1))
+        self.assertTrue(self.bank.practice)
+
+        # Each entry holds exactly the schedules a session with its seed would build
+        space, _ = study_space(4, 1)
+        for key in self.bank.participants():
+            seed, condition, valid = self.bank.entry(key)
+            self.assertTrue(valid)
+            rng = random.Random(seed)
+            self.assertEqual(self.bank.schedules(key), [build_block(space, n, rng) for n in LENGTHS])
+
+    def test_stations_get_their_own_entries(self):
+        self.assertNotIn((3, 1), self.bank)
+        seeds = [self.bank.entry(key)[0] for key in self.bank.participants()]
+        self.assertEqual(len(set(seeds)), len(seeds))
+
+        # Conditions alternate by participant, each station starting on a different one
+        conditions = dict((key, self.bank.entry(key)[1]) for key in self.bank.participants())
+        self.assertEqual([conditions[(1, p)] for p in (1, 2, 3)], ['square', 'diamond', 'square'])
+        self.assertEqual([conditions[(2, p)] for p in (1, 2, 3)], ['diamond', 'square', 'diamond'])
+
+    def test_revalidates_clean(self):
+        self.assertEqual(validate_bank(self.path, processes=1), {})
+
+    def test_rejects_damaged_files(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        truncated = os.path.join(self.directory, 'truncated.bank')
+        with open(truncated, 'wb') as f:
+            f.write(data[:-1])
+        self.assertRaises(ValueError, ScheduleBank, truncated)
+
+        foreign = os.path.join(self.directory, 'foreign.bank')
+        with open(foreign, 'wb') as f:
+            f.write(b'XXXX' + data[4:])
+        self.assertRaises(ValueError, ScheduleBank, foreign)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from sessions import layout, SCHEMA
+from trial_space import legal_trials, display_domains, build_block
+from trial_geometry import GeometryTable
+from trial_record import build_row
+from session_log import SessionLog, Replay, rebuild_trials, audit_report, read_log, HEADER, RECORD, RESPONSE
+
+
+class ReplayTest(unittest.TestCase):
+    # A session of 40 trials, logged as NP_IOR logs them, with the rows NP_IOR.trial() returned
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'p1.npsl')
+
+        ring = layout('diamond')
+        ids = ring.far_ids + ring.near_ids
+        self.keys = dict((100 + loc, ring.labels[loc]) for loc in ids)
+        key_codes = dict((label, key) for key, label in self.keys.items())
+        geometry = GeometryTable(ring.distances(), ring.cog_locs())
+
+        rng = random.Random(3)
+        log = SessionLog(self.path, 1, ring.n, 60.0, ring.locs(ids), self.keys)
+        self.rows, t = [], 1000.0
+        for i, trial in enumerate(build_block(legal_trials(display_domains(ring.far_ids, ring.near_ids)), 40, rng)):
+            block, practicing = (1, True) if i < 10 else (2, False)
+            labels = tuple(ring.labels[loc] for loc in trial[1:])
+            log.trial(block, practicing, trial)
+
+            # The probe appears a frame late on every 4th trial
+            late = 1 / 60.0 if i % 4 == 0 else 0.0
+            onsets = {'array': t, 'prime': t + 0.5, 'isi': t + 1.2, 'probe': t + 1.5 + late}
+            for display in ('array', 'prime', 'isi', 'probe'):
+                log.onset(display, onsets[display])
+
+            displays = []
+            for display, options in (('prime', labels[:2]), ('probe', labels[2:])):
+                if i % 7 == 6:
+                    response = ('NA', 'NA')
+                else:
+                    rt = rng.uniform(300, 600)
+                    response = (rng.choice(options), rt)
+                    log.key(key_codes[response[0]], onsets[display] + rt / 1000.0)
+                log.response(display, *response)
+                displays.append(response)
+            log.flush()
+
+            self.rows.append(build_row(block, i + 1 if practicing else i - 9, practicing, trial[0],
+                                       geometry[trial], labels, *displays))
+            t += 3.0
+        log.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertRowsEqual(self, rows, expected):
+        self.assertEqual(len(rows), len(expected))
+        for row, want in zip(rows, expected):
+            self.assertEqual(sorted(row), sorted(want))
+            for col, value in want.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(row[col], value, places=6)
+                else:
+                    self.assertEqual(row[col], value, col)
+
+    def test_replay_reproduces_the_rows(self):
+        replay = Replay(self.path)
+        self.assertEqual(len(replay), 40)
+        self.assertEqual(replay.header['participant_id'], 1)
+        self.assertEqual(replay.keymap, self.keys)
+        self.assertRowsEqual(list(replay.rows()), self.rows)
+
+    def test_key_presses_stand_in_for_missing_responses(self):
+        # As after a crash between the last trial's key presses & its responses being logged
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        _, records = read_log(self.path)
+        dropped = (records['kind'] == RESPONSE) & (records['trial'] == 40)
+
+        trimmed = os.path.join(self.directory, 'trimmed.npsl')
+        with open(trimmed, 'wb') as f:
+            f.write(data[:HEADER.size])
+            for i in range(len(records)):
+                if not dropped[i]:
+                    f.write(data[HEADER.size + i * RECORD.size:HEADER.size + (i + 1) * RECORD.size])
+
+        self.assertRowsEqual(list(Replay(trimmed).rows()), self.rows)
+
+    def test_audit(self):
+        replay = Replay(self.path)
+        for i, late, mismatched in replay.audit():
+            self.assertAlmostEqual(late['prime'], 0.0, places=6)
+            self.assertAlmostEqual(late['probe'], 1000 / 60.0 if i % 4 == 0 else 0.0, places=6)
+            self.assertEqual(mismatched, [])
+        self.assertIn("responses not matching key presses: 0", audit_report(self.path))
+
+    def test_rebuild_trials(self):
+        db = os.path.join(self.directory, 'trials.db')
+        conn = sqlite3.connect(db)
+        conn.executescript(open(SCHEMA).read())
+        conn.close()
+
+        self.assertEqual(rebuild_trials(self.path, db, 1), 40)
+        conn = sqlite3.connect(db)
+        conn.row_factory = sqlite3.Row
+        rows = [dict(r) for r in conn.execute("SELECT * FROM trials ORDER BY id")]
+        conn.close()
+
+        for row, want in zip(rows, self.rows):
+            self.assertEqual(row['participant_id'], 1)
+            self.assertEqual((row['trial_type'], row['prime_choice'], row['probe_choice']),
+                             (want['trial_type'], want['prime_choice'], want['probe_choice']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from itertools import product
+
+import numpy as np
+
+from sessions import layout, RADIUS
+from ring_layout import RingLayout
+from trial_space import legal_trials, display_domains
+from trial_geometry import GeometryTable, trial_type, classify
+from trials_schema import FAR_NEAR, TRIAL_TYPES
+
+LAYOUTS = {
+    'square':  layout('square'),
+    'diamond': layout('diamond'),
+    'ring-12': RingLayout((960, 540), 6, [RADIUS]),
+}
+
+
+class ClassifyTest(unittest.TestCase):
+
+    def test_matches_trial_type_over_the_trial_space(self):
+        for name, ring in LAYOUTS.items():
+            cog_locs = ring.cog_locs()
+            trials = list(legal_trials(display_domains(ring.far_ids, ring.near_ids)))
+            codes = np.array([[FAR_NEAR.index(t[0])] + t[1:] for t in trials], dtype=np.intp)
+
+            table = GeometryTable(ring.distances(), cog_locs)
+            labels = [TRIAL_TYPES[c] for c in classify(codes, table.cog).tolist()]
+            self.assertEqual(labels, [trial_type(*(t + [cog_locs])) for t in trials], name)
+
+    def test_matches_trial_type_off_the_trial_space(self):
+        # Including overlapping & erroneous arrangements no schedule would produce
+        ring = LAYOUTS['square']
+        cog_locs = ring.cog_locs()
+        locs = ring.far_ids + ring.near_ids
+        trials = [[fn] + list(l) for fn in FAR_NEAR for l in product(ring.far_ids, ring.far_ids, locs, locs)]
+        codes = np.array([[FAR_NEAR.index(t[0])] + t[1:] for t in trials], dtype=np.intp)
+
+        labels = [TRIAL_TYPES[c] for c in classify(codes, GeometryTable(ring.distances(), cog_locs).cog).tolist()]
+        self.assertEqual(labels, [trial_type(*(t + [cog_locs])) for t in trials])
+
+
+class GeometryTableTest(unittest.TestCase):
+
+    def test_entries(self):
+        ring = LAYOUTS['diamond']
+        cog_locs, dist = ring.cog_locs(), ring.distances()
+        trials = [tuple(t) for t in legal_trials(display_domains(ring.far_ids, ring.near_ids))]
+
+        table = GeometryTable(dist, cog_locs)
+        table.prebuild(trials)
+        self.assertEqual(len(table), len(trials))
+
+        for trial in trials:
+            _, t_prime, d_prime, t_probe, d_probe = trial
+            geometry = table[trial]
+            self.assertEqual(geometry.trial_type, trial_type(*(trial + (cog_locs,))))
+            self.assertEqual(geometry.at_cog, geometry.trial_type in ('T.at.CoG-near', 'D.at.CoG-near'))
+            self.assertEqual(
+                (geometry.t_prime_to_t_probe, geometry.t_prime_to_d_probe,
+                 geometry.d_prime_to_t_probe, geometry.d_prime_to_d_probe),
+                (dist[t_prime, t_probe], dist[t_prime, d_probe], dist[d_prime, t_probe], dist[d_prime, d_probe])
+            )
+
+    def test_lookup_fills_missing_entries(self):
+        ring = LAYOUTS['square']
+        table = GeometryTable(ring.distances(), ring.cog_locs())
+        first = table[['far', 1, 2, 2, 1]]
+        self.assertEqual(first.trial_type, 'switch')
+        self.assertEqual(len(table), 1)
+        self.assertIs(table[('far', 1, 2, 2, 1)], first)
+
+
+if __name__ == '__main__':
+    unittest.main()
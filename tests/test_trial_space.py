@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+from itertools import permutations
+
+from sessions import layout
+from ring_layout import RingLayout
+from trial_space import TrialSpace, DISPLAY_DOMAINS, display_domains, build_block
+from trial_store import TrialStore
+
+
+def enumerate_space(domains):
+    # The space as nested permutations over each display's domain
+    return [[far_or_near] + list(prime) + list(probe)
+            for far_or_near, prime_domain, probe_domain in domains
+            for prime in permutations(prime_domain, 2)
+            for probe in permutations(probe_domain, 2)]
+
+
+class TrialSpaceTest(unittest.TestCase):
+
+    def setUp(self):
+        # The default space & one over two rings of 6 far locations
+        ring = RingLayout((960, 540), 6, [112.0, 224.0])
+        domains = display_domains(ring.far_ids, ring.near_ids)
+        self.spaces = [(DISPLAY_DOMAINS, TrialSpace()), (domains, TrialSpace(domains))]
+
+    def test_indexing_follows_permutation_order(self):
+        for domains, space in self.spaces:
+            expected = enumerate_space(domains)
+            self.assertEqual(len(space), len(expected))
+            self.assertEqual(list(space), expected)
+            self.assertEqual(space[-1], expected[-1])
+            self.assertRaises(IndexError, space.__getitem__, len(space))
+
+    def test_index_inverts_getitem(self):
+        for _, space in self.spaces:
+            for i, trial in enumerate(space):
+                self.assertEqual(space.index(trial), i)
+                self.assertIn(trial, space)
+
+    def test_illegitimate_trials_are_rejected(self):
+        space = TrialSpace()
+        for trial in (['far', 1, 1, 2, 3], ['far', 1, 2, 5, 6], ['near', 1, 2, 3, 4], ['near', 5, 6, 7, 8]):
+            self.assertNotIn(trial, space)
+            self.assertRaises(ValueError, space.index, trial)
+
+    def test_decode_matches_getitem(self):
+        for _, space in self.spaces:
+            indices = random.Random(1).sample(range(len(space)), 200) + [0, len(space) - 1]
+            decoded = space.decode(indices)
+            self.assertEqual([list(t) for t in decoded.tuples()], [space[i] for i in indices])
+            self.assertTrue(space.legal(decoded).all())
+
+    def test_build_block_is_the_same_from_a_space_or_a_list(self):
+        ring = layout('diamond')
+        space = TrialSpace(display_domains(ring.far_ids, ring.near_ids))
+        for length in (25, 288, 300):
+            from_space = build_block(space, length, random.Random(7))
+            from_list = build_block(list(space), length, random.Random(7))
+            self.assertIsInstance(from_space, TrialStore)
+            self.assertEqual(len(from_space), length)
+            self.assertEqual(from_space.tuples(), from_list.tuples())
+
+
+if __name__ == '__main__':
+    unittest.main()
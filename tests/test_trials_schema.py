@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from sessions import build_db
+from trials_schema import migrate, is_typed, encode_trial, CONVERTED_COLS, CODED_COLS, BOOL_COLS
+
+KEY_COLS = ('id', 'participant_id', 'block_num', 'trial_num')
+
+
+def fetch(conn, table):
+    cols = KEY_COLS + CONVERTED_COLS
+    query = "SELECT {0} FROM {1} ORDER BY id".format(", ".join(cols), table)
+    return [dict(zip(cols, row)) for row in conn.execute(query)]
+
+
+class MigrateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'trials.db')
+        build_db(self.path, participants=((1, 'square', 96), (2, 'diamond', 96)))
+
+        conn = sqlite3.connect(self.path)
+        self.text_rows = fetch(conn, 'trials')
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_typed_layout(self):
+        self.assertTrue(migrate(self.path))
+        conn = sqlite3.connect(self.path)
+        self.assertTrue(is_typed(conn))
+
+        declared = dict((r[1], r[2].lower()) for r in conn.execute("PRAGMA table_info(trials)"))
+        for col, _ in CODED_COLS:
+            self.assertEqual(declared[col], 'integer')
+        for col in BOOL_COLS:
+            self.assertEqual(declared[col], 'integer')
+        self.assertEqual(declared['probe_rt'], 'real')
+
+        typed_rows = fetch(conn, 'trials')
+        conn.close()
+        self.assertEqual(len(typed_rows), len(self.text_rows))
+        for text, typed in zip(self.text_rows, typed_rows):
+            # Migrated rows are as NP_IOR would have written them with typed_trials set
+            expected = encode_trial(text)
+            for col in CONVERTED_COLS:
+                if isinstance(expected[col], float):
+                    self.assertAlmostEqual(typed[col], expected[col])
+                else:
+                    self.assertEqual(typed[col], expected[col], col)
+
+        # Misses are NULL rather than 'NA'
+        self.assertTrue(any(row['probe_rt'] is None for row in typed_rows))
+
+    def test_labelled_view_gives_the_original_labels(self):
+        migrate(self.path)
+        conn = sqlite3.connect(self.path)
+        labelled = fetch(conn, 'trials_labelled')
+        conn.close()
+
+        self.assertEqual(len(labelled), len(self.text_rows))
+        for text, row in zip(self.text_rows, labelled):
+            for col, _ in CODED_COLS:
+                self.assertEqual(row[col], None if text[col] == 'NA' else text[col], col)
+
+    def test_migrating_again_changes_nothing(self):
+        self.assertTrue(migrate(self.path))
+        self.assertFalse(migrate(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
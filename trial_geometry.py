@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+from collections import namedtuple
+
+import numpy as np
+
+from trials_schema import FAR_NEAR, TRIAL_TYPES
+
+# Everything trial_prep() needs to know about a trial's display arrangement
+TrialGeometry = namedtuple('TrialGeometry', [
+    't_prime_to_t_probe', 't_prime_to_d_probe', 'd_prime_to_t_probe', 'd_prime_to_d_probe',
+    'trial_type', 'at_cog'
+])
+
+COG_TYPES = ('T.at.CoG-near', 'D.at.CoG-near')
+
+
+def trial_type(far_or_near, t_prime, d_prime, t_probe, d_probe, cog_locs):
+    # Locations are compared by index; cog_locs maps each (unordered) pair of prime
+    # locations to the location lying at their centre of gravity, where there is one.
+    if far_or_near == 'far':
+
+        if (t_prime, d_prime) == (t_probe, d_probe):
+            return 'repeat'
+
+        elif (t_prime, d_prime) == (d_probe, t_probe):
+            return 'switch'
+
+        elif (t_prime != t_probe) and (d_prime != d_probe) and \
+             (t_prime != d_probe) and (d_prime != t_probe):
+            return 'control-far'
+
+        elif (t_prime == t_probe) and (d_prime != d_probe):
+            return 'T.to.T-far'
+
+        elif (d_prime == d_probe) and (t_prime != t_probe):
+            return 'D.to.D-far'
+
+        elif (d_probe == t_prime) and (t_probe != d_prime):
+            return 'D.to.T-far'
+
+        elif (t_probe == d_prime) and (d_probe != t_prime):
+            return 'T.to.D-far'
+
+        else:
+            return 'erroneous'
+
+    else:
+        cog = cog_locs.get(frozenset((t_prime, d_prime)))
+
+        if t_probe == cog:
+            return 'T.at.CoG-near'
+
+        elif d_probe == cog:
+            return 'D.at.CoG-near'
+
+        else:
+            return 'control-near'
+
+
+def classify(trials, cog):
+    # Vectorized trial_type() over a (trials, 5) integer array of [far_or_near code,
+    # t_prime, d_prime, t_probe, d_probe], where cog is a square matrix giving the location
+    # at the centre of gravity of each pair of locations (0 where there is none). Returns
+    # each trial's index into TRIAL_TYPES.
+    far = trials[:, 0] == FAR_NEAR.index('far')
+    t_prime, d_prime, t_probe, d_probe = trials[:, 1], trials[:, 2], trials[:, 3], trials[:, 4]
+    at_cog = cog[t_prime, d_prime]
+
+    # In the same order as trial_type()'s branches, as the first match wins
+    labels = [
+        (far & (t_prime == t_probe) & (d_prime == d_probe),                  'repeat'),
+        (far & (t_prime == d_probe) & (d_prime == t_probe),                  'switch'),
+        (far & (t_prime != t_probe) & (d_prime != d_probe) &
+               (t_prime != d_probe) & (d_prime != t_probe),                  'control-far'),
+        (far & (t_prime == t_probe) & (d_prime != d_probe),                  'T.to.T-far'),
+        (far & (d_prime == d_probe) & (t_prime != t_probe),                  'D.to.D-far'),
+        (far & (d_probe == t_prime) & (t_probe != d_prime),                  'D.to.T-far'),
+        (far & (t_probe == d_prime) & (d_probe != t_prime),                  'T.to.D-far'),
+        (far,                                                                'erroneous'),
+        (t_probe == at_cog,                                                  'T.at.CoG-near'),
+        (d_probe == at_cog,                                                  'D.at.CoG-near'),
+    ]
+    return np.select(
+        [cond for cond, _ in labels], [TRIAL_TYPES.index(label) for _, label in labels],
+        default=TRIAL_TYPES.index('control-near')
+    )
+
+
+class GeometryTable(object):
+    # Item distances & trial type for each trial, keyed by its (far_or_near, t_prime, d_prime,
+    # t_probe, d_probe) tuple. Distances come from a pairwise matrix over all locations (see
+    # RingLayout.distances()), so the table only ever holds the trials actually scheduled:
+    # prebuild() fills it for whole schedules at once, so that nothing needs to be worked
+    # out between fixation and trial onset, & any other trial is worked out on first lookup.
+
+    def __init__(self, distances, cog_locs):
+        self.distances = distances
+        self.cog_locs = cog_locs
+
+        self.cog = np.zeros(distances.shape, dtype=np.intp)
+        for pair, loc in cog_locs.items():
+            a, b = tuple(pair)
+            self.cog[a, b] = self.cog[b, a] = loc
+
+        self.table = {}
+
+    def prebuild(self, trials):
+        # A TrialStore's distinct trials are found without decoding each one
+        distinct = trials.distinct() if hasattr(trials, 'distinct') else (tuple(t) for t in trials)
+        keys = sorted(set(distinct) - set(self.table))
+        if not keys:
+            return
+
+        codes = np.array([[FAR_NEAR.index(k[0])] + list(k[1:]) for k in keys], dtype=np.intp)
+        t_prime, d_prime, t_probe, d_probe = codes[:, 1], codes[:, 2], codes[:, 3], codes[:, 4]
+        dist = self.distances
+
+        columns = zip(
+            dist[t_prime, t_probe].tolist(), dist[t_prime, d_probe].tolist(),
+            dist[d_prime, t_probe].tolist(), dist[d_prime, d_probe].tolist(),
+            classify(codes, self.cog).tolist()
+        )
+        for key, (tt, td, dt, dd, code) in zip(keys, columns):
+            label = TRIAL_TYPES[code]
+            self.table[key] = TrialGeometry(tt, td, dt, dd, label, label in COG_TYPES)
+
+    def __getitem__(self, trial):
+        key = tuple(trial)
+        if key not in self.table:
+            self.prebuild([key])
+        return self.table[key]
+
+    def __len__(self):
+        return len(self.table)
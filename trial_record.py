@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Scoring of a trial's responses into the row written to the trials table, shared by
+# NP_IOR.trial() & the session log replay (see session_log.py), so both give identical rows.
+
+
+def choice(response, target, distractor):
+    # Which item (if either) a response picked, by location label
+    if response == target:
+        return 'target'
+    elif response == distractor:
+        return 'distractor'
+    else:
+        return 'empty_cell'
+
+
+def build_row(block_num, trial_num, practicing, far_or_near, geometry, labels, prime, probe):
+    # labels: location labels of (T prime, D prime, T probe, D probe); prime & probe are each
+    # display's (response, rt), either being 'NA' if no response was made
+    t_prime, d_prime, t_probe, d_probe = labels
+    response_prime, rt_prime = prime
+    response_probe, rt_probe = probe
+
+    return {
+        "block_num":            block_num,
+        "trial_num":            trial_num,
+        "practicing":           str(practicing),
+        "far_near":             far_or_near,
+        'trial_type':           geometry.trial_type,
+        'prime_rt':             rt_prime,
+        'probe_rt':             rt_probe,
+        'prime_correct':        str(response_prime == t_prime),
+        'probe_correct':        str(response_probe == t_probe),
+        't_prime_to_t_probe':   geometry.t_prime_to_t_probe,
+        't_prime_to_d_probe':   geometry.t_prime_to_d_probe,
+        'd_prime_to_t_probe':   geometry.d_prime_to_t_probe,
+        'd_prime_to_d_probe':   geometry.d_prime_to_d_probe,
+        'prime_choice':         choice(response_prime, t_prime, d_prime),
+        'probe_choice':         choice(response_probe, t_probe, d_probe),
+        'prime_response':       response_prime,
+        'probe_response':       response_probe,
+        't_prime_loc':          t_prime,
+        'd_prime_loc':          d_prime,
+        't_probe_loc':          t_probe,
+        'd_probe_loc':          d_probe
+    }
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+import random
+from itertools import permutations
+
+try:
+    from collections.abc import Sequence
+except ImportError:  # Python 2
+    from collections import Sequence
+
+import numpy as np
+
+from trial_store import FACTORS, TrialStore
+
+# Location indices of the default, single 4-location ring (see ring_layout.py)
+FAR_LOCS  = (1, 2, 3, 4)
+NEAR_LOCS = (5, 6, 7, 8)
+
+# Declared constraints on the trial space:
+#   - prime items are always presented at far locations
+#   - probe items appear at far locations on 'far' trials, and near locations on 'near' trials
+#   - targets & distractors cannot overlap within a given display
+# The first two are expressed as the location domain of each display, the last by drawing
+# each display as an ordered pair of distinct locations from its domain.
+DISPLAY_DOMAINS = (
+    ('far',  FAR_LOCS, FAR_LOCS),
+    ('near', FAR_LOCS, NEAR_LOCS),
+)
+
+PRACTICE_TRIALS = 25
+
+
+def display_domains(far_locs, near_locs):
+    # The declared constraints above, for an arbitrary set of far & near locations
+    return (
+        ('far',  tuple(far_locs), tuple(far_locs)),
+        ('near', tuple(far_locs), tuple(near_locs)),
+    )
+
+
+def _pair(domain, i):
+    # i-th ordered pair of distinct locations from domain, in itertools.permutations() order
+    a, b = divmod(i, len(domain) - 1)
+    return domain[a], domain[b if b < a else b + 1]
+
+
+def _pair_index(positions, first, second):
+    a, b = positions[first], positions[second]
+    if a == b:
+        raise ValueError("Pair ({0}, {1}) overlaps".format(first, second))
+    return a * (len(positions) - 1) + (b if b < a else b - 1)
+
+
+class TrialSpace(Sequence):
+    # The legitimate (far_or_near, prime_target, prime_distractor, probe_target,
+    # probe_distractor) combinations, as a read-only sequence. Trials are decoded from their
+    # index on demand, so the space costs no memory however many locations there are
+    # (it grows with the 4th power of the number of locations); 2 x 12 x 12 = 288 for the
+    # default domains. Ordering matches nested itertools.permutations() over each domain.
+
+    def __init__(self, domains=DISPLAY_DOMAINS):
+        self.domains = []
+        offset = 0
+        for far_or_near, prime_domain, probe_domain in domains:
+            prime_pairs = len(prime_domain) * (len(prime_domain) - 1)
+            probe_pairs = len(probe_domain) * (len(probe_domain) - 1)
+            self.domains.append((
+                far_or_near, tuple(prime_domain), tuple(probe_domain), offset, probe_pairs,
+                dict((loc, i) for i, loc in enumerate(prime_domain)),
+                dict((loc, i) for i, loc in enumerate(probe_domain))
+            ))
+            offset += prime_pairs * probe_pairs
+        self.size = offset
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("trial index out of range")
+
+        for far_or_near, prime_domain, probe_domain, offset, probe_pairs, _, _ in reversed(self.domains):
+            if i >= offset:
+                prime, probe = divmod(i - offset, probe_pairs)
+                return [far_or_near] + list(_pair(prime_domain, prime)) + list(_pair(probe_domain, probe))
+
+    def index(self, trial):
+        # Position of a trial in the space, raising ValueError if it isn't legitimate
+        far_or_near, prime_t, prime_d, probe_t, probe_d = trial
+        for label, _, _, offset, probe_pairs, prime_pos, probe_pos in self.domains:
+            if label == far_or_near:
+                try:
+                    prime = _pair_index(prime_pos, prime_t, prime_d)
+                    probe = _pair_index(probe_pos, probe_t, probe_d)
+                except KeyError:
+                    break
+                return offset + prime * probe_pairs + probe
+        raise ValueError("{0} is not a legitimate trial".format(list(trial)))
+
+    def __contains__(self, trial):
+        try:
+            self.index(trial)
+        except ValueError:
+            return False
+        return True
+
+    def decode(self, indices):
+        # The trials at the given indices, decoded all at once into a TrialStore
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = [np.zeros(len(indices), dtype=np.int64) for _ in FACTORS]
+
+        for code, (_, prime_domain, probe_domain, offset, probe_pairs, _, _) in enumerate(self.domains):
+            size = len(prime_domain) * (len(prime_domain) - 1) * probe_pairs
+            at = (indices >= offset) & (indices < offset + size)
+            prime, probe = np.divmod(indices[at] - offset, probe_pairs)
+            columns[0][at] = code
+            for col, pairs, domain in ((1, prime, prime_domain), (3, probe, probe_domain)):
+                first, second = np.divmod(pairs, len(domain) - 1)
+                second = np.where(second < first, second, second + 1)
+                columns[col][at] = np.asarray(domain)[first]
+                columns[col + 1][at] = np.asarray(domain)[second]
+
+        return TrialStore.from_columns(*columns)
+
+    def legal(self, trials):
+        # Vectorized __contains__ over a TrialStore, as a boolean mask
+        return trials.legal_mask([(label, prime, probe) for label, prime, probe, _, _, _, _ in self.domains])
+
+    def item_pairs(self):
+        # Every (target, distractor) location pair a display can use, without walking the trials
+        pairs = set()
+        for _, prime_domain, probe_domain, _, _, _, _ in self.domains:
+            pairs.update(permutations(prime_domain, 2))
+            pairs.update(permutations(probe_domain, 2))
+        return pairs
+
+
+def legal_trials(domains=DISPLAY_DOMAINS):
+    # Enumerates only the legitimate trial combinations (see TrialSpace)
+    return TrialSpace(domains)
+
+
+def build_block(trials, length, rng=random):
+    # Fills a block with as many complete, shuffled passes through the trial space as fit,
+    # topping up any remainder with a random subset (e.g. the 25-trial practice block).
+    # Trial indices are drawn & shuffled, then decoded at once into a TrialStore; the
+    # generator is used exactly as when whole trials were, so a seed gives the same block.
+    passes, remainder = divmod(length, len(trials))
+
+    order = [i for _ in range(passes) for i in range(len(trials))]
+    order += rng.sample(range(len(trials)), remainder)
+    rng.shuffle(order)
+
+    if isinstance(trials, TrialSpace):
+        return trials.decode(order)
+    return TrialStore.from_trials([trials[i] for i in order])
+
+
+def load_block(block, trials):
+    # Swaps a klibs block's trial list for one built here, resetting its iteration state
+    block.trials = trials
+    block.length = len(trials)
+    block.i = 0
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Compact storage for trial lists. A TrialStore keeps its trials in a numpy structured array
+# of 5 one-byte fields (far_or_near as an index into FAR_NEAR, then the four location
+# numbers), in place of a Python list of 5-item lists, while still behaving as a mutable
+# sequence of trials so klibs can iterate, index & recycle its blocks' trials as before.
+# Indexing yields a TrialRecord: a detached, __slots__-based copy of one trial that
+# iterates & indexes like the old ['near', 3, 2, 5, 4] lists, & exposes named fields.
+
+try:
+    from collections.abc import MutableSequence
+except ImportError:  # Python 2
+    from collections import MutableSequence
+
+import numpy as np
+
+from trials_schema import FAR_NEAR
+
+# Trial fields, in the same order as the variables declared in NP_IOR_independent_variables.py
+FACTORS = ('far_or_near', 'prime_target', 'prime_distractor', 'probe_target', 'probe_distractor')
+TRIAL_DTYPE = np.dtype([(name, 'u1') for name in FACTORS])
+TRIAL_BYTES = TRIAL_DTYPE.itemsize
+
+
+class TrialRecord(object):
+    __slots__ = FACTORS
+
+    def __init__(self, far_or_near, prime_target, prime_distractor, probe_target, probe_distractor):
+        self.far_or_near = far_or_near
+        self.prime_target = prime_target
+        self.prime_distractor = prime_distractor
+        self.probe_target = probe_target
+        self.probe_distractor = probe_distractor
+
+    def __iter__(self):
+        yield self.far_or_near
+        yield self.prime_target
+        yield self.prime_distractor
+        yield self.probe_target
+        yield self.probe_distractor
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        return getattr(self, FACTORS[i])
+
+    def __len__(self):
+        return len(FACTORS)
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class TrialStore(MutableSequence):
+
+    def __init__(self, array=None):
+        self.array = np.zeros(0, dtype=TRIAL_DTYPE) if array is None else array
+
+    @classmethod
+    def from_trials(cls, trials):
+        # From any sequence of trials (lists, tuples, records)
+        rows = [(FAR_NEAR.index(t[0]), t[1], t[2], t[3], t[4]) for t in trials]
+        return cls(np.array(rows, dtype=TRIAL_DTYPE))
+
+    @classmethod
+    def from_columns(cls, far_near, prime_t, prime_d, probe_t, probe_d):
+        # From arrays of FAR_NEAR codes & location numbers
+        array = np.empty(len(far_near), dtype=TRIAL_DTYPE)
+        for name, column in zip(FACTORS, (far_near, prime_t, prime_d, probe_t, probe_d)):
+            array[name] = column
+        return cls(array)
+
+    @classmethod
+    def product(cls, prime_locs, probe_locs):
+        # Every combination of far/near, prime & probe locations (the full factorial klibs
+        # generates from the independent variables, overlapping & misplaced items included)
+        grids = np.meshgrid(np.arange(len(FAR_NEAR)), prime_locs, prime_locs, probe_locs, probe_locs, indexing='ij')
+        return cls.from_columns(*[g.ravel() for g in grids])
+
+    @classmethod
+    def frombuffer(cls, data):
+        # From 5 bytes per trial, as written by tobytes()
+        return cls(np.frombuffer(bytes(data), dtype=TRIAL_DTYPE).copy())
+
+    def tobytes(self):
+        return self.array.tobytes()
+
+    def __len__(self):
+        return len(self.array)
+
+    def _record(self, row):
+        code, prime_t, prime_d, probe_t, probe_d = row
+        return TrialRecord(FAR_NEAR[code], prime_t, prime_d, probe_t, probe_d)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return TrialStore(self.array[i].copy())
+        return self._record(self.array[i].item())
+
+    def __iter__(self):
+        for code, prime_t, prime_d, probe_t, probe_d in self.array.tolist():
+            yield TrialRecord(FAR_NEAR[code], prime_t, prime_d, probe_t, probe_d)
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            value = value if isinstance(value, TrialStore) else TrialStore.from_trials(value)
+            self.array[i] = value.array
+        else:
+            self.array[i] = (FAR_NEAR.index(value[0]), value[1], value[2], value[3], value[4])
+
+    def __delitem__(self, i):
+        self.array = np.delete(self.array, i)
+
+    def insert(self, i, value):
+        self.array = np.insert(self.array, i, TrialStore.from_trials([value]).array)
+
+    def __add__(self, other):
+        return TrialStore(np.concatenate([self.array, as_store(other).array]))
+
+    def __eq__(self, other):
+        if isinstance(other, TrialStore):
+            return np.array_equal(self.array, other.array)
+        try:
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def legal_mask(self, domains):
+        # Vectorized check of the declared constraints (see trial_space.py) for each trial,
+        # given (far_or_near, prime domain, probe domain) for each kind of trial: items at
+        # locations within the display's domain, & not overlapping within a display
+        a = self.array
+        mask = np.zeros(len(a), dtype=bool)
+        for far_or_near, prime_domain, probe_domain in domains:
+            mask |= (
+                (a['far_or_near'] == FAR_NEAR.index(far_or_near)) &
+                np.isin(a['prime_target'], prime_domain) & np.isin(a['prime_distractor'], prime_domain) &
+                np.isin(a['probe_target'], probe_domain) & np.isin(a['probe_distractor'], probe_domain)
+            )
+        return mask & (a['prime_target'] != a['prime_distractor']) & (a['probe_target'] != a['probe_distractor'])
+
+    def filter(self, mask):
+        return TrialStore(self.array[mask])
+
+    def tuples(self):
+        # Every trial as a plain tuple; many times faster to loop over than the records
+        # iteration yields, so used wherever whole schedules are read in Python
+        a = self.array
+        labels = [FAR_NEAR[code] for code in a['far_or_near'].tolist()]
+        return list(zip(labels, *[a[name].tolist() for name in FACTORS[1:]]))
+
+    def distinct(self):
+        # Each distinct trial once, as a tuple
+        return [(FAR_NEAR[row[0]],) + tuple(row[1:]) for row in np.unique(self.array).tolist()]
+
+
+def as_store(trials):
+    return trials if isinstance(trials, TrialStore) else TrialStore.from_trials(trials)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+import atexit
+import sqlite3
+import threading
+
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+
+_FLUSH = object()
+_STOP = object()
+
+
+class TrialWriter(object):
+    # Queues rows & commits them in batches from a background thread on its own WAL-mode
+    # connection, keeping disk I/O out of the trial loop. Rows are committed whenever
+    # batch_size accumulate, on flush(), and on close(), which is also registered to run at
+    # exit so that nothing queued is lost on a normal quit.
+
+    def __init__(self, db_path, batch_size=32):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.error = None
+        self.closed = False
+
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run, name='TrialWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+        atexit.register(self.close)
+
+    def insert(self, row, table='trials'):
+        self._queue.put((table, dict(row)))
+
+    def flush(self):
+        # Blocks until every row queued so far has been committed. If the writer thread has
+        # stopped (e.g. the database couldn't be opened), raises its error rather than waiting
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        while not done.wait(0.1):
+            if not self._thread.is_alive():
+                self._raise()
+                raise RuntimeError("TrialWriter has stopped; queued rows weren't written to {0}".format(self.db_path))
+        self._raise()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put((_STOP, None))
+        self._thread.join()
+        self._raise()
+
+    def intercept(self, db, tables, default_table='trials', transforms=None):
+        # Routes klibs' inserts into the given tables through the writer, optionally passing
+        # rows through a per-table transform first. Inserts into any other table (e.g. the
+        # participants row, whose id klibs needs back) still go straight through klibs'
+        # own connection.
+        insert = db.insert
+        transforms = transforms or {}
+
+        def queued_insert(data, table=None, *args, **kwargs):
+            target = table or default_table
+            if target not in tables:
+                return insert(data, table, *args, **kwargs)
+
+            # A row klibs hands over in some other form would skip the transforms, & one
+            # without a participant would only fail at commit, so both are refused here
+            if not isinstance(data, dict):
+                raise TypeError("Expected a dict for an insert into '{0}', got {1}".format(target, type(data).__name__))
+            if data.get('participant_id') is None:
+                raise ValueError("Row for '{0}' has no participant_id: {1}".format(target, data))
+
+            if target in transforms:
+                data = transforms[target](data)
+            self.insert(data, target)
+            return None
+
+        db.insert = queued_insert
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.Error as e:
+            # Nothing can be written; flush() & close() find the thread stopped & raise this
+            self.error = e
+            return
+
+        pending = []
+        while True:
+            table, item = self._queue.get()
+
+            if table is _FLUSH:
+                self._commit(conn, pending)
+                item.set()
+                continue
+
+            if table is _STOP:
+                self._commit(conn, pending)
+                break
+
+            pending.append((table, item))
+            if len(pending) >= self.batch_size:
+                self._commit(conn, pending)
+
+        conn.close()
+
+    def _commit(self, conn, pending):
+        if not pending:
+            return
+
+        # Rows going to the same table with the same columns are written with one executemany
+        batches = {}
+        for table, row in pending:
+            cols = tuple(sorted(row))
+            batches.setdefault((table, cols), []).append(tuple(row[c] for c in cols))
+
+        try:
+            with conn:
+                for (table, cols), values in batches.items():
+                    q = "INSERT INTO {0} ({1}) VALUES ({2})".format(
+                        table, ", ".join(cols), ", ".join("?" * len(cols))
+                    )
+                    conn.executemany(q, values)
+        except sqlite3.Error as e:
+            # Rows are kept & retried at the next commit; the error surfaces on flush()/close()
+            self.error = e
+            return
+
+        del pending[:]
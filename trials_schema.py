@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Brett Feltmate"
+
+# Typed, integer-coded layout for the trials table, the codes it uses, and a migration
+# from the all-text layout in NP_IOR_schema.sql. Run as a script to migrate a database:
+#
+#   python trials_schema.py ExpAssets/NP_IOR.db
+#
+# 'klibs export' reads the trials table as it is, so once migrated its .txt files hold the
+# integer codes rather than labels. The trials_labelled view gives every trial with its
+# labels (SELECT * FROM trials_labelled), as does columnar_export.py.
+
+import os
+import sys
+import sqlite3
+
+from ring_layout import CONDITIONS, prime_labels
+
+TYPED_SCHEMA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'ExpAssets', 'Config', 'NP_IOR_trials_typed.sql'
+)
+
+# Codes are each label's (1-based) position in its tuple; never reorder, only append
+FAR_NEAR = ('far', 'near')
+TRIAL_TYPES = (
+    'repeat', 'switch', 'control-far', 'T.to.T-far', 'D.to.D-far', 'D.to.T-far', 'T.to.D-far',
+    'T.at.CoG-near', 'D.at.CoG-near', 'control-near', 'erroneous'
+)
+CHOICES = ('target', 'distractor', 'empty_cell')
+LOCATIONS = ('North', 'NorthEast', 'East', 'SouthEast', 'South', 'SouthWest', 'West', 'NorthWest')
+
+LOOKUPS = (
+    ('far_near_codes', FAR_NEAR),
+    ('trial_type_codes', TRIAL_TYPES),
+    ('choice_codes', CHOICES),
+    ('location_codes', LOCATIONS),
+)
+
+# Coded columns & the lookup table backing each
+CODED_COLS = (
+    ('far_near', 'far_near_codes'),
+    ('trial_type', 'trial_type_codes'),
+    ('prime_choice', 'choice_codes'),
+    ('probe_choice', 'choice_codes'),
+    ('prime_response', 'location_codes'),
+    ('probe_response', 'location_codes'),
+    ('t_prime_loc', 'location_codes'),
+    ('d_prime_loc', 'location_codes'),
+    ('t_probe_loc', 'location_codes'),
+    ('d_probe_loc', 'location_codes'),
+)
+BOOL_COLS = ('practicing', 'prime_correct', 'probe_correct')
+REAL_COLS = (
+    'prime_rt', 'probe_rt',
+    't_prime_to_t_probe', 't_prime_to_d_probe', 'd_prime_to_t_probe', 'd_prime_to_d_probe'
+)
+
+# Columns whose values change between the text & typed layouts
+CONVERTED_COLS = (
+    'practicing', 'far_near', 'trial_type', 'prime_rt', 'probe_rt', 'prime_correct', 'probe_correct',
+    't_prime_to_t_probe', 't_prime_to_d_probe', 'd_prime_to_t_probe', 'd_prime_to_d_probe',
+    'prime_choice', 'probe_choice', 'prime_response', 'probe_response',
+    't_prime_loc', 'd_prime_loc', 't_probe_loc', 'd_probe_loc'
+)
+
+POST_MIGRATION = """
+CREATE INDEX trials_participant_type_far_near ON trials (participant_id, trial_type, far_near);
+
+CREATE VIEW trials_labelled AS
+SELECT t.id, t.participant_id, t.block_num, t.trial_num, t.practicing,
+       fn.label AS far_near, tt.label AS trial_type,
+       t.prime_rt, t.probe_rt, t.prime_correct, t.probe_correct,
+       t.t_prime_to_t_probe, t.t_prime_to_d_probe, t.d_prime_to_t_probe, t.d_prime_to_d_probe,
+       pc.label AS prime_choice, qc.label AS probe_choice,
+       pr.label AS prime_response, qr.label AS probe_response,
+       tp.label AS t_prime_loc, dp.label AS d_prime_loc,
+       tq.label AS t_probe_loc, dq.label AS d_probe_loc
+FROM trials t
+JOIN far_near_codes fn ON fn.id = t.far_near
+JOIN trial_type_codes tt ON tt.id = t.trial_type
+JOIN choice_codes pc ON pc.id = t.prime_choice
+JOIN choice_codes qc ON qc.id = t.probe_choice
+LEFT JOIN location_codes pr ON pr.id = t.prime_response
+LEFT JOIN location_codes qr ON qr.id = t.probe_response
+JOIN location_codes tp ON tp.id = t.t_prime_loc
+JOIN location_codes dp ON dp.id = t.d_prime_loc
+JOIN location_codes tq ON tq.id = t.t_probe_loc
+JOIN location_codes dq ON dq.id = t.d_probe_loc;
+"""
+
+_codes = dict((table, dict((label, i + 1) for i, label in enumerate(labels))) for table, labels in LOOKUPS)
+
+
+def encode_trial(row):
+    # Converts a row as returned by NP_IOR.trial() into its typed form
+    row = dict(row)
+
+    for col, table in CODED_COLS:
+        if col in row:
+            row[col] = _codes[table].get(row[col])
+
+    for col in BOOL_COLS:
+        if col in row:
+            row[col] = 1 if row[col] in (True, 'True') else 0
+
+    for col in REAL_COLS:
+        if col in row:
+            row[col] = None if row[col] == 'NA' else float(row[col])
+
+    return row
+
+
+def is_typed(conn):
+    return conn.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'location_codes'"
+    ).fetchone()[0] > 0
+
+
+def table_columns(conn, table):
+    return [r[1] for r in conn.execute("PRAGMA table_info({0})".format(table))]
+
+
+def condition_case(col, typed, conditions=CONDITIONS):
+    # SQL expression giving the index into conditions of the arrangement a trial was run in,
+    # from the label of its prime target location col (-1 if it fits none), in either layout.
+    # The participants table doesn't record the condition, so it's told from the trials.
+    whens = []
+    for i, condition in enumerate(conditions):
+        labels = prime_labels(condition)
+        values = [str(LOCATIONS.index(l) + 1) for l in labels] if typed else ["'{0}'".format(l) for l in labels]
+        whens.append("WHEN {0} IN ({1}) THEN {2}".format(col, ", ".join(values), i))
+    return "CASE {0} ELSE -1 END".format(" ".join(whens))
+
+
+def migrate(db_path):
+    # Rewrites the trials table of a text-layout database into the typed layout, in a
+    # single transaction, then reclaims the space. Safe to run on an already typed database.
+    conn = sqlite3.connect(db_path)
+    conn.isolation_level = None
+
+    if is_typed(conn):
+        conn.close()
+        return False
+
+    cols = ('id', 'participant_id', 'block_num', 'trial_num') + CONVERTED_COLS
+    select = ('id', 'participant_id', 'block_num', 'trial_num') + tuple(_convert(c) for c in CONVERTED_COLS)
+
+    try:
+        conn.execute("BEGIN")
+        for statement in _statements(open(TYPED_SCHEMA).read()):
+            conn.execute(statement)
+        for table, labels in LOOKUPS:
+            conn.executemany(
+                "INSERT INTO {0} (id, label) VALUES (?, ?)".format(table),
+                [(i + 1, label) for i, label in enumerate(labels)]
+            )
+        conn.execute("INSERT INTO trials_typed ({0}) SELECT {1} FROM trials".format(
+            ", ".join(cols), ", ".join(select)
+        ))
+        conn.execute("DROP TABLE trials")
+        conn.execute("ALTER TABLE trials_typed RENAME TO trials")
+        for statement in _statements(POST_MIGRATION):
+            conn.execute(statement)
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        conn.close()
+        raise
+
+    conn.execute("VACUUM")
+    conn.close()
+    return True
+
+
+def _convert(col):
+    # SQL expression turning a text-layout column into its typed value
+    for coded, table in CODED_COLS:
+        if col == coded:
+            return "(SELECT id FROM {0} WHERE label = trials.{1})".format(table, col)
+    if col in BOOL_COLS:
+        return "(CASE {0} WHEN 'True' THEN 1 ELSE 0 END)".format(col)
+    return "CAST(NULLIF({0}, 'NA') AS REAL)".format(col)
+
+
+def _statements(sql):
+    # Splits a script into statements, dropping /* */ comments
+    while '/*' in sql:
+        start = sql.index('/*')
+        sql = sql[:start] + sql[sql.index('*/', start) + 2:]
+    return [s.strip() for s in sql.split(';') if s.strip()]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit("usage: python trials_schema.py <database>")
+
+    if migrate(sys.argv[1]):
+        print("Migrated trials table in {0} to the typed layout.".format(sys.argv[1]))
+        print("Note: 'klibs export' now writes integer codes for trial_type, far_near, choices, responses &\n"
+              "locations (see the *_codes tables); query the trials_labelled view, or use\n"
+              "columnar_export.py, for the labels.")
+    else:
+        print("{0} already uses the typed layout.".format(sys.argv[1]))